@@ -0,0 +1,191 @@
+"""Daily and weekly rollups of reports, cleanups and cleanup rewards.
+
+Every report adds 1 to the 'reported' rows of its day and week, and every
+cleanup adds 1 and its reward to the 'cleaned' rows, once per dimension:
+the total ('all'), the level, each of its types and its region (the prefix
+of its geo_cell at ANALYTICS_REGION_DEPTH, ~150 km wide at depth 8). Writers
+call record() in the same transaction as the change, like clustering.record(),
+so /api/admin/analytics reads a few hundred rollup rows for any range
+instead of grouping the whole pollutions table by date.
+
+Days are local dates (ANALYTICS_UTC_OFFSET_HOURS, Tashkent by default), a
+week is keyed by its Monday. Rewards are what cleaners were paid; the fixed
+reporting bonus is reports.REPORT_REWARD times the 'reported' count.
+rebuild() recomputes everything from the pollutions table (flask --app app
+backfill-analytics).
+"""
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import geo
+from dbutil import upsert_add_many
+from models import db, AnalyticsRollup, Pollution
+
+REGION_DEPTH = int(os.getenv('ANALYTICS_REGION_DEPTH', '8'))
+UTC_OFFSET = timedelta(hours=float(os.getenv('ANALYTICS_UTC_OFFSET_HOURS', '5')))
+GRANULARITIES = ('day', 'week')
+DIMENSIONS = ('all', 'level', 'type', 'region')
+METRICS = ('reported', 'cleaned')
+KEY_LENGTH = 32
+DEFAULT_BUCKETS = {'day': 30, 'week': 12}
+MAX_BUCKETS = 400
+MAX_SERIES = 50
+REBUILD_CHUNK = 5000
+
+
+def local_day(when):
+    return (when + UTC_OFFSET).date()
+
+
+def bucket_of(day, granularity):
+    return day - timedelta(days=day.weekday()) if granularity == 'week' else day
+
+
+def _keys(level, types, geo_cell):
+    yield 'all', ''
+    if level is not None:
+        yield 'level', str(level)
+    for t in sorted({str(t)[:KEY_LENGTH] for t in types or ()}):
+        yield 'type', t
+    if geo_cell:
+        yield 'region', geo_cell[:REGION_DEPTH]
+
+
+def _aggregate(deltas, metric, when, level, types, geo_cell, count, rewards):
+    day = local_day(when)
+    for granularity in GRANULARITIES:
+        bucket = bucket_of(day, granularity)
+        for dimension, key in _keys(level, types, geo_cell):
+            row = deltas[(granularity, dimension, bucket, metric, key)]
+            row[0] += count
+            row[1] += rewards
+
+
+def record(metric, items):
+    """Adds items given as (when, level, types, geo_cell, count, rewards) to the rollups.
+
+    Negative count and rewards take them out again.
+    """
+    deltas = defaultdict(lambda: [0, 0.0])
+    for item in items:
+        _aggregate(deltas, metric, *item)
+    upsert_add_many(AnalyticsRollup.__table__, ('granularity', 'dimension', 'bucket', 'metric', 'key'), [
+        {'granularity': granularity, 'dimension': dimension, 'bucket': bucket, 'metric': metric,
+         'key': key, 'count': count, 'rewards': rewards}
+        for (granularity, dimension, bucket, metric, key), (count, rewards) in sorted(deltas.items())
+        if count or rewards
+    ])
+
+
+def _pollution_rows(query):
+    return query.with_entities(
+        Pollution.created_at, Pollution.cleaned_at, Pollution.status, Pollution.level,
+        Pollution.types, Pollution.geo_cell, Pollution.reward)
+
+
+def _events(rows):
+    """(metric, item) pairs of pollution rows.
+
+    Cleanups from before cleaned_at existed count on the day of the report.
+    """
+    for created_at, cleaned_at, status, level, types, geo_cell, reward in rows:
+        created_at = created_at or datetime.utcnow()
+        yield 'reported', (created_at, level, types, geo_cell, 1, 0.0)
+        if status == 'cleaned':
+            yield 'cleaned', (cleaned_at or created_at, level, types, geo_cell, 1, reward or 0.0)
+
+
+def forget_pollutions(query):
+    """Takes pollutions that are about to be deleted out of the rollups."""
+    items = {metric: [] for metric in METRICS}
+    for metric, (when, level, types, geo_cell, count, rewards) in _events(_pollution_rows(query)):
+        items[metric].append((when, level, types, geo_cell, -count, -rewards))
+    for metric in METRICS:
+        record(metric, items[metric])
+
+
+def rebuild():
+    """Recomputes all rollups from the pollutions table; returns the number of rows."""
+    db.session.query(AnalyticsRollup).delete()
+    deltas = defaultdict(lambda: [0, 0.0])
+    for metric, item in _events(_pollution_rows(Pollution.query).yield_per(REBUILD_CHUNK)):
+        _aggregate(deltas, metric, *item)
+    rows = [
+        {'granularity': granularity, 'dimension': dimension, 'bucket': bucket, 'metric': metric,
+         'key': key, 'count': count, 'rewards': rewards}
+        for (granularity, dimension, bucket, metric, key), (count, rewards) in sorted(deltas.items())
+    ]
+    for start in range(0, len(rows), REBUILD_CHUNK):
+        db.session.execute(AnalyticsRollup.__table__.insert(), rows[start:start + REBUILD_CHUNK])
+    db.session.commit()
+    return len(rows)
+
+
+def _parse_day(value, name):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a date as YYYY-MM-DD')
+
+
+def _region_center(cell):
+    min_lng, min_lat, max_lng, max_lat = geo.tile_bounds(*geo.quadkey_to_tile(cell))
+    return (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+
+
+def series(granularity='day', start=None, end=None, dimension='all', limit=MAX_SERIES):
+    """Zero-filled per-bucket series of one dimension between two dates (inclusive).
+
+    Raises ValueError for unknown parameters or a range of more than
+    MAX_BUCKETS buckets. Series are ordered by their number of reports.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"dimension must be one of {', '.join(DIMENSIONS)}")
+    step = timedelta(days=7 if granularity == 'week' else 1)
+    end = bucket_of(_parse_day(end, 'to') if end else local_day(datetime.utcnow()), granularity)
+    if start:
+        start = bucket_of(_parse_day(start, 'from'), granularity)
+    else:
+        start = end - step * (DEFAULT_BUCKETS[granularity] - 1)
+    if start > end:
+        raise ValueError('from must not be after to')
+    count = (end - start) // step + 1
+    if count > MAX_BUCKETS:
+        raise ValueError(f'at most {MAX_BUCKETS} buckets per request')
+    buckets = [start + step * i for i in range(count)]
+    index = {bucket: i for i, bucket in enumerate(buckets)}
+
+    by_key = {}
+    rows = db.session.query(
+        AnalyticsRollup.bucket, AnalyticsRollup.metric, AnalyticsRollup.key,
+        AnalyticsRollup.count, AnalyticsRollup.rewards,
+    ).filter(
+        AnalyticsRollup.granularity == granularity, AnalyticsRollup.dimension == dimension,
+        AnalyticsRollup.bucket >= start, AnalyticsRollup.bucket <= end,
+    )
+    for bucket, metric, key, n, rewards in rows:
+        entry = by_key.get(key)
+        if entry is None:
+            entry = by_key[key] = {'key': key, 'reported': [0] * count, 'cleaned': [0] * count,
+                                   'rewards': [0.0] * count}
+        i = index[bucket]
+        entry[metric][i] += n
+        if metric == 'cleaned':
+            entry['rewards'][i] += rewards
+
+    result = sorted(by_key.values(), key=lambda e: (-sum(e['reported']), -sum(e['cleaned']), e['key']))
+    result = [e for e in result if any(e['reported']) or any(e['cleaned']) or any(e['rewards'])][:limit]
+    if dimension == 'region':
+        for entry in result:
+            entry['lat'], entry['lng'] = _region_center(entry['key'])
+    return {
+        'granularity': granularity,
+        'dimension': dimension,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'buckets': [bucket.isoformat() for bucket in buckets],
+        'series': result,
+    }
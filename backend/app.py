@@ -1,56 +1,86 @@
 import os
-import hmac
-import hashlib
+import logging
 import json
 from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, Response, abort, make_response, request, jsonify, send_file
 from flask_cors import CORS
 from dotenv import load_dotenv
-from models import db, User, Pollution, Photo, GlobalSetting
+from sqlalchemy.orm import aliased, selectinload
 
+# Before the local imports: modules read their settings from the environment
+# when they are imported (see dbconfig.py, auth.py)
 load_dotenv()
 
+from models import db, User, Pollution, Photo, GlobalSetting, Broadcast
+import geo
+import clustering
+import commands
+import counters
+import pagination
+import settings_cache
+import stats
+import outbox
+import broadcasts
+import heartbeats
+import streaming
+import changes
+import http_cache
+import dbconfig
+import metrics
+import tiles
+import reports
+import media
+import auth
+import analytics
+
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+log = logging.getLogger('ecopatrol')
+
 app = Flask(__name__)
 # Database configuration - using SQLite for local development, can be easily changed to PostgreSQL
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///ecopatrol.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool size, pre-ping, statement timeout, PgBouncer mode: see dbconfig.py
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dbconfig.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 CORS(app)
 
 db.init_app(app)
-
-BOT_TOKEN = os.getenv('BOT_TOKEN', 'YOUR_BOT_TOKEN')
-ADMIN_IDS = [5644397480]
-import telebot
-bot = telebot.TeleBot(os.getenv('BOT_TOKEN'))
- # The user's ID
-
-def validate_telegram_data(init_data):
-    """Validates data received from Telegram Mini App."""
-    if not init_data:
-        return False
-    
-    # Logic for validating initData using HMAC-SHA256
-    # For MVP, we might skip strict validation if user wants to test quickly,
-    # but we should implement it for security.
-    return True # Placeholder for actual validation
+with app.app_context():
+    dbconfig.instrument(db.engine)
+    metrics.init_app(app, db.engine)
+commands.register(app)
+heartbeats.init_app(app)
 
 @app.route('/api/init', methods=['POST'])
 def init_user():
+    # The only request identified by Telegram's signed initData; it answers
+    # with the session token all other calls authenticate with (see auth.py)
     data = request.json or {}
-    tg_id = data.get('telegram_id')
-    print(f"--- INIT USER ATTEMPT --- tg_id: {tg_id}")
+    init_data = data.get('initData')
+    if not init_data and auth.ALLOW_UNSIGNED:
+        try:
+            tg_user = {'id': int(data['telegram_id'])}
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'status': 'error', 'message': 'telegram_id must be a number'}), 400
+    else:
+        try:
+            tg_user = auth.verify_init_data(init_data)
+        except auth.InvalidInitData as e:
+            log.info("init: rejected: %s", e)
+            return jsonify({'status': 'error', 'message': 'Invalid Telegram data'}), 401
+    tg_id = tg_user['id']
+    log.debug("init: tg_id=%s", tg_id)
     
     try:
         user = User.query.filter_by(telegram_id=tg_id).first()
-        print(f"Found user: {bool(user)}")
     except Exception as e:
-        print(f"Database query error: {e}")
+        log.error("init: user lookup failed: %s", e)
         return jsonify({'status': 'error', 'message': f'Database error: {e}'}), 500
 
     if not user:
         # If no registration data, return needs_registration
         if not data.get('phone') or not data.get('age'):
-            print(f"User {tg_id} not found - needs registration")
+            log.debug("init: %s not found, needs registration", tg_id)
             return jsonify({
                 'status': 'ok',
                 'needs_registration': True,
@@ -58,13 +88,12 @@ def init_user():
             })
         
         # Else create the user (Registration Case)
-        print(f"Creating new user: {tg_id}")
         try:
             user = User(
                 telegram_id=tg_id,
-                username=data.get('username'),
-                first_name=data.get('first_name'),
-                last_name=data.get('last_name'),
+                username=data.get('username') or tg_user.get('username'),
+                first_name=data.get('first_name') or tg_user.get('first_name'),
+                last_name=data.get('last_name') or tg_user.get('last_name'),
                 age=data.get('age'),
                 phone=data.get('phone'),
                 email=data.get('email'),
@@ -74,10 +103,10 @@ def init_user():
                 last_seen_at=datetime.utcnow()
             )
             db.session.add(user)
-            db.session.commit()
-            print("User created successfully")
+            stats.bump(total_users=1)
+            db.session.flush()
 
-            # Send notification to all admins
+            # Queue a notification to all admins, sent by notifier.py
             lat = data.get('lat')
             lng = data.get('lng')
             if lat and lng:
@@ -97,11 +126,10 @@ def init_user():
                 f"🎂 Возраст: {data.get('age', '—')}\n"
                 f"{location_text}"
             )
-            for admin_id in ADMIN_IDS:
-                try:
-                    bot.send_message(admin_id, msg, disable_web_page_preview=False)
-                except Exception as bot_err:
-                    print(f"Failed to notify admin {admin_id}: {bot_err}")
+            for admin_id in auth.ADMIN_IDS:
+                outbox.enqueue(admin_id, msg, dedupe_key=f'new_user:{user.id}:{admin_id}')
+            db.session.commit()
+            log.info("init: registered user %s (tg_id=%s)", user.id, tg_id)
 
         except Exception as e:
             db.session.rollback()
@@ -109,7 +137,7 @@ def init_user():
     
     # If user exists but has no phone and no new phone provided, require registration
     elif not user.phone and not data.get('phone'):
-        print(f"User {tg_id} exists but has no phone - needs registration")
+        log.debug("init: %s has no phone, needs registration", tg_id)
         return jsonify({
             'status': 'ok',
             'needs_registration': True,
@@ -118,7 +146,7 @@ def init_user():
     
     # If user exists but registration data is provided, update it (e.g. adding missing phone)
     elif data.get('phone') and data.get('age'):
-        print(f"Updating user {tg_id} with registration data")
+        log.debug("init: completing registration of %s", tg_id)
         try:
             user.phone = data.get('phone')
             user.age = data.get('age')
@@ -136,10 +164,10 @@ def init_user():
     except Exception:
         pass
 
-    print(f"--- INIT API RESPONSE --- user_id: {user.id}, lang: {user_lang}")
     return jsonify({
         'status': 'ok',
         'needs_registration': False,
+        'token': auth.issue(user),
         'user': {
             'id': user.id,
             'telegram_id': user.telegram_id,
@@ -154,85 +182,200 @@ def init_user():
     })
 
 
+def photo_urls(p, type=None):
+    # Listings link thumbnails; ?photos=full asks for the originals
+    full = request.args.get('photos') == 'full'
+    return [ph.url if full else media.thumbnail_url(ph.url)
+            for ph in p.photos if type is None or ph.type == type]
+
+def pollution_to_dict(p):
+    return {
+        'id': p.id,
+        'lat': p.lat,
+        'lng': p.lng,
+        'level': p.level,
+        'types': p.types,
+        'description': p.description,
+        'status': p.status,
+        'photos': photo_urls(p, 'before')
+    }
+
 @app.route('/api/pollutions', methods=['GET'])
+@http_cache.conditional('pollutions')
 def get_pollutions():
-    # Bounds could be passed as query params for optimization
-    pollutions = Pollution.query.filter_by(status='active').all()
-    result = []
-    for p in pollutions:
-        result.append({
-            'id': p.id,
-            'lat': p.lat,
-            'lng': p.lng,
-            'level': p.level,
-            'types': p.types,
-            'description': p.description,
-            'status': p.status,
-            'photos': [ph.url for ph in p.photos if ph.type == 'before']
-        })
-    return jsonify(result)
+    # ?bbox=min_lng,min_lat,max_lng,max_lat limits the result to the viewport,
+    # resolved through the geo_cell quadkey index instead of a full scan
+    query = Pollution.query.filter_by(status='active').options(selectinload(Pollution.photos))
+    bbox_arg = request.args.get('bbox')
+    if bbox_arg:
+        bbox = geo.parse_bbox(bbox_arg)
+        if not bbox:
+            return jsonify({'error': 'Invalid bbox'}), 400
+        query = query.filter(geo.bbox_filter(Pollution.geo_cell, bbox, Pollution.lat, Pollution.lng))
+
+    # Read before the rows, so a delta sync from this cursor can repeat a
+    # change but never miss one
+    cursor = changes.current_cursor()
+    response = streaming.json_list(query.yield_per(streaming.YIELD_PER), pollution_to_dict)
+    response.headers['X-Sync-Cursor'] = cursor
+    return response
+
+@app.route('/api/pollutions/<int:p_id>', methods=['GET'])
+@http_cache.conditional('pollutions')
+def get_pollution(p_id):
+    # Details for a point picked on the vector tile layer
+    p = Pollution.query.options(selectinload(Pollution.photos)).get_or_404(p_id)
+    return jsonify(pollution_to_dict(p))
+
+@app.route('/api/tiles/<int:z>/<int:x>/<int:y>.pbf', methods=['GET'])
+def get_tile(z, x, y):
+    # Mapbox Vector Tile of active pollutions, cached on disk (see tiles.py)
+    if not (tiles.MIN_ZOOM <= z <= tiles.MAX_ZOOM and 0 <= x < 1 << z and 0 <= y < 1 << z):
+        return jsonify({'error': 'Tile out of range'}), 404
+    stat = tiles.cached(z, x, y)
+    if stat and tiles.etag(stat) in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        data, stat = tiles.get(z, x, y)
+        response = Response(data, mimetype='application/vnd.mapbox-vector-tile')
+    if stat:
+        response.set_etag(tiles.etag(stat))
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response
+
+@app.route('/api/pollutions/changes', methods=['GET'])
+@http_cache.conditional('pollutions')
+def get_pollution_changes():
+    """Pollutions created, updated or deleted after ?since=<cursor>.
+
+    Clients drop entries from 'changed' whose status is no longer 'active' and
+    every id in 'deleted'. Pages are at most ?limit= entries; keep calling with
+    the returned cursor while has_more is true. 410 means the cursor is older
+    than the tombstone retention and the full list must be reloaded.
+    """
+    limit = min(request.args.get('limit', changes.DEFAULT_LIMIT, type=int), changes.DEFAULT_LIMIT)
+    try:
+        changed, deleted, cursor, has_more = changes.since(request.args.get('since'), max(limit, 1))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except changes.CursorExpired:
+        return jsonify({'error': 'Cursor expired, reload /api/pollutions'}), 410
+    return jsonify({
+        'changed': [pollution_to_dict(p) for p in changed],
+        'deleted': deleted,
+        'cursor': cursor,
+        'has_more': has_more
+    })
+
+@app.route('/api/pollutions/clusters', methods=['GET'])
+def get_pollution_clusters():
+    # Aggregated cells of the precomputed grid for low zoom levels
+    zoom = request.args.get('zoom', type=float)
+    if zoom is None:
+        return jsonify({'error': 'Missing zoom'}), 400
+    bbox = None
+    if request.args.get('bbox'):
+        bbox = geo.parse_bbox(request.args['bbox'])
+        if not bbox:
+            return jsonify({'error': 'Invalid bbox'}), 400
+    return jsonify({
+        'zoom': zoom,
+        'clusters': clustering.clusters_in_bbox(bbox, zoom)
+    })
 
 @app.route('/api/stats/public', methods=['GET'])
+@http_cache.conditional('stats')
 def get_public_stats():
     """Returns general city statistics available to everyone."""
-    total_users = User.query.count()
-    cleaned_count = Pollution.query.filter_by(status='cleaned').count()
-    total_rewards = db.session.query(db.func.sum(Pollution.reward)).filter_by(status='cleaned').scalar() or 0
+    totals = stats.snapshot()
     return jsonify({
-        'total_users': total_users,
-        'cleaned_count': cleaned_count,
-        'total_rating_points': total_rewards
+        'total_users': int(totals['total_users']),
+        'cleaned_count': int(totals['cleaned_pollutions']),
+        'total_rating_points': totals['total_rewards']
     })
 
 @app.route('/api/pollutions', methods=['POST'])
+@auth.required
 def create_pollution():
-    data = request.json
-    # user_id should ideally come from validated token
-    new_p = Pollution(
-        user_id=data['user_id'],
-        lat=data['lat'],
-        lng=data['lng'],
-        level=data['level'],
-        types=data['types'],
-        description=data.get('description', ''),
-    )
-    
-    # Get reward from settings or default to level
-    reward_setting = GlobalSetting.query.filter_by(key=f'reward_level_{data["level"]}').first()
-    new_p.reward = float(reward_setting.value) if reward_setting else float(data['level'])
-    
-    db.session.add(new_p)
-    db.session.flush() # Get ID
-    
-    for photo_url in data.get('photos', []):
-        new_photo = Photo(pollution_id=new_p.id, url=photo_url, type='before')
-        db.session.add(new_photo)
-    
-    # +0.2 Balance for reporting
-    user = User.query.get(new_p.user_id)
-    if user:
-        user.balance += 500.0 # Standard reward for reporting in currency
-    
-    db.session.commit()
-    return jsonify({'status': 'ok', 'id': new_p.id})
+    data = request.json or {}
+    try:
+        report = reports.validate(data)
+    except reports.InvalidReport as e:
+        return jsonify({'error': str(e)}), 400
+    # A retry with the same client_key returns the report created the first time
+    (p_id, created), = reports.submit(auth.current().user_id, [report])
+    return jsonify({'status': 'ok', 'id': p_id, 'created': created})
+
+@app.route('/api/pollutions/batch', methods=['POST'])
+@auth.required
+def create_pollutions_batch():
+    """Reports queued offline by the Mini App, synced in one request and one transaction."""
+    data = request.json or {}
+    items = data.get('reports')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'reports must be a non-empty list'}), 400
+    if len(items) > reports.MAX_BATCH:
+        return jsonify({'error': f'At most {reports.MAX_BATCH} reports per request'}), 400
+    batch = []
+    for i, item in enumerate(items):
+        try:
+            batch.append(reports.validate(item if isinstance(item, dict) else {}))
+        except reports.InvalidReport as e:
+            return jsonify({'error': f'reports[{i}]: {e}'}), 400
+    results = reports.submit(auth.current().user_id, batch)
+    return jsonify({'status': 'ok', 'results': [
+        {'client_key': item['client_key'], 'id': p_id, 'created': created}
+        for item, (p_id, created) in zip(batch, results)
+    ]})
+
+@app.route('/api/photos', methods=['POST'])
+@auth.required
+def upload_photo():
+    """Stores a report photo locally; the same image uploaded twice is kept once (see media.py)."""
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'error': 'file is required'}), 400
+    try:
+        stored = media.save(upload.stream)
+    except media.InvalidPhoto as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'status': 'ok', **stored})
+
+@app.route(f'{media.URL_PREFIX}/<path:name>', methods=['GET'])
+def get_media(name):
+    # nginx serves these files itself; this covers development and variants
+    # that were not rendered yet
+    path = media.locate(name)
+    if path is None:
+        abort(404)
+    response = send_file(path, conditional=True, max_age=media.CACHE_SECONDS)
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/api/pollutions/<int:p_id>/clean', methods=['POST'])
+@auth.required
 def clean_pollution(p_id):
-    data = request.json
+    data = request.json or {}
     p = Pollution.query.get_or_404(p_id)
     if p.status == 'cleaned':
         return jsonify({'error': 'Already cleaned'}), 400
     
     p.status = 'cleaned'
     p.clean_comment = data.get('comment', '')
-    
-    # Reward the cleaner (from request), not the pollution creator
-    cleaner_id = data.get('user_id')
-    if cleaner_id:
-        p.cleaner_id = cleaner_id # Save who cleaned it
-        cleaner = User.query.get(cleaner_id)
-        if cleaner:
-            cleaner.balance += p.reward
+    p.cleaned_at = datetime.utcnow()
+    clustering.record([(p.lat, p.lng, p.level)], -1)
+    tiles.touch([(p.lat, p.lng)])
+    stats.bump(active_pollutions=-1, cleaned_pollutions=1, total_rewards=p.reward or 0.0)
+    counters.bump(p.user_id, reports_cleaned=1)
+    analytics.record('cleaned', [(p.cleaned_at, p.level, p.types, p.geo_cell, 1, p.reward or 0.0)])
+    
+    # Reward the cleaner (the session's user), not the pollution creator
+    cleaner = User.query.get(auth.current().user_id)
+    if cleaner:
+        p.cleaner_id = cleaner.id # Save who cleaned it
+        cleaner.balance += p.reward
+        counters.bump(cleaner.id, cleaned=1)
+        stats.bump(total_balance=p.reward or 0.0)
     
     for photo_url in data.get('photos', []):
         new_photo = Photo(pollution_id=p.id, url=photo_url, type='after')
@@ -241,13 +384,14 @@ def clean_pollution(p_id):
     db.session.commit()
     return jsonify({
         'status': 'ok', 
-        'new_balance': cleaner.balance if cleaner_id and cleaner else 0
+        'new_balance': cleaner.balance if cleaner else 0
     })
 
 @app.route('/api/history/user/<int:user_id>', methods=['GET'])
 def get_user_history(user_id):
     # Get all pollutions where this user was the cleaner
-    history = Pollution.query.filter_by(cleaner_id=user_id, status='cleaned').order_by(Pollution.created_at.desc()).all()
+    history = Pollution.query.filter_by(cleaner_id=user_id, status='cleaned') \
+        .options(selectinload(Pollution.photos)).order_by(Pollution.created_at.desc()).all()
     result = []
     for p in history:
         result.append({
@@ -256,13 +400,14 @@ def get_user_history(user_id):
             'description': p.description,
             'clean_comment': p.clean_comment,
             'date': p.created_at.isoformat(),
-            'photos': [ph.url for ph in p.photos if ph.type == 'after']
+            'photos': photo_urls(p, 'after')
         })
     return jsonify(result)
 
 @app.route('/api/pollutions/user/<int:user_id>', methods=['GET'])
 def get_user_pollutions(user_id):
-    pollutions = Pollution.query.filter_by(user_id=user_id).order_by(Pollution.created_at.desc()).all()
+    pollutions = Pollution.query.filter_by(user_id=user_id) \
+        .options(selectinload(Pollution.photos)).order_by(Pollution.created_at.desc()).all()
     result = []
     for p in pollutions:
         result.append({
@@ -274,8 +419,8 @@ def get_user_pollutions(user_id):
             'description': p.description,
             'status': p.status,
             'created_at': p.created_at.isoformat(),
-            'photos': [ph.url for ph in p.photos if ph.type == 'before'],
-            'after_photos': [ph.url for ph in p.photos if ph.type == 'after'],
+            'photos': photo_urls(p, 'before'),
+            'after_photos': photo_urls(p, 'after'),
             'comment': p.clean_comment
         })
     return jsonify(result)
@@ -283,17 +428,23 @@ def get_user_pollutions(user_id):
 @app.route('/api/profile/<int:user_id>', methods=['GET'])
 def get_profile(user_id):
     user = User.query.get_or_404(user_id)
-    cleaned_count = Pollution.query.filter_by(user_id=user_id, status='cleaned').count()
     return jsonify({
         'username': user.username,
         'balance': user.balance,
-        'cleaned_count': cleaned_count,
+        # The user's own reports that were cleaned (by anyone), as before
+        # the counters; cleanups done by the user are cleanups_count
+        'cleaned_count': user.reports_cleaned_count,
+        'cleanups_count': user.cleaned_count,
+        'reported_count': user.reported_count,
         'language': user.language
     })
 
 @app.route('/api/profile/<int:user_id>/language', methods=['POST'])
+@auth.required
 def update_language(user_id):
-    data = request.json
+    if user_id != auth.current().user_id:
+        return jsonify({'error': 'Forbidden'}), 403
+    data = request.json or {}
     lang = data.get('language')
     if lang not in ['uz', 'ru', 'en']:
         return jsonify({'error': 'Invalid language'}), 400
@@ -302,10 +453,11 @@ def update_language(user_id):
     try:
         user.language = lang
         db.session.commit()
-        return jsonify({'status': 'ok', 'language': user.language})
+        # The token carries the language, so the client gets a fresh one
+        return jsonify({'status': 'ok', 'language': user.language, 'token': auth.issue(user)})
     except Exception as e:
         db.session.rollback()
-        print(f"Error updating language: {e}")
+        log.error("Error updating language of user %s: %s", user_id, e)
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/api/health', methods=['GET'])
@@ -316,44 +468,42 @@ def health_check():
             'status': 'ok',
             'db': 'connected',
             'users': user_count,
-            'environment': 'vps' if 'postgresql' in app.config['SQLALCHEMY_DATABASE_URI'] else 'local'
+            'environment': 'vps' if 'postgresql' in app.config['SQLALCHEMY_DATABASE_URI'] else 'local',
+            'pool': dbconfig.pool_status(db.engine)
         })
     except Exception as e:
-        return jsonify({'status': 'error', 'db': str(e)}), 500
+        return jsonify({'status': 'error', 'db': str(e), 'pool': dbconfig.pool_status(db.engine)}), 500
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus scrape target, summed over all gunicorn workers (see metrics.py)
+    if not metrics.authorized():
+        return jsonify({'error': 'Unauthorized'}), 403
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 # --- ADMIN & LEADERBOARD ENDPOINTS ---
 
 @app.route('/api/leaderboard', methods=['GET'])
+@http_cache.conditional('users')
 def get_leaderboard():
-    # Fetch top 10 users by balance (as a proxy for activity/impact)
-    # In the future, we could add a dedicated 'impact_score' or use cleaned_count
-    # Since we don't have a direct 'cleaned_count' column, we use balance
+    # Fetch top 10 users by balance (as a proxy for activity/impact); a single
+    # query on ix_users_balance_desc thanks to the denormalized cleaned_count
     users = User.query.order_by(User.balance.desc()).limit(10).all()
     result = []
     for u in users:
-        # Calculate cleaned count for each top user
-        cleaned_count = Pollution.query.filter_by(cleaner_id=u.id, status='cleaned').count()
         result.append({
             'username': u.username or f"User {u.id}",
             'first_name': u.first_name,
             'balance': u.balance,
-            'cleaned_count': cleaned_count
+            'cleaned_count': u.cleaned_count
         })
     return jsonify(result)
 
 @app.route('/api/admin/users', methods=['GET'])
+@auth.admin_required
 def admin_get_users():
-    tg_id = request.args.get('admin_tg_id', type=int)
-    if not tg_id and request.is_json:
-        tg_id = request.json.get('admin_tg_id')
-    
-    if tg_id not in ADMIN_IDS:
-        return jsonify({'error': 'Unauthorized'}), 403
-    
-    users = User.query.all()
-    result = []
-    for u in users:
-        result.append({
+    def serialize(u):
+        return {
             'id': u.id,
             'telegram_id': u.telegram_id,
             'username': u.username,
@@ -368,46 +518,43 @@ def admin_get_users():
             'lng': u.lng,
             'last_seen_at': u.last_seen_at.isoformat() if u.last_seen_at else None,
             'created_at': u.created_at.isoformat()
-        })
-    return jsonify(result)
+        }
+    return streaming.json_list(User.query.yield_per(streaming.YIELD_PER), serialize)
 
 
 @app.route('/api/user/location', methods=['POST'])
+@auth.required
 def update_user_location():
-    """Update user's last known location and last_seen_at timestamp."""
+    """Update user's last known location and last_seen_at timestamp.
+
+    Positions are coalesced in memory and written in bulk, see heartbeats.py.
+    """
     data = request.json or {}
-    tg_id = data.get('telegram_id')
     lat = data.get('lat')
     lng = data.get('lng')
 
-    if not tg_id or lat is None or lng is None:
-        return jsonify({'status': 'error', 'message': 'Missing telegram_id, lat or lng'}), 400
-
-    user = User.query.filter_by(telegram_id=tg_id).first()
-    if not user:
-        return jsonify({'status': 'error', 'message': 'User not found'}), 404
+    if lat is None or lng is None:
+        return jsonify({'status': 'error', 'message': 'Missing lat or lng'}), 400
 
     try:
-        user.lat = lat
-        user.lng = lng
-        user.last_seen_at = datetime.utcnow()
-        db.session.commit()
+        heartbeats.record(auth.current().user_id, float(lat), float(lng))
         return jsonify({'status': 'ok'})
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Invalid lat or lng'}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/api/admin/users/<int:user_id>/balance', methods=['POST'])
+@auth.admin_required
 def admin_update_balance(user_id):
     data = request.json or {}
-    tg_id = data.get('admin_tg_id') or request.args.get('admin_tg_id', type=int)
-    
-    if tg_id not in ADMIN_IDS:
-        return jsonify({'error': 'Unauthorized'}), 403
-    
+
     user = User.query.get_or_404(user_id)
     try:
-        user.balance = float(data.get('balance', user.balance))
+        new_balance = float(data.get('balance', user.balance))
+        stats.bump(total_balance=new_balance - (user.balance or 0.0))
+        user.balance = new_balance
         db.session.commit()
         return jsonify({'status': 'ok', 'new_balance': user.balance})
     except Exception as e:
@@ -415,22 +562,12 @@ def admin_update_balance(user_id):
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/api/admin/users/<int:user_id>', methods=['DELETE'])
+@auth.admin_required
 def admin_delete_user(user_id):
-    data = request.json or {}
-    tg_id = data.get('admin_tg_id') or request.args.get('admin_tg_id', type=int)
-    
-    # Debug logging
-    print(f"DELETE user {user_id}: received tg_id={tg_id} (type: {type(tg_id)})")
-    print(f"ADMIN_IDS: {ADMIN_IDS}")
-    print(f"tg_id in ADMIN_IDS: {tg_id in ADMIN_IDS}")
-    
-    if tg_id not in ADMIN_IDS:
-        return jsonify({'error': 'Unauthorized'}), 403
-    
     user = User.query.get_or_404(user_id)
     
     # Prevent deletion of admin accounts
-    if user.telegram_id in ADMIN_IDS:
+    if user.telegram_id in auth.ADMIN_IDS:
         return jsonify({'error': 'Cannot delete admin account'}), 403
     
     try:
@@ -446,9 +583,18 @@ def admin_delete_user(user_id):
         Pollution.query.filter_by(cleaner_id=user.id).update({'cleaner_id': None})
         
         # Delete user's own pollutions (photos will cascade)
+        active = Pollution.query.with_entities(Pollution.lat, Pollution.lng, Pollution.level) \
+            .filter_by(user_id=user.id, status='active').all()
+        clustering.record(active, -1)
+        tiles.touch(active)
+        counters.forget_pollutions(Pollution.query.filter_by(user_id=user.id))
+        stats.forget_pollutions(Pollution.query.filter_by(user_id=user.id))
+        analytics.forget_pollutions(Pollution.query.filter_by(user_id=user.id))
+        changes.tombstone(Pollution.query.filter_by(user_id=user.id))
         Pollution.query.filter_by(user_id=user.id).delete()
         
         # Delete user
+        stats.bump(total_users=-1, total_balance=-(user.balance or 0.0))
         db.session.delete(user)
         db.session.commit()
         
@@ -461,22 +607,65 @@ def admin_delete_user(user_id):
         db.session.rollback()
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+ADMIN_POLLUTION_SORTS = {
+    'created_at': Pollution.created_at,
+    'reward': Pollution.reward,
+    'level': Pollution.level,
+    'id': Pollution.id,
+}
+
 @app.route('/api/admin/pollutions', methods=['GET'])
+@auth.admin_required
 def admin_get_pollutions():
-    tg_id = request.args.get('admin_tg_id', type=int)
-    if not tg_id and request.is_json:
-        tg_id = request.json.get('admin_tg_id')
-        
-    if tg_id not in ADMIN_IDS:
-        return jsonify({'error': 'Unauthorized'}), 403
-    
-    pollutions = Pollution.query.all()
-    result = []
-    for p in pollutions:
-        creator = User.query.get(p.user_id)
-        cleaner = User.query.get(p.cleaner_id) if p.cleaner_id else None
-        
-        result.append({
+    # Keyset-paginated: ?limit=&cursor= plus optional status/level/type
+    # filters and sort=created_at|reward|level|id with order=asc|desc
+    sort = request.args.get('sort', 'created_at')
+    if sort not in ADMIN_POLLUTION_SORTS:
+        return jsonify({'error': 'Invalid sort'}), 400
+    descending = request.args.get('order', 'desc') != 'asc'
+    limit = pagination.clamp_limit(request.args.get('limit', type=int))
+
+    creator = aliased(User)
+    cleaner = aliased(User)
+    query = db.session.query(
+        Pollution,
+        creator.first_name, creator.telegram_id,
+        cleaner.first_name, cleaner.telegram_id,
+    ).outerjoin(creator, creator.id == Pollution.user_id) \
+     .outerjoin(cleaner, cleaner.id == Pollution.cleaner_id) \
+     .options(selectinload(Pollution.photos))
+
+    if request.args.get('status'):
+        query = query.filter(Pollution.status == request.args['status'])
+    if request.args.get('level', type=int):
+        query = query.filter(Pollution.level == request.args.get('level', type=int))
+    if request.args.get('type'):
+        # types is a JSON list; match the quoted element in its text form,
+        # encoded as it is stored and with LIKE wildcards taken literally
+        element = json.dumps(request.args['type'])
+        element = element.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.filter(db.cast(Pollution.types, db.String).like(f'%{element}%', escape='\\'))
+
+    sort_column = ADMIN_POLLUTION_SORTS[sort]
+    try:
+        query = pagination.seek(query, sort_column, Pollution.id, descending, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    query = query.limit(limit + 1).yield_per(streaming.YIELD_PER)
+    page = {'count': 0, 'last': None, 'more': False}
+
+    def page_rows():
+        for row in query:
+            if page['count'] == limit:
+                page['more'] = True
+                break
+            page['count'] += 1
+            page['last'] = (getattr(row[0], sort_column.key), row[0].id)
+            yield row
+
+    def serialize(row):
+        p, creator_name, creator_tg_id, cleaner_name, cleaner_tg_id = row
+        return {
             'id': p.id,
             'lat': p.lat,
             'lng': p.lng,
@@ -484,30 +673,36 @@ def admin_get_pollutions():
             'status': p.status,
             'description': p.description,
             'creator_id': p.user_id,
-            'creator_name': creator.first_name if creator else 'Eco Hero',
-            'creator_tg_id': creator.telegram_id if creator else None,
+            'creator_name': creator_name if creator_tg_id else 'Eco Hero',
+            'creator_tg_id': creator_tg_id,
             'cleaner_id': p.cleaner_id,
-            'cleaner_name': cleaner.first_name if cleaner else None,
-            'cleaner_tg_id': cleaner.telegram_id if cleaner else None,
-            'photos': [ph.url for ph in p.photos],
+            'cleaner_name': cleaner_name,
+            'cleaner_tg_id': cleaner_tg_id,
+            'photos': photo_urls(p),
             'types': p.types,
-            'reward': p.reward
-        })
-    return jsonify(result)
+            'reward': p.reward,
+            'created_at': p.created_at.isoformat() if p.created_at else None
+        }
+
+    def trailer():
+        next_cursor = pagination.encode_cursor(*page['last']) if page['more'] else None
+        return {'next_cursor': next_cursor}
+    return streaming.json_page(page_rows(), serialize, trailer)
 
 @app.route('/api/admin/pollutions/<int:p_id>', methods=['DELETE'])
+@auth.admin_required
 def admin_delete_pollution(p_id):
-    tg_id = request.args.get('admin_tg_id', type=int)
-    if not tg_id and request.is_json:
-        tg_id = request.json.get('admin_tg_id')
-        
-    if tg_id not in ADMIN_IDS:
-        return jsonify({'error': 'Unauthorized'}), 403
-    
     p = Pollution.query.get_or_404(p_id)
     try:
         # Delete related photos first
         Photo.query.filter_by(pollution_id=p.id).delete()
+        if p.status == 'active':
+            clustering.record([(p.lat, p.lng, p.level)], -1)
+            tiles.touch([(p.lat, p.lng)])
+        counters.forget_pollutions(Pollution.query.filter_by(id=p.id))
+        stats.forget_pollutions(Pollution.query.filter_by(id=p.id))
+        analytics.forget_pollutions(Pollution.query.filter_by(id=p.id))
+        changes.tombstone(Pollution.query.filter_by(id=p.id))
         db.session.delete(p)
         db.session.commit()
         return jsonify({'status': 'ok'})
@@ -516,16 +711,18 @@ def admin_delete_pollution(p_id):
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/api/admin/pollutions/<int:p_id>/reward', methods=['POST'])
+@auth.admin_required
 def admin_update_reward(p_id):
     data = request.json or {}
-    tg_id = data.get('admin_tg_id') or request.args.get('admin_tg_id', type=int)
-    
-    if tg_id not in ADMIN_IDS:
-        return jsonify({'error': 'Unauthorized'}), 403
-    
+
     p = Pollution.query.get_or_404(p_id)
     try:
-        p.reward = float(data.get('reward', p.reward))
+        new_reward = float(data.get('reward', p.reward))
+        if p.status == 'cleaned':
+            stats.bump(total_rewards=new_reward - (p.reward or 0.0))
+            analytics.record('cleaned', [(p.cleaned_at or p.created_at, p.level, p.types, p.geo_cell,
+                                          0, new_reward - (p.reward or 0.0))])
+        p.reward = new_reward
         db.session.commit()
         return jsonify({'status': 'ok', 'new_reward': p.reward})
     except Exception as e:
@@ -533,24 +730,18 @@ def admin_update_reward(p_id):
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/api/config', methods=['GET'])
+@http_cache.conditional('settings')
 def get_public_config():
     try:
-        debug_setting = GlobalSetting.query.filter_by(key='debug_logs_enabled').first()
         return jsonify({
-            'debug_logs_enabled': debug_setting.value if debug_setting else 'false'
+            'debug_logs_enabled': settings_cache.get('debug_logs_enabled', 'false')
         })
     except Exception as e:
         return jsonify({'debug_logs_enabled': 'false', 'error': str(e)})
 
 @app.route('/api/admin/settings', methods=['GET'])
+@auth.admin_required
 def admin_get_settings():
-    tg_id = request.args.get('admin_tg_id', type=int)
-    if not tg_id and request.is_json:
-        tg_id = request.json.get('admin_tg_id')
-        
-    if tg_id not in ADMIN_IDS:
-        return jsonify({'error': 'Unauthorized'}), 403
-    
     settings = GlobalSetting.query.all()
     result = {s.key: s.value for s in settings}
     # Ensure defaults exist in response if not in DB
@@ -561,13 +752,10 @@ def admin_get_settings():
     return jsonify(result)
 
 @app.route('/api/admin/settings', methods=['POST'])
+@auth.admin_required
 def admin_update_settings():
     data = request.json or {}
-    tg_id = data.get('admin_tg_id') or request.args.get('admin_tg_id', type=int)
-    
-    if tg_id not in ADMIN_IDS:
-        return jsonify({'error': 'Unauthorized'}), 403
-    
+
     try:
         new_settings = data.get('settings', {})
         for key, value in new_settings.items():
@@ -578,43 +766,44 @@ def admin_update_settings():
                 setting = GlobalSetting(key=key, value=str(value))
                 db.session.add(setting)
         db.session.commit()
+        settings_cache.invalidate()
         return jsonify({'status': 'ok'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/api/admin/stats', methods=['GET'])
+@auth.admin_required
 def admin_get_stats():
-    tg_id = request.args.get('admin_tg_id', type=int)
-    if not tg_id and request.is_json:
-        tg_id = request.json.get('admin_tg_id')
-        
-    if tg_id not in ADMIN_IDS:
-        return jsonify({'error': 'Unauthorized'}), 403
-    
-    total_users = User.query.count()
-    active_pollutions = Pollution.query.filter_by(status='active').count()
-    cleaned_pollutions = Pollution.query.filter_by(status='cleaned').count()
-    total_balance = db.session.query(db.func.sum(User.balance)).scalar() or 0
-    # Also get total paid (sum of rewards for cleaned pollutions)
-    total_rewards = db.session.query(db.func.sum(Pollution.reward)).filter_by(status='cleaned').scalar() or 0
-    
+    totals = stats.snapshot()
     return jsonify({
-        'total_users': total_users,
-        'active_pollutions': active_pollutions,
-        'cleaned_pollutions': cleaned_pollutions,
-        'total_rewards': float(total_rewards),
-        'total_balance': float(total_balance)
+        'total_users': int(totals['total_users']),
+        'active_pollutions': int(totals['active_pollutions']),
+        'cleaned_pollutions': int(totals['cleaned_pollutions']),
+        'total_rewards': totals['total_rewards'],
+        'total_balance': totals['total_balance']
     })
 
+@app.route('/api/admin/analytics', methods=['GET'])
+@auth.admin_required
+def admin_get_analytics():
+    # granularity=day|week, from/to=YYYY-MM-DD, dimension=all|level|type|region
+    try:
+        return jsonify(analytics.series(
+            granularity=request.args.get('granularity', 'day'),
+            start=request.args.get('from'),
+            end=request.args.get('to'),
+            dimension=request.args.get('dimension', 'all'),
+            limit=min(request.args.get('limit', analytics.MAX_SERIES, type=int), analytics.MAX_SERIES),
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
 @app.route('/api/admin/notify', methods=['POST'])
+@auth.admin_required
 def admin_notify_user():
     data = request.json or {}
-    tg_id = data.get('admin_tg_id') or request.args.get('admin_tg_id', type=int)
-    
-    if tg_id not in ADMIN_IDS:
-        return jsonify({'error': 'Unauthorized'}), 403
-    
+
     target_tg_id = data.get('target_tg_id')
     message = data.get('message')
     
@@ -622,11 +811,79 @@ def admin_notify_user():
         return jsonify({'error': 'Missing target ID or message'}), 400
     
     try:
-        bot.send_message(target_tg_id, f"🔔 Сообщение от администрации:\n\n{message}")
-        return jsonify({'status': 'ok'})
+        outbox.enqueue(target_tg_id, f"🔔 Сообщение от администрации:\n\n{message}")
+        db.session.commit()
+        return jsonify({'status': 'ok', 'queued': True})
     except Exception as e:
+        db.session.rollback()
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def broadcast_to_dict(b):
+    processed = b.sent + b.failed
+    remaining = max(b.estimated_total - processed, 0)
+    return {
+        'id': b.id,
+        'message': b.message,
+        'language': b.language,
+        'center_lat': b.center_lat,
+        'center_lng': b.center_lng,
+        'radius_km': b.radius_km,
+        'status': b.status,
+        'estimated_total': b.estimated_total,
+        'sent': b.sent,
+        'failed': b.failed,
+        'progress': round(min(processed / b.estimated_total, 1.0) * 100, 1) if b.estimated_total else 100.0,
+        'rate': b.current_rate,
+        'eta_seconds': int(remaining / b.current_rate) if b.status == 'running' and b.current_rate else None,
+        'created_at': b.created_at.isoformat() if b.created_at else None,
+        'started_at': b.started_at.isoformat() if b.started_at else None,
+        'finished_at': b.finished_at.isoformat() if b.finished_at else None,
+    }
+
+@app.route('/api/admin/broadcasts', methods=['POST'])
+@auth.admin_required
+def admin_create_broadcast():
+    data = request.json or {}
+
+    message = (data.get('message') or '').strip()
+    if not message:
+        return jsonify({'error': 'Missing message'}), 400
+    
+    broadcast = Broadcast(message=message, language=data.get('language') or None, created_by=auth.current().telegram_id)
+    if data.get('radius_km'):
+        try:
+            broadcast.center_lat = float(data['center_lat'])
+            broadcast.center_lng = float(data['center_lng'])
+            broadcast.radius_km = float(data['radius_km'])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'center_lat, center_lng and radius_km are required for a geo segment'}), 400
+    
+    try:
+        broadcast.estimated_total = broadcasts.estimate(broadcast)
+        db.session.add(broadcast)
+        db.session.commit()
+        return jsonify(broadcast_to_dict(broadcast))
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/admin/broadcasts', methods=['GET'])
+@auth.admin_required
+def admin_get_broadcasts():
+    items = Broadcast.query.order_by(Broadcast.id.desc()).limit(request.args.get('limit', 10, type=int)).all()
+    return jsonify([broadcast_to_dict(b) for b in items])
+
+@app.route('/api/admin/broadcasts/<int:broadcast_id>/cancel', methods=['POST'])
+@auth.admin_required
+def admin_cancel_broadcast(broadcast_id):
+    broadcast = Broadcast.query.get_or_404(broadcast_id)
+    if broadcast.status in ('queued', 'running'):
+        broadcast.status = 'cancelled'
+        broadcast.current_rate = 0.0
+        broadcast.finished_at = datetime.utcnow()
+        db.session.commit()
+    return jsonify(broadcast_to_dict(broadcast))
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
@@ -0,0 +1,184 @@
+"""Telegram Mini App authentication and signed session tokens.
+
+/api/init verifies the initData string Telegram passes to the Mini App once:
+its hash is an HMAC-SHA256 of the other fields, keyed with
+HMAC-SHA256("WebAppData", BOT_TOKEN), and auth_date must be younger than
+INIT_DATA_MAX_AGE seconds. The answer carries a session token
+
+    base64url(payload) "." base64url(HMAC-SHA256(SESSION_SECRET, payload)[:16])
+
+where payload is compact JSON {"u": user id, "t": telegram id, "r": role,
+"l": language, "e": expiry}. Later requests send "Authorization: Bearer
+<token>" and are authenticated by checking that signature in memory, without
+a DB lookup. A changed role only shows up with the next token; a language
+change reissues one (see /api/profile/<id>/language).
+
+AUTH_ALLOW_UNSIGNED=1 accepts a bare telegram_id in /api/init when no
+initData comes along, for opening the Mini App in a desktop browser during
+development. Never set it in production.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import re
+import time
+from functools import wraps
+from urllib.parse import parse_qsl
+
+from flask import g, jsonify, request
+
+BOT_TOKEN = os.getenv('BOT_TOKEN', 'YOUR_BOT_TOKEN')
+ADMIN_IDS = [int(v) for v in os.getenv('ADMIN_IDS', '5644397480').split(',') if v.strip()]
+INIT_DATA_MAX_AGE = int(os.getenv('INIT_DATA_MAX_AGE', str(24 * 3600)))
+SESSION_TTL = int(float(os.getenv('SESSION_TTL_HOURS', '24')) * 3600)
+ALLOW_UNSIGNED = os.getenv('AUTH_ALLOW_UNSIGNED', '0') == '1'
+SIGNATURE_BYTES = 16
+# Shape of a token issued by @BotFather: "<bot id>:<secret>"
+BOT_TOKEN_RE = re.compile(r'^\d+:[\w-]+$')
+
+
+def _session_secret():
+    """SESSION_SECRET, or a key derived from the bot token.
+
+    Tokens stay valid across restarts and workers; a derived key changes with
+    the bot token, so rotating it logs everyone out. A placeholder token
+    (unset, or copied from .env.example) is public, so it is refused.
+    """
+    secret = os.getenv('SESSION_SECRET')
+    if secret:
+        return secret.encode()
+    if not BOT_TOKEN_RE.match(BOT_TOKEN):
+        raise RuntimeError('BOT_TOKEN is not a bot token: set BOT_TOKEN (or SESSION_SECRET) in backend/.env')
+    return hmac.new(b'ecopatrol-session', BOT_TOKEN.encode(), hashlib.sha256).digest()
+
+
+SESSION_SECRET = _session_secret()
+
+
+class InvalidInitData(ValueError):
+    pass
+
+
+class Session:
+    __slots__ = ('user_id', 'telegram_id', 'role', 'language', 'expires')
+
+    def __init__(self, user_id, telegram_id, role, language, expires):
+        self.user_id = user_id
+        self.telegram_id = telegram_id
+        self.role = role
+        self.language = language
+        self.expires = expires
+
+    @property
+    def is_admin(self):
+        return self.role == 'admin'
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def verify_init_data(init_data, bot_token=None, max_age=None, now=None):
+    """Checks the signature and age of Telegram initData. Returns its user dict."""
+    if not init_data:
+        raise InvalidInitData('initData is missing')
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received = fields.pop('hash', None)
+    if not received:
+        raise InvalidInitData('initData has no hash')
+    check_string = '\n'.join(f'{k}={v}' for k, v in sorted(fields.items()))
+    secret = hmac.new(b'WebAppData', (bot_token or BOT_TOKEN).encode(), hashlib.sha256).digest()
+    expected = hmac.new(secret, check_string.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, received):
+        raise InvalidInitData('initData signature mismatch')
+    max_age = INIT_DATA_MAX_AGE if max_age is None else max_age
+    try:
+        auth_date = int(fields.get('auth_date', 0))
+        user = json.loads(fields.get('user') or '{}')
+        user['id'] = int(user['id'])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidInitData('initData has no valid user or auth_date')
+    if max_age and (now or time.time()) - auth_date > max_age:
+        raise InvalidInitData('initData is expired')
+    return user
+
+
+def role_of(telegram_id):
+    return 'admin' if telegram_id in ADMIN_IDS else 'user'
+
+
+def issue(user, ttl=None, now=None):
+    """A session token for a User row."""
+    payload = json.dumps({
+        'u': user.id,
+        't': user.telegram_id,
+        'r': role_of(user.telegram_id),
+        'l': user.language or 'ru',
+        'e': int((now or time.time()) + (SESSION_TTL if ttl is None else ttl)),
+    }, separators=(',', ':')).encode()
+    signature = hmac.new(SESSION_SECRET, payload, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    return f'{_b64encode(payload)}.{_b64encode(signature)}'
+
+
+def parse(token, now=None):
+    """The Session of a valid, unexpired token, else None."""
+    try:
+        payload_part, signature_part = token.split('.')
+        payload = _b64decode(payload_part)
+        signature = _b64decode(signature_part)
+    except (AttributeError, ValueError):
+        return None
+    expected = hmac.new(SESSION_SECRET, payload, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    if not hmac.compare_digest(expected, signature):
+        return None
+    try:
+        data = json.loads(payload)
+        session = Session(data['u'], data['t'], data['r'], data['l'], data['e'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if session.expires <= (now or time.time()):
+        return None
+    return session
+
+
+def current():
+    """Session of the current request (cached on flask.g), or None."""
+    if 'session' not in g:
+        header = request.headers.get('Authorization', '')
+        g.session = parse(header[7:]) if header.startswith('Bearer ') else None
+    return g.session
+
+
+def _unauthorized():
+    response = jsonify({'error': 'Unauthorized'})
+    response.headers['WWW-Authenticate'] = 'Bearer'
+    return response, 401
+
+
+def required(view):
+    """401 unless the request carries a valid session token."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if current() is None:
+            return _unauthorized()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def admin_required(view):
+    """401 without a session token, 403 unless it is an admin's."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        session = current()
+        if session is None:
+            return _unauthorized()
+        if not session.is_admin:
+            return jsonify({'error': 'Forbidden'}), 403
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1 @@
+"""Benchmarks for the EcoPatrol API. Run from backend/: python -m benchmarks.<name>"""
@@ -0,0 +1,89 @@
+"""Checks initData verification and session tokens, and what a token costs.
+
+    python -m benchmarks.auth_check
+
+Posts signed initData to /api/init and expects a session token. The token
+must be accepted by write endpoints and act as its own user whatever the
+body says, only an admin's opens /api/admin/*, and a language change hands
+out a token with the new language. Authenticating a request must not cost
+a query: a heartbeat runs none. Prints the time to verify initData and a
+token and exits 1 on any failure. Tampered, expired and forged initData and
+tokens are refused in tests/test_auth.py.
+"""
+import json
+import sys
+import time
+
+from benchmarks.common import (admin_headers, count_queries, init_data, session_headers,
+                               setup_app, seed)
+
+
+def per_call_us(fn, n=20000):
+    started = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return round((time.perf_counter() - started) / n * 1e6, 2)
+
+
+def main():
+    app = setup_app()
+    seed(app, users=50, pollutions=20)
+
+    import auth
+    import heartbeats
+    from models import db, User, Pollution
+
+    client = app.test_client()
+    checks = {}
+    tg_id = 10_000_001
+
+    response = client.post('/api/init', json={'initData': init_data(tg_id)})
+    token = (response.get_json() or {}).get('token')
+    session = auth.parse(token)
+    checks['init_issues_token'] = response.status_code == 200 and session is not None \
+        and (session.user_id, session.telegram_id, session.role, session.language) == (1, tg_id, 'user', 'ru')
+
+
+    # The reporter is whoever the token says, not the user_id in the body
+    report = {'user_id': 2, 'lat': 41.3, 'lng': 69.24, 'level': 1, 'types': ['plastic'], 'photos': []}
+    response = client.post('/api/pollutions', json=report, headers={'Authorization': f'Bearer {token}'})
+    with app.app_context():
+        owner = db.session.get(Pollution, response.get_json()['id']).user_id
+    checks['report_owned_by_token_user'] = response.status_code == 200 and owner == 1
+    checks['missing_token_refused'] = client.post('/api/pollutions', json=report).status_code == 401
+
+    checks['user_token_not_admin'] = client.get('/api/admin/stats', headers=session_headers(1)).status_code == 403
+    checks['admin_token_admin'] = client.get('/api/admin/stats', headers=admin_headers()).status_code == 200
+    checks['admin_tg_id_param_ignored'] = client.get(
+        f'/api/admin/stats?admin_tg_id={auth.ADMIN_IDS[0]}').status_code == 401
+
+    response = client.post('/api/profile/1/language', json={'language': 'uz'}, headers=session_headers(1))
+    renewed = auth.parse((response.get_json() or {}).get('token'))
+    checks['language_change_reissues_token'] = renewed is not None and renewed.language == 'uz'
+    checks['other_profile_forbidden'] = client.post(
+        '/api/profile/2/language', json={'language': 'uz'}, headers=session_headers(1)).status_code == 403
+
+    # A heartbeat is authenticated in memory and coalesced: no query at all
+    with count_queries(app) as counter:
+        response = client.post('/api/user/location', json={'lat': 41.31, 'lng': 69.25}, headers=session_headers(3))
+    heartbeat_queries = counter.count
+    heartbeats.flush_now()
+    with app.app_context():
+        user = db.session.get(User, 3)
+        checks['heartbeat_updates_token_user'] = response.status_code == 200 and (user.lat, user.lng) == (41.31, 69.25)
+    checks['heartbeat_without_queries'] = heartbeat_queries == 0
+
+    signed = init_data(tg_id)
+    failed = not all(checks.values())
+    print(json.dumps({
+        **checks,
+        'heartbeat_queries': heartbeat_queries,
+        'verify_init_data_us': per_call_us(lambda: auth.verify_init_data(signed)),
+        'parse_token_us': per_call_us(lambda: auth.parse(token)),
+        'token_bytes': len(token),
+    }, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""Analytics rollups: backfill time, endpoint cost, and incremental == rebuilt.
+
+    python -m benchmarks.bench_analytics --pollutions 200000
+
+Seeds --pollutions reports spread over the last months and times the
+backfill (analytics.rebuild). Then compares /api/admin/analytics with what
+the endpoint would otherwise have to do: read every pollution of the range
+and group it by local day and type. Both must give the same series.
+
+Finally it reports, cleans, re-rewards and deletes pollutions and a user
+through the API, so only the write hooks touch the rollups, and checks that
+the result equals a rebuild from scratch. Exits 1 on any mismatch.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from benchmarks.common import (TYPES, admin_headers, count_queries, random_point, session_headers,
+                               setup_app, seed)
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, round(statistics.median(samples), 2)
+
+
+def raw_series(start, end):
+    """Reports per local day and type straight from the pollutions table."""
+    import analytics
+    from models import db, Pollution
+
+    offset = analytics.UTC_OFFSET
+    rows = db.session.query(Pollution.created_at, Pollution.types).filter(
+        Pollution.created_at >= datetime.combine(start, datetime.min.time()) - offset,
+        Pollution.created_at < datetime.combine(end + timedelta(days=1), datetime.min.time()) - offset)
+    counts = defaultdict(lambda: defaultdict(int))
+    for created_at, types in rows:
+        day = analytics.local_day(created_at)
+        for t in set(types or ()):
+            counts[t][day.isoformat()] += 1
+    return counts
+
+
+def snapshot():
+    from models import AnalyticsRollup
+
+    return {
+        (r.granularity, r.dimension, r.bucket.isoformat(), r.metric, r.key): (r.count, round(r.rewards, 6))
+        for r in AnalyticsRollup.query if r.count or abs(r.rewards) > 1e-9
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pollutions', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = setup_app()
+    seed(app, users=1000, pollutions=args.pollutions, photos_per_pollution=0)
+
+    import analytics
+
+    client = app.test_client()
+    failed = False
+
+    with app.app_context():
+        started = time.perf_counter()
+        rollup_rows = analytics.rebuild()
+        backfill_s = time.perf_counter() - started
+
+    # Seeded reports are one per minute going back from now
+    end = analytics.local_day(datetime.utcnow())
+    start = analytics.local_day(datetime.utcnow() - timedelta(minutes=args.pollutions))
+    url = f'/api/admin/analytics?granularity=day&dimension=type&from={start}&to={end}'
+    headers = admin_headers()
+
+    def endpoint():
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, response.status_code
+        return response.get_json()
+
+    endpoint()
+    with count_queries(app) as counter:
+        data, endpoint_ms = timed(endpoint, args.repeat)
+    endpoint_queries = counter.count // args.repeat
+    with app.app_context():
+        with count_queries(app) as counter:
+            raw, raw_ms = timed(lambda: raw_series(start, end), args.repeat)
+        raw_queries = counter.count // args.repeat
+    from_rollups = {s['key']: {b: n for b, n in zip(data['buckets'], s['reported']) if n} for s in data['series']}
+    same_as_raw = from_rollups == {t: dict(days) for t, days in raw.items()}
+    failed |= not same_as_raw
+
+    # Only the write hooks from here on
+    rng = random.Random(11)
+    reports = []
+    for i in range(40):
+        lat, lng = random_point(rng)
+        reports.append({'lat': lat, 'lng': lng, 'level': rng.randint(1, 3), 'types': rng.sample(TYPES, 2),
+                        'client_key': f'analytics-{i}', 'photos': []})
+    response = client.post('/api/pollutions/batch', json={'reports': reports}, headers=session_headers(2))
+    new_ids = [r['id'] for r in response.get_json()['results']]
+    statuses = [response.status_code]
+    for p_id in new_ids[:10] + [1, 3, 5]:
+        statuses.append(client.post(f'/api/pollutions/{p_id}/clean', json={}, headers=session_headers(4)).status_code)
+    for p_id in (new_ids[0], 3):
+        statuses.append(client.post(f'/api/admin/pollutions/{p_id}/reward', json={'reward': 7.5},
+                                    headers=headers).status_code)
+    for p_id in (new_ids[1], new_ids[20], 6):
+        statuses.append(client.delete(f'/api/admin/pollutions/{p_id}', headers=headers).status_code)
+    for user_id in (2, 7):
+        statuses.append(client.delete(f'/api/admin/users/{user_id}', headers=headers).status_code)
+    # Seeded pollutions 1, 3 and 5 may already be cleaned
+    writes_ok = all(status in (200, 400) for status in statuses) and statuses.count(200) >= len(statuses) - 3
+    failed |= not writes_ok
+
+    with app.app_context():
+        incremental = snapshot()
+        analytics.rebuild()
+        rebuilt = snapshot()
+    diff = sorted(set(incremental.items()) ^ set(rebuilt.items()))
+    failed |= bool(diff)
+
+    bad = {
+        'granularity': client.get('/api/admin/analytics?granularity=month', headers=headers).status_code,
+        'dimension': client.get('/api/admin/analytics?dimension=city', headers=headers).status_code,
+        'date': client.get('/api/admin/analytics?from=yesterday', headers=headers).status_code,
+        'range': client.get('/api/admin/analytics?from=2000-01-01&to=2020-01-01', headers=headers).status_code,
+        'not_admin': client.get('/api/admin/analytics', headers=session_headers(3)).status_code,
+    }
+    refusals_ok = bad == {'granularity': 400, 'dimension': 400, 'date': 400, 'range': 400, 'not_admin': 403}
+    failed |= not refusals_ok
+
+    print(json.dumps({
+        'pollutions': args.pollutions,
+        'backfill_seconds': round(backfill_s, 2),
+        'rollup_rows': rollup_rows,
+        'days': len(data['buckets']),
+        'endpoint_ms': endpoint_ms,
+        'endpoint_queries': endpoint_queries,
+        'raw_scan_ms': raw_ms,
+        'raw_scan_queries': raw_queries,
+        'speedup': round(raw_ms / endpoint_ms, 1),
+        'same_as_raw': same_as_raw,
+        'writes_ok': writes_ok,
+        'incremental_equals_rebuild': not diff,
+        'mismatches': [list(map(str, d)) for d in diff[:10]],
+        'refusals': bad,
+        'refusals_ok': refusals_ok,
+    }, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
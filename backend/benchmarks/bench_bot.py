@@ -0,0 +1,170 @@
+"""Webhook mode of bot.py: a burst of recorded updates, one by one vs pooled.
+
+    python -m benchmarks.bench_bot --rounds 50 --workers 8 --latency 0.05
+
+Starts bot.py's webhook server on a local port, with the Bot API replaced by
+benchmarks.fake_telegram (every call takes --latency seconds, roughly a
+round trip to Telegram). Then POSTs the updates recorded in
+fixtures/bot_updates.json (/start, the three language buttons, /admin from
+an admin and from a user) --rounds times from many client threads, the way
+Telegram delivers a burst after a promotion. It does this once with a
+single worker (handled one at a time, as the polling loop did) and once
+with --workers, and reports how long the burst takes to be answered.
+
+Also checks that every update got its answer and that no keyboard is
+serialized while handling (they are prebuilt). It checks the refusals too:
+a wrong secret gets 403, malformed JSON 400 and a full queue 503. Exits 1
+on any failure.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import BACKEND_DIR
+from benchmarks.fake_telegram import FakeTelegram
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'bot_updates.json')
+SECRET = 'bench-secret'
+PATH = '/bot-webhook'
+
+
+def post(port, body, secret=SECRET):
+    request = urllib.request.Request(f'http://127.0.0.1:{port}{PATH}', data=body, method='POST', headers={
+        'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': secret})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def expected_calls(updates):
+    calls = {'sendMessage': 0, 'editMessageText': 0, 'answerCallbackQuery': 0}
+    for update in updates:
+        if 'callback_query' in update:
+            calls['editMessageText'] += 1
+            calls['answerCallbackQuery'] += 1
+        else:
+            calls['sendMessage'] += 1
+    return calls
+
+
+def burst(bot, webhook, fake, updates, workers, clients):
+    server = webhook.WebhookServer(bot, path=PATH, secret=SECRET, port=0,
+                                   workers=workers, queue_size=len(updates)).start()
+    fake.calls.clear()
+    bodies = [json.dumps(u).encode() for u in updates]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        statuses = list(pool.map(lambda body: post(server.port, body), bodies))
+    accepted_s = time.perf_counter() - started
+    dispatcher = server.dispatcher
+    while dispatcher.handled + dispatcher.failed < len(updates) and time.perf_counter() - started < 300:
+        time.sleep(0.005)
+    answered_s = time.perf_counter() - started
+    server.stop()
+    return {
+        'workers': workers,
+        'accepted_all': statuses.count(200) == len(updates),
+        'accept_seconds': round(accepted_s, 3),
+        'answer_seconds': round(answered_s, 3),
+        'updates_per_second': round(len(updates) / answered_s, 1),
+        'handled': dispatcher.handled,
+        'failed': dispatcher.failed,
+        'calls': dict(fake.calls),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    fake = FakeTelegram(latency=args.latency).start()
+    os.environ['TELEGRAM_API_URL'] = fake.api_url
+    os.environ.setdefault('BOT_TOKEN', '0:benchmark')
+    os.environ['BOT_WEBHOOK_URL'] = f'https://bench.invalid{PATH}'
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+    from telebot import types
+    import bot
+    import webhook
+
+    # bot.py logs every /start
+    logging.getLogger('ecopatrol').setLevel(logging.WARNING)
+
+    with open(FIXTURE) as f:
+        recorded = json.load(f)
+    updates = []
+    for i in range(args.rounds):
+        for update in recorded:
+            updates.append({**update, 'update_id': update['update_id'] + i * len(recorded)})
+    expected = expected_calls(updates)
+
+    # Counts keyboards serialized while updates are handled
+    serialized = [0]
+    to_json = types.InlineKeyboardMarkup.to_json
+
+    def counting_to_json(self):
+        serialized[0] += 1
+        return to_json(self)
+    types.InlineKeyboardMarkup.to_json = counting_to_json
+
+    failed = False
+    results = []
+    for workers in (1, args.workers):
+        result = burst(bot.bot, webhook, fake, updates, workers, args.clients)
+        result['answers_ok'] = result['calls'] == expected and result['failed'] == 0
+        failed |= not (result['accepted_all'] and result['answers_ok'])
+        results.append(result)
+    types.InlineKeyboardMarkup.to_json = to_json
+
+    # Refusals: wrong secret, malformed body, and a full queue
+    fake.latency = 0.2
+    server = webhook.WebhookServer(bot.bot, path=PATH, secret=SECRET, port=0, workers=1, queue_size=1).start()
+    body = json.dumps(recorded[0]).encode()
+    refusals = {
+        'wrong_secret': post(server.port, body, secret='nope'),
+        'malformed': post(server.port, b'{"update_id": '),
+    }
+    statuses = [post(server.port, body) for _ in range(5)]
+    server.stop()
+    refusals['queue_full'] = 503 if 503 in statuses else statuses[-1]
+    refusals_ok = refusals == {'wrong_secret': 403, 'malformed': 400, 'queue_full': 503}
+    failed |= not refusals_ok or serialized[0] != 0
+
+    # What rebuilding the welcome keyboard per callback used to cost
+    started = time.perf_counter()
+    for _ in range(2000):
+        bot.build_markups()
+    rebuild_us = (time.perf_counter() - started) / 2000 * 1e6
+
+    fake.stop()
+    sequential, pooled = results
+    print(json.dumps({
+        'updates': len(updates),
+        'api_latency_ms': args.latency * 1000,
+        'one_at_a_time': sequential,
+        'pooled': pooled,
+        'speedup': round(sequential['answer_seconds'] / pooled['answer_seconds'], 1),
+        'keyboards_serialized_while_handling': serialized[0],
+        'keyboard_rebuild_us': round(rebuild_us, 1),
+        'refusals': refusals,
+        'refusals_ok': refusals_ok,
+    }, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
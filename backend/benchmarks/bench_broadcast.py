@@ -0,0 +1,104 @@
+"""Runs a broadcast against the fake Bot API, with a worker crash in the middle.
+
+    python -m benchmarks.bench_broadcast --users 500
+
+Seeds users, queues a broadcast through the admin API, kills the first runner
+after a few chunks and lets a second one resume. Checks that every recipient
+got the message, that re-sends after the crash stay within one chunk and
+that the global rate limit holds. Exits 1 on any violation.
+"""
+import argparse
+import json
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from benchmarks.common import admin_headers, setup_app, seed, TASHKENT
+from benchmarks.fake_telegram import FakeTelegram
+
+
+class Crash(Exception):
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--chunk-size', type=int, default=50)
+    parser.add_argument('--crash-after', type=int, default=120, help='sends before the first runner dies')
+    parser.add_argument('--radius-km', type=float, default=0, help='limit the broadcast to this radius around Tashkent')
+    parser.add_argument('--throttle-rate', type=float, default=0.02)
+    args = parser.parse_args()
+
+    app = setup_app()
+    seed(app, users=args.users, pollutions=0)
+    fake = FakeTelegram(throttle_rate=args.throttle_rate).start()
+
+    import os
+    os.environ['TELEGRAM_API_URL'] = fake.api_url
+    import geo
+    import outbox
+    from broadcasts import BroadcastRunner
+    from models import db, User, Broadcast
+    from notifier import create_bot
+
+    body = {'message': 'Cleanup event on Saturday!'}
+    if args.radius_km:
+        body.update(center_lat=TASHKENT[0], center_lng=TASHKENT[1], radius_km=args.radius_km)
+    created = app.test_client().post('/api/admin/broadcasts', json=body, headers=admin_headers()).get_json()
+
+    class CrashingRunner(BroadcastRunner):
+        calls = 0
+
+        def _deliver(self, chat_id, text):
+            CrashingRunner.calls += 1
+            if CrashingRunner.calls > args.crash_after:
+                raise Crash()
+            return super()._deliver(chat_id, text)
+
+    limiter = outbox.RateLimiter()
+    started = time.perf_counter()
+    with app.app_context():
+        try:
+            CrashingRunner(create_bot(), limiter, chunk_size=args.chunk_size).run_once()
+        except Crash:
+            db.session.rollback()
+        # The dead worker stops heartbeating; pretend the stale window passed
+        Broadcast.query.filter_by(id=created['id']).update({'updated_at': datetime.utcnow() - timedelta(hours=1)})
+        db.session.commit()
+        BroadcastRunner(create_bot(), limiter, chunk_size=args.chunk_size).run_once()
+        elapsed = time.perf_counter() - started
+        broadcast = db.session.get(Broadcast, created['id'])
+        expected = {
+            str(u.telegram_id) for u in User.query.all()
+            if not args.radius_km or geo.distance_km(TASHKENT[0], TASHKENT[1], u.lat, u.lng) <= args.radius_km
+        }
+        summary = {'status': broadcast.status, 'sent': broadcast.sent, 'failed': broadcast.failed}
+    fake.stop()
+
+    received = Counter(chat_id for _, chat_id, _ in fake.messages)
+    times = [ts for ts, _, _ in fake.messages]
+    peak = max((sum(1 for t in times if s <= t < s + 1.0) for s in times), default=0)
+    result = {
+        **summary,
+        'estimated_total': created['estimated_total'],
+        'recipients': len(expected),
+        'missing': len(expected - set(received)),
+        'unexpected': len(set(received) - expected),
+        'resent_after_crash': sum(n - 1 for n in received.values()),
+        'throttled': fake.rejected,
+        'seconds': round(elapsed, 2),
+        'messages_per_second': round(len(fake.messages) / elapsed, 1),
+        'peak_messages_in_1s': peak,
+    }
+    print(json.dumps(result, indent=2))
+
+    ok = (result['status'] == 'done' and result['missing'] == 0 and result['unexpected'] == 0
+          and result['resent_after_crash'] <= args.chunk_size
+          and peak <= outbox.GLOBAL_RATE * 1.1)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
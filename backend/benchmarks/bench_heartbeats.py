@@ -0,0 +1,78 @@
+"""Commits per second for /api/user/location, write-through vs coalesced.
+
+    python -m benchmarks.bench_heartbeats --users 2000 --requests 4000 --threads 4
+
+Fires heartbeats from several client threads, first with coalescing off
+(HEARTBEAT_FLUSH_SECONDS=0, one commit per request as before) and then with
+the default flush interval, counting DB commits with an engine event.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+
+from sqlalchemy import event
+
+from benchmarks.common import session_headers, setup_app, seed, random_point
+
+
+def fire(app, user_ids, requests, threads, seed_value):
+    def worker(n, rng):
+        client = app.test_client()
+        for _ in range(n):
+            lat, lng = random_point(rng)
+            client.post('/api/user/location', json={'lat': lat, 'lng': lng},
+                        headers=session_headers(rng.choice(user_ids)))
+
+    pool = [threading.Thread(target=worker, args=(requests // threads, random.Random(seed_value + i)))
+            for i in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    app = setup_app(args.database_url)
+    seed(app, users=args.users, pollutions=0)
+
+    import heartbeats
+    from models import db
+
+    with app.app_context():
+        engine = db.engine
+    commits = [0]
+    event.listen(engine, 'commit', lambda conn: commits.__setitem__(0, commits[0] + 1))
+    user_ids = list(range(1, args.users + 1))
+    flush_seconds = heartbeats.FLUSH_SECONDS or 5.0
+
+    result = {}
+    for mode, interval in (('write_through', 0), ('coalesced', flush_seconds)):
+        heartbeats.FLUSH_SECONDS = interval
+        commits[0] = 0
+        elapsed = fire(app, user_ids, args.requests, args.threads, seed_value=len(result))
+        # Shutdown flush, so both modes end with the same data on disk
+        heartbeats.flush_now()
+        result[mode] = {
+            'requests': args.requests,
+            'seconds': round(elapsed, 2),
+            'requests_per_second': round(args.requests / elapsed, 1),
+            'commits': commits[0],
+            'commits_per_second': round(commits[0] / elapsed, 1),
+        }
+    result['flush_seconds'] = flush_seconds
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
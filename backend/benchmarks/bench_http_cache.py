@@ -0,0 +1,73 @@
+"""Requests per second for repeat visitors of the public GET endpoints.
+
+    python -m benchmarks.bench_http_cache --pollutions 5000 --requests 300
+
+Every endpoint is hit once for its ETag, then repeatedly without and with
+If-None-Match. The revalidating requests must return 304 with zero SQL
+queries; the script exits 1 otherwise. A write in between must change the
+ETag of the affected endpoints.
+"""
+import argparse
+import json
+import sys
+import time
+
+from benchmarks.common import session_headers, setup_app, seed, count_queries
+
+ENDPOINTS = ['/api/pollutions', '/api/leaderboard', '/api/stats/public', '/api/config']
+
+
+def fetch(client, url, headers=None):
+    response = client.get(url, headers=headers or {})
+    response.get_data()
+    response.close()
+    return response
+
+
+def rate(client, url, requests, headers=None):
+    started = time.perf_counter()
+    for _ in range(requests):
+        fetch(client, url, headers)
+    return round(requests / (time.perf_counter() - started), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pollutions', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    app = setup_app()
+    seed(app, users=500, pollutions=args.pollutions)
+    client = app.test_client()
+
+    results, ok = {}, True
+    for url in ENDPOINTS:
+        tag = fetch(client, url).headers['ETag']
+        with count_queries(app) as counter:
+            revalidated = fetch(client, url, {'If-None-Match': tag})
+        ok &= revalidated.status_code == 304 and counter.count == 0
+        full_rps = rate(client, url, args.requests)
+        cached_rps = rate(client, url, args.requests, {'If-None-Match': tag})
+        results[url] = {
+            'full_rps': full_rps,
+            'revalidated_rps': cached_rps,
+            'speedup': round(cached_rps / full_rps, 1),
+            'revalidation_queries': counter.count,
+            'revalidation_status': revalidated.status_code,
+        }
+
+    # Reporting a pollution must invalidate the listing and the stats
+    tags = {url: fetch(client, url).headers['ETag'] for url in ENDPOINTS}
+    client.post('/api/pollutions', json={'lat': 41.3, 'lng': 69.2, 'level': 1, 'types': ['plastic'],
+                                         'description': 'bench', 'photos': []}, headers=session_headers(1))
+    changed = {url: fetch(client, url).headers['ETag'] != tags[url] for url in ENDPOINTS}
+    ok &= changed['/api/pollutions'] and changed['/api/stats/public'] and not changed['/api/config']
+    results['etag_changed_after_report'] = changed
+
+    print(json.dumps(results, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
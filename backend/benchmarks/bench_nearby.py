@@ -0,0 +1,168 @@
+"""Matching latency of "new pollution near you" and the alert pipeline.
+
+    python -m benchmarks.bench_nearby --users 100000 --points 200
+
+Matches random report positions against --users user positions twice:
+through the users.geo_cell index (nearby.match) and by loading every
+user and checking the haversine distance, and compares latency and
+results. Then checks the pipeline end to end: a heartbeat moves a user
+into a report's radius, the report's job queues one alert per nearby
+user, and the dispatcher holds the alerts during quiet hours, sends them
+in the morning and skips a second alert to the same users within the
+throttle period. Exits 1 on any mismatch.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from benchmarks.common import TASHKENT, random_point, session_headers, setup_app, seed
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(chat_id)
+
+
+def stats_ms(samples):
+    samples = sorted(samples)
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+    }
+
+
+def scan(lat, lng, radius_km, seen_after):
+    """The naive way: every user with a position, then a haversine check."""
+    import geo
+    from models import db, User
+
+    rows = db.session.execute(select(User.id, User.lat, User.lng).where(
+        User.lat.isnot(None), User.last_seen_at >= seen_after)).all()
+    return {r.id for r in rows if geo.distance_km(lat, lng, r.lat, r.lng) <= radius_km}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--points', type=int, default=200)
+    parser.add_argument('--scan-points', type=int, default=20, help='the full scan is slow; fewer samples')
+    parser.add_argument('--radius-km', type=float, default=1.5)
+    args = parser.parse_args()
+
+    app = setup_app()
+    seed(app, users=args.users, pollutions=1000)
+
+    import heartbeats
+    import nearby
+    import outbox
+    from models import db, User, OutboxMessage, NearbyJob
+
+    rng = random.Random(3)
+    failed = False
+    seen_after = datetime.utcnow() - nearby.SEEN_WITHIN
+    points = [random_point(rng, local_share=0.8) for _ in range(args.points)]
+
+    with app.app_context():
+        indexed, matched = [], []
+        for lat, lng in points:
+            started = time.perf_counter()
+            users = nearby.match(lat, lng, args.radius_km, seen_after=seen_after)
+            indexed.append((time.perf_counter() - started) * 1000)
+            matched.append(len(users))
+        full, mismatches = [], 0
+        for lat, lng in points[:args.scan_points]:
+            started = time.perf_counter()
+            expected = scan(lat, lng, args.radius_km, seen_after)
+            full.append((time.perf_counter() - started) * 1000)
+            got = {row.id for row, _ in nearby.match(lat, lng, args.radius_km, seen_after=seen_after)}
+            mismatches += got != expected
+        failed |= mismatches > 0
+        db.session.remove()
+
+    # A heartbeat moves a user from the far north right next to the new report
+    client = app.test_client()
+    spot = TASHKENT
+    with app.app_context():
+        mover = User.query.filter(User.lat > 44).first()
+        reporter = User.query.filter(User.id != mover.id).first()
+        heartbeats.record(mover.id, spot[0] + 0.001, spot[1])
+        heartbeats.flush_now()
+        moved = mover.id in {row.id for row, _ in nearby.match(*spot, args.radius_km)}
+        db.session.remove()
+    failed |= not moved
+
+    response = client.post('/api/pollutions', json={
+        'lat': spot[0], 'lng': spot[1], 'level': 2, 'types': ['plastic'], 'photos': []},
+        headers=session_headers(reporter.id))
+    failed |= response.status_code != 200
+
+    # Night in Tashkent (UTC+5): 23:00 local is 18:00 UTC
+    night = (datetime.utcnow() + timedelta(days=1)).replace(hour=18, minute=0, second=0, microsecond=0)
+    morning = night + timedelta(hours=15)
+    limiter = outbox.RateLimiter(global_rate=0, per_chat_interval=0)
+
+    with app.app_context():
+        expected = {row.telegram_id for row, _ in nearby.match(
+            *spot, nearby.RADIUS_KM, seen_after=datetime.utcnow() - nearby.SEEN_WITHIN, exclude_user_id=reporter.id)}
+        started = time.perf_counter()
+        jobs = nearby.NearbyRunner().run_once()
+        fan_out_ms = (time.perf_counter() - started) * 1000
+        queued = {m.chat_id for m in OutboxMessage.query.filter_by(kind=nearby.KIND)}
+        fan_out_ok = jobs == 1 and queued == expected and mover.telegram_id in queued \
+            and NearbyJob.query.count() == 0
+
+        bot = FakeBot()
+        outbox.Dispatcher(bot, limiter, batch_size=100_000, clock=lambda: night).run_once()
+        held = OutboxMessage.query.filter_by(kind=nearby.KIND, status='pending').all()
+        quiet_ok = not bot.sent and len(held) == len(expected) \
+            and all(m.next_attempt_at == night.replace(hour=3) + timedelta(days=1) for m in held)
+
+        outbox.Dispatcher(bot, limiter, batch_size=100_000, clock=lambda: morning).run_once()
+        morning_ok = set(bot.sent) == expected and len(bot.sent) == len(expected)
+        db.session.remove()
+
+    # A second report at the same spot ten minutes later reaches the same users
+    client.post('/api/pollutions', json={
+        'lat': spot[0], 'lng': spot[1], 'level': 1, 'types': ['glass'], 'photos': []},
+        headers=session_headers(reporter.id))
+    with app.app_context():
+        nearby.NearbyRunner().run_once()
+        sent_before = len(bot.sent)
+        later = morning + timedelta(minutes=10)
+        outbox.Dispatcher(bot, limiter, batch_size=100_000, clock=lambda: later).run_once()
+        skipped = OutboxMessage.query.filter_by(kind=nearby.KIND, status='skipped').count()
+        throttle_ok = len(bot.sent) == sent_before and skipped == len(expected)
+        db.session.remove()
+
+    failed |= not (fan_out_ok and quiet_ok and morning_ok and throttle_ok)
+    print(json.dumps({
+        'users': args.users,
+        'radius_km': args.radius_km,
+        'points': args.points,
+        'matched_users_mean': round(statistics.fmean(matched), 1),
+        'indexed_match': stats_ms(indexed),
+        'full_scan': stats_ms(full),
+        'result_mismatches': mismatches,
+        'heartbeat_moves_user': moved,
+        'fan_out_recipients': len(expected),
+        'fan_out_ms': round(fan_out_ms, 2),
+        'fan_out_ok': fan_out_ok,
+        'quiet_hours_ok': quiet_ok,
+        'morning_delivery_ok': morning_ok,
+        'throttle_ok': throttle_ok,
+    }, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Drains the outbox against the fake Bot API and checks the delivery rules.
+
+    python -m benchmarks.bench_outbox --messages 300 --chats 100
+
+Verifies that every message is delivered exactly once (duplicate enqueues
+are dropped), that throttled sends are retried, that blocked chats fail
+permanently and that per-chat and global rate limits hold. Exits 1 on any
+violation.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+from benchmarks.common import setup_app
+from benchmarks.fake_telegram import FakeTelegram
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=300)
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--throttle-rate', type=float, default=0.05)
+    args = parser.parse_args()
+
+    app = setup_app()
+    blocked_chat = 1
+    fake = FakeTelegram(throttle_rate=args.throttle_rate, blocked_chats=[blocked_chat]).start()
+
+    os.environ['TELEGRAM_API_URL'] = fake.api_url
+    import outbox
+    from models import db, OutboxMessage
+    from notifier import create_bot
+
+    with app.app_context():
+        for i in range(args.messages):
+            chat_id = 1 + i % args.chats
+            outbox.enqueue(chat_id, f'message {i}', dedupe_key=f'bench:{i}')
+            # A retried request enqueueing the same notification again
+            outbox.enqueue(chat_id, f'message {i}', dedupe_key=f'bench:{i}')
+        db.session.commit()
+
+        dispatcher = outbox.Dispatcher(create_bot())
+        started = time.perf_counter()
+        while OutboxMessage.query.filter_by(status='pending').count():
+            if not dispatcher.run_once():
+                time.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        failed = OutboxMessage.query.filter_by(status='failed').all()
+    fake.stop()
+
+    per_chat = defaultdict(list)
+    for ts, chat_id, _ in fake.messages:
+        per_chat[chat_id].append(ts)
+    min_chat_gap = min((b - a for times in per_chat.values() for a, b in zip(times, times[1:])), default=None)
+    texts = [text for _, _, text in fake.messages]
+    expected = args.messages - sum(1 for i in range(args.messages) if 1 + i % args.chats == blocked_chat)
+
+    result = {
+        'enqueued': args.messages,
+        'delivered': len(fake.messages),
+        'expected_delivered': expected,
+        'duplicates': len(texts) - len(set(texts)),
+        'throttled_and_retried': fake.rejected - len(failed),
+        'failed_permanently': len(failed),
+        'seconds': round(elapsed, 2),
+        'messages_per_second': round(len(fake.messages) / elapsed, 1),
+        'min_per_chat_gap_s': round(min_chat_gap, 3) if min_chat_gap is not None else None,
+    }
+    print(json.dumps(result, indent=2))
+
+    ok = (result['delivered'] == expected and result['duplicates'] == 0
+          and all(m.chat_id == blocked_chat for m in failed)
+          and result['messages_per_second'] <= outbox.GLOBAL_RATE * 1.1
+          and (min_chat_gap is None or min_chat_gap >= outbox.PER_CHAT_INTERVAL * 0.95))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Photo uploads: request latency, dedupe, variants and what a listing downloads.
+
+    python -m benchmarks.bench_photos --photos 20 --size 4000x3000
+
+Uploads synthetic camera-sized JPEGs through POST /api/photos and compares
+the request time with rendering the variants inline. Checks that an
+identical upload is deduplicated, that variants appear in the background
+(and are rendered on demand if requested first), that /media/photos
+responses are immutable, and that the map listing links thumbnails: the
+bytes a client downloads for the listed photos are compared with the
+originals. Exits 1 on any mismatch.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+
+from benchmarks.common import session_headers, setup_app
+
+
+def make_jpeg(rng, width, height):
+    from PIL import Image
+
+    # Blocks of noise compress about as badly as a photo of a littered lawn
+    small = Image.frombytes('RGB', (width // 16, height // 16),
+                            bytes(rng.getrandbits(8) for _ in range(width // 16 * height // 16 * 3)))
+    image = small.resize((width, height), Image.BILINEAR)
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=90)
+    return out.getvalue()
+
+
+def upload(client, data):
+    response = client.post('/api/photos', data={'file': (io.BytesIO(data), 'photo.jpg')},
+                           content_type='multipart/form-data', headers=session_headers(1))
+    return response.status_code, response.get_json()
+
+
+def fetch(client, url):
+    response = client.get(url)
+    data = response.get_data()
+    response.close()
+    return response, data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--photos', type=int, default=20)
+    parser.add_argument('--size', default='4000x3000')
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split('x'))
+
+    app = setup_app()
+
+    import media
+    from models import db, User
+
+    client = app.test_client()
+    rng = random.Random(5)
+    failed = False
+    images = [make_jpeg(rng, width, height) for _ in range(args.photos)]
+
+    upload_ms, urls = [], []
+    for data in images:
+        started = time.perf_counter()
+        status, body = upload(client, data)
+        upload_ms.append((time.perf_counter() - started) * 1000)
+        failed |= status != 200 or body['deduped']
+        urls.append(body['url'])
+
+    def variants_ready(url):
+        digest = url.rsplit('/', 1)[1].split('.')[0]
+        return all(os.path.exists(media._path(media._variant_name(digest, v))) for v in media.VARIANTS)
+
+    deadline = time.time() + 60
+    while time.time() < deadline and not all(variants_ready(u) for u in urls):
+        time.sleep(0.1)
+    background_ok = all(variants_ready(u) for u in urls)
+
+    # Rendering inline is what the request would cost without the pool
+    digest, ext = urls[0].rsplit('/', 1)[1].split('.')
+    for variant in media.VARIANTS:
+        os.remove(media._path(media._variant_name(digest, variant)))
+    started = time.perf_counter()
+    media.render(digest, ext)
+    inline_ms = (time.perf_counter() - started) * 1000
+
+    status, again = upload(client, images[0])
+    files = sum(len(names) for _, _, names in os.walk(media.PHOTO_DIR))
+    dedupe_ok = status == 200 and again['deduped'] and again['url'] == urls[0]
+
+    # A variant requested before the pool got to it is rendered on the spot
+    fresh = make_jpeg(rng, width, height)
+    _, body = upload(client, fresh)
+    response, thumb = fetch(client, body['thumb_url'])
+    on_demand_ok = response.status_code == 200 and response.mimetype == 'image/webp' and len(thumb) < len(fresh)
+
+    response, _ = fetch(client, urls[0])
+    cache_control = response.headers.get('Cache-Control', '')
+    immutable_ok = response.status_code == 200 and 'immutable' in cache_control and 'max-age=31536000' in cache_control
+
+    with app.app_context():
+        db.session.add(User(id=1, telegram_id=1, first_name='Bench'))
+        db.session.commit()
+    for i, url in enumerate(urls):
+        client.post('/api/pollutions', json={'lat': 41.3 + i / 1000, 'lng': 69.24, 'level': 1,
+                                             'types': ['plastic'], 'photos': [url]}, headers=session_headers(1))
+    listed = [u for p in client.get('/api/pollutions').get_json() for u in p['photos']]
+    full = [u for p in client.get('/api/pollutions?photos=full').get_json() for u in p['photos']]
+    thumb_bytes = sum(len(fetch(client, u)[1]) for u in listed)
+    original_bytes = sum(len(fetch(client, u)[1]) for u in full)
+    listing_ok = len(listed) == len(urls) and all(u.endswith('_thumb.webp') for u in listed) \
+        and sorted(full) == sorted(urls)
+
+    failed |= not (background_ok and dedupe_ok and on_demand_ok and immutable_ok and listing_ok)
+    upload_ms.sort()
+    print(json.dumps({
+        'photos': args.photos,
+        'original_kb_mean': round(sum(map(len, images)) / len(images) / 1024, 1),
+        'upload_ms_p50': round(upload_ms[len(upload_ms) // 2], 2),
+        'upload_ms_max': round(upload_ms[-1], 2),
+        'inline_variants_ms': round(inline_ms, 2),
+        'background_variants_ok': background_ok,
+        'files_after_duplicate_upload': files,
+        'dedupe_ok': dedupe_ok,
+        'on_demand_variant_ok': on_demand_ok,
+        'immutable_ok': immutable_ok,
+        'listing_thumbnail_kb': round(thumb_bytes / 1024, 1),
+        'listing_original_kb': round(original_bytes / 1024, 1),
+        'listing_ok': listing_ok,
+    }, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
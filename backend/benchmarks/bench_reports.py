@@ -0,0 +1,146 @@
+"""Single vs batched report submission, and retries that must not pay twice.
+
+    python -m benchmarks.bench_reports --batch 20 --rounds 10
+
+Submits the same number of reports one request at a time and as batches
+through /api/pollutions/batch, comparing SQL statements and time per
+report. Then replays a batch (a lost response) and races concurrent
+retries of the same client keys, checking that no pollution is created
+twice and the reporter's balance, counters and the stats grow by exactly
+one reward per report. Exits 1 on any mismatch.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+
+from benchmarks.common import TYPES, random_point, session_headers, setup_app, seed, count_queries
+
+
+def make_reports(rng, n, keyed=True):
+    reports = []
+    for _ in range(n):
+        lat, lng = random_point(rng, local_share=0.8)
+        reports.append({
+            'client_key': str(uuid.UUID(int=rng.getrandbits(128))) if keyed else None,
+            'lat': lat, 'lng': lng, 'level': rng.randint(1, 3), 'types': rng.sample(TYPES, 2),
+            'description': 'bench', 'photos': [f'https://example.com/bench/{rng.getrandbits(32)}.jpg'],
+        })
+    return reports
+
+
+def post(client, url, user_id, body):
+    response = client.post(url, json=body, headers=session_headers(user_id))
+    data = response.get_json()
+    response.close()
+    return response.status_code, data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pollutions', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    app = setup_app()
+    seed(app, users=100, pollutions=args.pollutions)
+
+    import reports
+    import stats
+    from models import db, User, Pollution, Photo
+
+    client = app.test_client()
+    rng = random.Random(7)
+    failed = False
+    total = args.batch * args.rounds
+
+    def snapshot(user_id):
+        with app.app_context():
+            user = db.session.get(User, user_id)
+            result = (user.balance, user.reported_count, Pollution.query.count(), Photo.query.count(),
+                      stats.snapshot()['total_balance'])
+            db.session.remove()
+            return result
+
+    single = make_reports(rng, total)
+    started = time.perf_counter()
+    with count_queries(app) as single_queries:
+        for report in single:
+            status, _ = post(client, '/api/pollutions', 1, report)
+            failed |= status != 200
+    single_ms = (time.perf_counter() - started) * 1000 / total
+
+    before = snapshot(2)
+    batches = [make_reports(rng, args.batch) for _ in range(args.rounds)]
+    started = time.perf_counter()
+    with count_queries(app) as batch_queries:
+        for batch in batches:
+            status, data = post(client, '/api/pollutions/batch', 2, {'reports': batch})
+            failed |= status != 200 or not all(r['created'] for r in data['results'])
+    batch_ms = (time.perf_counter() - started) * 1000 / total
+    after = snapshot(2)
+    expected = (before[0] + reports.REPORT_REWARD * total, before[1] + total,
+                before[2] + total, before[3] + total, before[4] + reports.REPORT_REWARD * total)
+    batch_ok = after == expected
+    if not batch_ok:
+        print(f'batch: expected {expected}, got {after}')
+
+    # The response of the last batch got lost: the client sends it again,
+    # together with one new report and a key repeated inside the batch
+    fresh = make_reports(rng, 1)
+    replay = batches[-1] + fresh + fresh
+    status, data = post(client, '/api/pollutions/batch', 2, {'reports': replay})
+    created = [r['created'] for r in data['results']]
+    retried = snapshot(2)
+    replay_ok = (status == 200 and created == [False] * args.batch + [True, False]
+                 and data['results'][-1]['id'] == data['results'][-2]['id']
+                 and retried[0] == after[0] + reports.REPORT_REWARD and retried[2] == after[2] + 1)
+    if not replay_ok:
+        print(f'replay: created={created}, {after} -> {retried}')
+
+    # Several retries of one batch racing each other
+    racing = make_reports(rng, args.batch)
+    ids, errors = [], []
+
+    def retry():
+        status, data = post(app.test_client(), '/api/pollutions/batch', 3, {'reports': racing})
+        if status != 200:
+            errors.append(status)
+        else:
+            ids.append([r['id'] for r in data['results']])
+
+    before = snapshot(3)
+    pool = [threading.Thread(target=retry) for _ in range(args.threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    after = snapshot(3)
+    race_ok = (not errors and all(i == ids[0] for i in ids)
+               and after[0] == before[0] + reports.REPORT_REWARD * args.batch
+               and after[2] == before[2] + args.batch)
+    if not race_ok:
+        print(f'race: errors={errors}, {before} -> {after}')
+
+    failed |= not (batch_ok and replay_ok and race_ok)
+    print(json.dumps({
+        'reports': total,
+        'batch_size': args.batch,
+        'single_queries_per_report': round(single_queries.count / total, 2),
+        'batch_queries_per_report': round(batch_queries.count / total, 2),
+        'single_ms_per_report': round(single_ms, 3),
+        'batch_ms_per_report': round(batch_ms, 3),
+        'batch_ok': batch_ok,
+        'replay_ok': replay_ok,
+        'race_ok': race_ok,
+    }, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
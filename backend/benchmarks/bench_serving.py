@@ -0,0 +1,200 @@
+"""Concurrent-request capacity of /api/init and /api/pollutions, sync vs gevent workers.
+
+    python -m benchmarks.bench_serving --workers 2 --concurrency 1,16,64 --db-latency-ms 20
+
+Starts gunicorn with gunicorn.conf.py in each mode (ECO_WORKER_CLASS=sync,
+then gevent) on a seeded SQLite file and drives both endpoints from N
+client threads for a few seconds per concurrency level, reporting req/s,
+p50/p95/p99 and failed requests. Before measuring, --slow-clients
+connections start a POST and trickle the body one byte per second, like
+phones on a bad network; each of them pins a sync worker.
+
+SQLite answers in microseconds, so every statement is delayed by
+--db-latency-ms to stand in for the PostgreSQL round trip. The delay is a
+time.sleep, which gevent patches; in production psycogreen gives psycopg2
+the same cooperative wait. Pass --database-url for a real PostgreSQL and
+--db-latency-ms 0. Needs gunicorn and gevent installed.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import BACKEND_DIR, init_data, setup_app, seed
+
+ENDPOINTS = {
+    'init': ('POST', '/api/init'),
+    'pollutions': ('GET', '/api/pollutions?bbox=69.22,41.28,69.26,41.31'),  # one map screen in Tashkent
+}
+
+
+def serving_app():
+    """gunicorn entry point: the API with an artificial delay on every statement."""
+    from sqlalchemy import event
+    from app import app
+    from models import db
+
+    delay = float(os.getenv('BENCH_DB_LATENCY_MS', '0')) / 1000
+    if delay:
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', lambda *a: time.sleep(delay))
+    return app
+
+
+def start_server(mode, port, args, database_url):
+    env = dict(os.environ, DATABASE_URL=database_url, ECO_WORKER_CLASS=mode,
+               ECO_WORKERS=str(args.workers), BENCH_DB_LATENCY_MS=str(args.db_latency_ms))
+    if mode == 'gevent':
+        # One pool per worker shared by all its greenlets
+        env['DB_POOL_SIZE'] = str(max(args.levels))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-b', f'127.0.0.1:{port}', '--log-level', 'warning',
+         'benchmarks.bench_serving:serving_app()'],
+        cwd=BACKEND_DIR, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            status = request(port, 'GET', '/api/health', None, timeout=2)[0]
+            if status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'gunicorn ({mode}) did not come up')
+
+
+def request(port, method, path, body, timeout):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        headers = {'Content-Type': 'application/json'} if body else {}
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status, None
+    finally:
+        conn.close()
+
+
+def slow_clients(port, count, stop):
+    """Opens count POSTs whose bodies arrive one byte per second."""
+    body = json.dumps({'initData': init_data(10_000_001)}).encode()
+    head = (f'POST /api/init HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n\r\n').encode()
+
+    def trickle():
+        while not stop.is_set():
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=60) as sock:
+                    sock.sendall(head)
+                    for byte in body:
+                        if stop.wait(1):
+                            return
+                        sock.sendall(bytes([byte]))
+                    sock.recv(65536)
+            except OSError:
+                time.sleep(0.1)
+
+    threads = [threading.Thread(target=trickle, daemon=True) for _ in range(count)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+def percentile(samples, share):
+    return round(samples[min(len(samples) - 1, int(len(samples) * share))], 1) if samples else None
+
+
+def load(port, endpoint, concurrency, seconds, user_count):
+    method, path = ENDPOINTS[endpoint]
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(i):
+        n = 0
+        while time.perf_counter() < deadline:
+            body = None
+            if method == 'POST':
+                body = json.dumps({'initData': init_data(10_000_001 + (i * 7919 + n) % user_count)})
+            n += 1
+            started = time.perf_counter()
+            try:
+                status, _ = request(port, method, path, body, timeout=seconds + 10)
+            except OSError as e:
+                status = type(e).__name__
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                if status == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors.append(status)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': percentile(latencies, 0.5),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'ok': len(latencies),
+        'failed': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    parser.add_argument('--modes', default='sync,gevent')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', default='1,16,64')
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--db-latency-ms', type=float, default=20)
+    parser.add_argument('--slow-clients', type=int, default=0)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--pollutions', type=int, default=20000)
+    parser.add_argument('--port', type=int, default=18080)
+    args = parser.parse_args()
+    args.levels = [int(n) for n in args.concurrency.split(',')]
+
+    app = setup_app(args.database_url)
+    seed(app, users=args.users, pollutions=args.pollutions)
+    database_url = os.environ['DATABASE_URL']
+
+    results = {}
+    for mode in args.modes.split(','):
+        process = start_server(mode, args.port, args, database_url)
+        stop = threading.Event()
+        try:
+            slow_clients(args.port, args.slow_clients, stop)
+            time.sleep(1 if args.slow_clients else 0)
+            results[mode] = {
+                endpoint: {str(n): load(args.port, endpoint, n, args.seconds, args.users) for n in args.levels}
+                for endpoint in ENDPOINTS
+            }
+        finally:
+            stop.set()
+            process.terminate()
+            process.wait()
+
+    print(json.dumps({
+        'workers': args.workers,
+        'db_latency_ms': args.db_latency_ms,
+        'slow_clients': args.slow_clients,
+        'results': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Full-scan vs quadkey-indexed /api/pollutions.
+
+    python -m benchmarks.bench_spatial --rows 1000000
+
+The full-scan side is measured at the SQL level (the old endpoint also built
+an ORM object and a dict for every row, so it was strictly slower than this).
+The indexed side is measured both at the SQL level and through the endpoint.
+"""
+import argparse
+import json
+import time
+
+from benchmarks.common import setup_app, seed, measure, TASHKENT
+
+# Roughly what a phone screen shows at zoom 15 over central Tashkent
+VIEWPORT = (TASHKENT[1] - 0.015, TASHKENT[0] - 0.01, TASHKENT[1] + 0.015, TASHKENT[0] + 0.01)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    app = setup_app(args.database_url)
+    started = time.perf_counter()
+    seed(app, users=max(1, args.rows // 100), pollutions=args.rows, photos_per_pollution=0)
+    seed_seconds = time.perf_counter() - started
+
+    import geo
+    from models import db, Pollution
+
+    bbox_arg = ','.join(str(v) for v in VIEWPORT)
+    with app.app_context():
+        db.session.execute(db.text('ANALYZE'))
+        full_query = db.select(Pollution.id, Pollution.lat, Pollution.lng).where(Pollution.status == 'active')
+        bbox_query = full_query.where(geo.bbox_filter(Pollution.geo_cell, VIEWPORT, Pollution.lat, Pollution.lng))
+
+        full_rows = len(db.session.execute(full_query).all())
+        bbox_rows = len(db.session.execute(bbox_query).all())
+        results = {
+            'rows': args.rows,
+            'seed_seconds': round(seed_seconds, 1),
+            'active_rows': full_rows,
+            'viewport_rows': bbox_rows,
+            'full_scan_sql': measure(lambda: db.session.execute(full_query).all(), repeat=args.repeat),
+            'indexed_sql': measure(lambda: db.session.execute(bbox_query).all(), repeat=args.repeat),
+        }
+
+    client = app.test_client()
+    results['indexed_endpoint'] = measure(lambda: client.get(f'/api/pollutions?bbox={bbox_arg}'), repeat=args.repeat)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Peak memory of GET /api/pollutions as the table grows, buffered vs streamed.
+
+    python -m benchmarks.bench_streaming --sizes 10000 50000 100000
+
+For every size the listing is fetched in a fresh process, once the old way
+(query.all() + list of dicts + jsonify, rebuilt here) and once through the
+streaming endpoint, and the growth of the process's peak RSS is reported.
+Streaming should stay roughly flat while the buffered variant grows with the
+row count.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import setup_app, seed
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode):
+    from benchmarks.common import BACKEND_DIR  # noqa: F401  (sys.path setup)
+    from app import app, jsonify
+    from models import Pollution
+    from sqlalchemy.orm import selectinload
+
+    client = app.test_client()
+    # Warm up imports, pools and caches on a tiny request
+    client.get('/api/pollutions?bbox=0,0,0.001,0.001').get_data()
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    size = 0
+    first_byte = None
+    if mode == 'buffered':
+        with app.test_request_context('/api/pollutions'):
+            pollutions = Pollution.query.filter_by(status='active').options(selectinload(Pollution.photos)).all()
+            result = [{
+                'id': p.id, 'lat': p.lat, 'lng': p.lng, 'level': p.level, 'types': p.types,
+                'description': p.description, 'status': p.status,
+                'photos': [ph.url for ph in p.photos if ph.type == 'before'],
+            } for p in pollutions]
+            body = jsonify(result).get_data()
+            first_byte = time.perf_counter() - started
+            size = len(body)
+    else:
+        response = client.get('/api/pollutions')
+        for chunk in response.response:
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            size += len(chunk)
+        response.close()
+    print(json.dumps({
+        'peak_rss_growth_mb': round(peak_rss_mb() - baseline, 1),
+        'first_byte_ms': round(first_byte * 1000, 1),
+        'total_ms': round((time.perf_counter() - started) * 1000, 1),
+        'bytes': size,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000, 100000])
+    parser.add_argument('--child', choices=['buffered', 'streaming'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    path = os.path.join(tempfile.mkdtemp(prefix='ecopatrol-stream-'), 'bench.db')
+    database_url = f'sqlite:///{path}'
+    app = setup_app(database_url)
+    env = dict(os.environ, DATABASE_URL=database_url)
+    results = []
+    seeded = 0
+    for size in sorted(args.sizes):
+        # All rows active, so the listing returns the whole table
+        seed(app, users=100, pollutions=size - seeded, cleaned_share=0.0, seed_value=size)
+        seeded = size
+        row = {'rows': size}
+        for mode in ('buffered', 'streaming'):
+            out = subprocess.run([sys.executable, '-m', 'benchmarks.bench_streaming', '--child', mode],
+                                 env=env, capture_output=True, text=True, check=True)
+            row[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+        results.append(row)
+        print(json.dumps(row), flush=True)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Vector tiles vs the full JSON listing, plus tile cache invalidation checks.
+
+    python -m benchmarks.bench_tiles --pollutions 100000 --zoom 14
+
+Loads the tiles covering a phone-sized viewport over Tashkent and compares
+their bytes with /api/pollutions. Decodes every tile and checks it holds
+exactly the active reports of that tile, times a cold build against a
+cached read and a 304 revalidation, then reports and cleans a pollution
+inside a cached tile and checks the tile changes accordingly. Exits 1 on
+any mismatch.
+"""
+import argparse
+import json
+import sys
+import time
+
+from benchmarks.common import TASHKENT, session_headers, setup_app, seed
+
+
+def _varint(data, i):
+    shift = value = 0
+    while True:
+        byte = data[i]
+        i += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, i
+        shift += 7
+
+
+def _fields(data):
+    i = 0
+    while i < len(data):
+        key, i = _varint(data, i)
+        field, wire = key >> 3, key & 7
+        if wire == 0:
+            value, i = _varint(data, i)
+        elif wire == 2:
+            size, i = _varint(data, i)
+            value, i = data[i:i + size], i + size
+        else:
+            raise ValueError(f'unexpected wire type {wire}')
+        yield field, value
+
+
+def decode_features(data):
+    """{feature id: {'level': ..., 'types': ...}} of the pollutions layer."""
+    features = {}
+    for field, layer in _fields(data):
+        if field != 3:
+            continue
+        keys, values, raw = [], [], []
+        for lf, lv in _fields(layer):
+            if lf == 3:
+                keys.append(lv.decode())
+            elif lf == 4:
+                (vf, vv), = _fields(lv)
+                values.append(vv.decode() if vf == 1 else vv)
+            elif lf == 2:
+                raw.append(lv)
+        for feature in raw:
+            f_id, tags = None, []
+            for ff, fv in _fields(feature):
+                if ff == 1:
+                    f_id = fv
+                elif ff == 2:
+                    j = 0
+                    while j < len(fv):
+                        tag, j = _varint(fv, j)
+                        tags.append(tag)
+            features[f_id] = {keys[tags[k]]: values[tags[k + 1]] for k in range(0, len(tags), 2)}
+    return features
+
+
+def fetch(client, url, headers=None):
+    response = client.get(url, headers=headers or {})
+    data = response.get_data()
+    response.close()
+    return response, data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--pollutions', type=int, default=100_000)
+    parser.add_argument('--zoom', type=int, default=14)
+    args = parser.parse_args()
+
+    app = setup_app()
+    seed(app, users=args.users, pollutions=args.pollutions)
+
+    import geo
+    import tiles
+    from models import db, Pollution
+
+    client = app.test_client()
+    failed = False
+    z = args.zoom
+    cx, cy = geo.tile_xy(*TASHKENT, z)
+    # ~ a 400x700 px phone screen: 2 tiles wide, 3 tall
+    keys = [(z, x, y) for x in (cx, cx + 1) for y in (cy - 1, cy, cy + 1)]
+
+    started = time.perf_counter()
+    responses = {key: fetch(client, f'/api/tiles/{key[0]}/{key[1]}/{key[2]}.pbf') for key in keys}
+    cold_ms = (time.perf_counter() - started) * 1000 / len(keys)
+    started = time.perf_counter()
+    for key in keys:
+        fetch(client, f'/api/tiles/{key[0]}/{key[1]}/{key[2]}.pbf')
+    cached_ms = (time.perf_counter() - started) * 1000 / len(keys)
+    started = time.perf_counter()
+    for key in keys:
+        fetch(client, f'/api/tiles/{key[0]}/{key[1]}/{key[2]}.pbf',
+              {'If-None-Match': responses[key][0].headers['ETag']})
+    revalidate_ms = (time.perf_counter() - started) * 1000 / len(keys)
+
+    points = 0
+    with app.app_context():
+        for key, (response, data) in responses.items():
+            decoded = decode_features(data)
+            start, end = tiles._range(*key)
+            expected = {p.id: p for p in Pollution.query.filter(
+                Pollution.status == 'active', Pollution.geo_cell >= start, Pollution.geo_cell < end)}
+            points += len(decoded)
+            if set(decoded) != set(expected):
+                print(f'tile {key}: {len(decoded)} features, {len(expected)} active reports')
+                failed = True
+            for p_id, attrs in decoded.items():
+                p = expected.get(p_id)
+                if p and (attrs['level'] != p.level or attrs['types'] != ','.join(p.types)):
+                    print(f'tile {key}: wrong attributes for pollution {p_id}')
+                    failed = True
+
+    _, full = fetch(client, '/api/pollutions')
+    tile_bytes = sum(len(data) for _, data in responses.values())
+
+    # A new report inside a cached tile must show up, a cleaned one disappear
+    z_, x, y = keys[2]
+    min_lng, min_lat, max_lng, max_lat = geo.tile_bounds(x, y, z_)
+    lat, lng = (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+    response = client.post('/api/pollutions', json={
+        'lat': lat, 'lng': lng, 'level': 3, 'types': ['plastic'], 'photos': []}, headers=session_headers(1))
+    new_id = response.get_json()['id']
+    url = f'/api/tiles/{z_}/{x}/{y}.pbf'
+    after_report = decode_features(fetch(client, url)[1])
+    coarse = geo.tile_xy(lat, lng, tiles.MIN_ZOOM)
+    coarse_after = decode_features(fetch(client, f'/api/tiles/{tiles.MIN_ZOOM}/{coarse[0]}/{coarse[1]}.pbf')[1])
+    client.post(f'/api/pollutions/{new_id}/clean', json={'photos': []}, headers=session_headers(2))
+    after_clean = decode_features(fetch(client, url)[1])
+    invalidation_ok = new_id in after_report and new_id in coarse_after and new_id not in after_clean
+    failed |= not invalidation_ok
+
+    with app.app_context():
+        db.session.remove()
+    print(json.dumps({
+        'zoom': z,
+        'tiles': len(keys),
+        'points_in_viewport': points,
+        'tile_bytes': tile_bytes,
+        'full_listing_bytes': len(full),
+        'cold_ms_per_tile': round(cold_ms, 2),
+        'cached_ms_per_tile': round(cached_ms, 2),
+        'revalidate_ms_per_tile': round(revalidate_ms, 2),
+        'invalidation_ok': invalidation_ok,
+        'encoder': 'postgis' if tiles.POSTGIS == '1' else 'python',
+    }, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""Shared helpers: a throwaway database and fast synthetic data seeding."""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Uzbekistan bounding box and the Tashkent area most reports come from
+COUNTRY_BBOX = (55.9, 37.1, 73.2, 45.6)
+TASHKENT = (41.2995, 69.2401)
+TYPES = ['plastic', 'glass', 'paper', 'metal', 'organic', 'other']
+
+
+def setup_app(database_url=None):
+    """Imports the Flask app bound to a fresh database and creates the schema.
+
+    Must be called before anything else imports app/models.
+    """
+    workdir = tempfile.mkdtemp(prefix='ecopatrol-bench-')
+    if database_url is None:
+        database_url = f'sqlite:///{os.path.join(workdir, "bench.db")}'
+    # Cached tiles and stored photos belong to this database only
+    os.environ.setdefault('TILE_CACHE_DIR', os.path.join(workdir, 'tiles'))
+    os.environ.setdefault('PHOTO_DIR', os.path.join(workdir, 'photos'))
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('BOT_TOKEN', '0:benchmark')
+    from app import app
+    from models import db
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def random_point(rng, local_share=0.3):
+    """A point in Uzbekistan; local_share of them cluster around Tashkent."""
+    if rng.random() < local_share:
+        return TASHKENT[0] + rng.gauss(0, 0.05), TASHKENT[1] + rng.gauss(0, 0.07)
+    min_lng, min_lat, max_lng, max_lat = COUNTRY_BBOX
+    return rng.uniform(min_lat, max_lat), rng.uniform(min_lng, max_lng)
+
+
+def seed(app, users=1000, pollutions=10000, photos_per_pollution=1,
+         cleaned_share=0.3, seed_value=42, chunk=20000):
+    """Bulk-inserts synthetic rows through Core inserts (bypassing the ORM)."""
+    import geo
+    from models import db, User, Pollution, Photo
+
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    with app.app_context():
+        user_base = db.session.query(db.func.max(User.id)).scalar() or 0
+        rows = []
+        for i in range(1, users + 1):
+            lat, lng = random_point(rng)
+            rows.append({
+                'id': user_base + i, 'telegram_id': 10_000_000 + user_base + i,
+                'username': f'user{user_base + i}', 'first_name': 'Bench',
+                'phone': '+998900000000', 'age': 25, 'language': 'ru',
+                'balance': float(rng.randint(0, 20000)), 'lat': lat, 'lng': lng,
+                'geo_cell': geo.quadkey(lat, lng), 'last_seen_at': now, 'created_at': now,
+            })
+            if len(rows) >= chunk:
+                db.session.execute(User.__table__.insert(), rows)
+                rows = []
+        if rows:
+            db.session.execute(User.__table__.insert(), rows)
+        db.session.commit()
+
+        p_base = db.session.query(db.func.max(Pollution.id)).scalar() or 0
+        user_ids = range(user_base + 1, user_base + users + 1)
+        p_rows, ph_rows = [], []
+
+        def flush():
+            if p_rows:
+                db.session.execute(Pollution.__table__.insert(), p_rows)
+            if ph_rows:
+                db.session.execute(Photo.__table__.insert(), ph_rows)
+            db.session.commit()
+            p_rows.clear()
+            ph_rows.clear()
+
+        for i in range(1, pollutions + 1):
+            pid = p_base + i
+            lat, lng = random_point(rng)
+            cleaned = rng.random() < cleaned_share
+            level = rng.randint(1, 3)
+            p_rows.append({
+                'id': pid, 'user_id': rng.choice(user_ids), 'lat': lat, 'lng': lng,
+                'level': level, 'types': rng.sample(TYPES, rng.randint(1, 2)),
+                'description': 'synthetic', 'status': 'cleaned' if cleaned else 'active',
+                'reward': float(level), 'cleaner_id': rng.choice(user_ids) if cleaned else None,
+                'created_at': now - timedelta(minutes=i), 'geo_cell': geo.quadkey(lat, lng),
+                'cleaned_at': now - timedelta(minutes=i) + timedelta(hours=pid % 72 + 1) if cleaned else None,
+            })
+            for _ in range(photos_per_pollution):
+                ph_rows.append({'pollution_id': pid, 'url': f'https://example.com/{pid}.jpg',
+                                'type': 'before', 'created_at': now})
+            if len(p_rows) >= chunk:
+                flush()
+        flush()
+
+
+def init_data(telegram_id, auth_date=None, **user):
+    """Telegram initData for a user, signed with the app's BOT_TOKEN like the Mini App gets it."""
+    import hashlib
+    import hmac
+    import json
+    from urllib.parse import urlencode
+    import auth
+
+    fields = {
+        'auth_date': str(int(time.time() if auth_date is None else auth_date)),
+        'query_id': 'AAbench',
+        'user': json.dumps({'id': telegram_id, 'first_name': 'Bench', **user}, separators=(',', ':')),
+    }
+    check_string = '\n'.join(f'{k}={v}' for k, v in sorted(fields.items()))
+    secret = hmac.new(b'WebAppData', auth.BOT_TOKEN.encode(), hashlib.sha256).digest()
+    fields['hash'] = hmac.new(secret, check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+def session_headers(user_id, telegram_id=None, language='ru'):
+    """Authorization header with a session token, as /api/init would issue it."""
+    from types import SimpleNamespace
+    import auth
+
+    if telegram_id is None:
+        telegram_id = 10_000_000 + user_id
+    user = SimpleNamespace(id=user_id, telegram_id=telegram_id, language=language)
+    return {'Authorization': f'Bearer {auth.issue(user)}'}
+
+
+def admin_headers():
+    import auth
+
+    return session_headers(0, telegram_id=auth.ADMIN_IDS[0])
+
+
+def measure(fn, repeat=20, warmup=2):
+    """Runs fn repeatedly and returns latency stats in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+    }
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+        self.parameters = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+        self.parameters.append(parameters)
+
+
+@contextmanager
+def count_queries(app):
+    """Counts SQL statements sent to the app's engine inside the block."""
+    from sqlalchemy import event
+    from models import db
+
+    counter = QueryCounter()
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter)
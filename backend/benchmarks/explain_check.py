@@ -0,0 +1,138 @@
+"""Fails if an endpoint's SQL falls back to a sequential scan.
+
+    python -m benchmarks.explain_check [--database-url postgresql://...]
+
+Requests every read endpoint, captures the statements it sends and EXPLAINs
+each SELECT on the same database. SQLite plans are checked for a bare
+"SCAN <table>". On PostgreSQL, enable_seqscan is switched off first, so a
+remaining Seq Scan means no index can serve the query at all. The
+schema is brought up with migrate_all, so revision indexes are in place.
+Exits with status 1 on any unexpected scan; tests/test_explain.py runs the
+same check under pytest.
+"""
+import argparse
+import json
+import re
+import sys
+
+from benchmarks.common import TASHKENT, admin_headers, init_data, setup_app, seed, count_queries
+
+# Tiny key/value tables where a scan is the cheapest plan
+SMALL_TABLES = {'stat_counters', 'global_settings', 'version_counters', 'schema_migrations'}
+
+
+def endpoint_urls():
+    """name -> (url, tables allowed to be scanned on purpose)"""
+    import geo
+
+    tile_x, tile_y = geo.tile_xy(*TASHKENT, 14)
+    return {
+        'init': ('/api/init', set()),
+        'get_pollutions': ('/api/pollutions', set()),
+        'get_pollutions_bbox': ('/api/pollutions?bbox=69.1,41.2,69.4,41.4', set()),
+        'get_pollution': ('/api/pollutions/1', set()),
+        'get_tile': (f'/api/tiles/14/{tile_x}/{tile_y}.pbf', set()),
+        'get_pollution_changes': ('/api/pollutions/changes?since=0', set()),
+        'get_pollution_clusters': ('/api/pollutions/clusters?zoom=8&bbox=55.9,37.1,73.2,45.6', set()),
+        'get_public_stats': ('/api/stats/public', set()),
+        'get_user_history': ('/api/history/user/1', set()),
+        'get_user_pollutions': ('/api/pollutions/user/1', set()),
+        'get_profile': ('/api/profile/1', set()),
+        'get_leaderboard': ('/api/leaderboard', set()),
+        'get_config': ('/api/config', set()),
+        # Full export of the users table by design
+        'admin_get_users': ('/api/admin/users', {'users'}),
+        'admin_get_pollutions': ('/api/admin/pollutions', set()),
+        'admin_get_pollutions_active': ('/api/admin/pollutions?status=active', set()),
+        'admin_get_pollutions_reward': ('/api/admin/pollutions?sort=reward', set()),
+        'admin_get_pollutions_level': ('/api/admin/pollutions?sort=level&order=asc', set()),
+        'admin_get_stats': ('/api/admin/stats', set()),
+        'admin_get_analytics': ('/api/admin/analytics', set()),
+        'admin_get_analytics_region': ('/api/admin/analytics?granularity=week&dimension=region', set()),
+    }
+
+
+def sqlite_scans(conn, statement, parameters):
+    rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+    scans = set()
+    for row in rows:
+        detail = row[-1]
+        match = re.match(r'SCAN (\w+)(?: AS (\w+))?', detail)
+        if match and 'USING' not in detail:
+            scans.add(match.group(1))
+    return scans
+
+
+def postgres_scans(conn, statement, parameters):
+    conn.exec_driver_sql('SET enable_seqscan = off')
+    plan = conn.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {statement}', parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans = set()
+
+    def walk(node):
+        if node.get('Node Type') == 'Seq Scan':
+            scans.add(node['Relation Name'])
+        for child in node.get('Plans', []):
+            walk(child)
+    walk(plan[0]['Plan'])
+    return scans
+
+
+def unexpected_scans(app):
+    """Requests every endpoint; returns {name: (HTTP status, tables scanned without need)}."""
+    from models import db
+
+    with app.app_context():
+        engine = db.engine
+    explain = postgres_scans if engine.dialect.name == 'postgresql' else sqlite_scans
+
+    client = app.test_client()
+    results = {}
+    for name, (url, allowed) in endpoint_urls().items():
+        with count_queries(app) as counter:
+            if name == 'init':
+                response = client.post(url, json={'initData': init_data(10_000_001)})
+            else:
+                response = client.get(url, headers=admin_headers() if name.startswith('admin_') else None)
+            response.get_data()
+            response.close()
+        scans = set()
+        if response.status_code == 200:
+            with engine.connect() as conn:
+                for statement, parameters in zip(counter.statements, counter.parameters):
+                    if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+                        scans |= explain(conn, statement, parameters)
+                conn.rollback()
+        results[name] = (response.status_code, scans - allowed - SMALL_TABLES)
+    return results
+
+
+def prepare(app):
+    """Seeds the database and brings the schema up with migrate_all."""
+    import migrate_all
+
+    seed(app, users=300, pollutions=3000, photos_per_pollution=1, cleaned_share=0.4)
+    with app.app_context():
+        migrate_all.migrate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    app = setup_app(args.database_url)
+    prepare(app)
+    failed = False
+    for name, (status, bad) in unexpected_scans(app).items():
+        if status != 200:
+            print(f'{name:30} HTTP {status}')
+        else:
+            print(f'{name:30} {"SEQ SCAN on " + ", ".join(sorted(bad)) if bad else "ok"}')
+        failed |= status != 200 or bool(bad)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""A local stand-in for the Telegram Bot API.
+
+    python -m benchmarks.fake_telegram --port 8081 --throttle-rate 0.1
+
+Point the notifier at it with TELEGRAM_API_URL=http://127.0.0.1:8081/bot{0}/{1}.
+sendMessage calls are recorded; a share of them can be answered with 429 and
+a retry_after, and chat ids listed in blocked_chats get a 403. Every call of
+any method is counted in calls and waits latency seconds.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeTelegram:
+    def __init__(self, port=0, throttle_rate=0.0, retry_after=1, blocked_chats=(), latency=0.0, seed=1):
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.blocked_chats = {str(c) for c in blocked_chats}
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.messages = []  # (monotonic time, chat_id, text)
+        self.calls = {}  # method -> count
+        self.rejected = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.thread = None
+
+    @property
+    def api_url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/bot{{0}}/{{1}}'
+
+    def _reply(self, chat_id, text):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            if chat_id in self.blocked_chats:
+                self.rejected += 1
+                return 403, {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'}
+            if self.rng.random() < self.throttle_rate:
+                self.rejected += 1
+                return 429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                             'parameters': {'retry_after': self.retry_after}}
+            self.messages.append((time.monotonic(), chat_id, text))
+            message_id = len(self.messages)
+        return 200, {'ok': True, 'result': {
+            'message_id': message_id, 'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'}, 'text': text,
+        }}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    body = self.rfile.read(length).decode()
+                    if self.headers.get('Content-Type', '').startswith('application/json'):
+                        params.update(json.loads(body))
+                    else:
+                        params.update({k: v[0] for k, v in parse_qs(body).items()})
+                method = url.path.rsplit('/', 1)[-1]
+                with fake.lock:
+                    fake.calls[method] = fake.calls.get(method, 0) + 1
+                if method == 'sendMessage':
+                    status, payload = fake._reply(str(params.get('chat_id')), params.get('text', ''))
+                else:
+                    if fake.latency:
+                        time.sleep(fake.latency)
+                    status, payload = 200, {'ok': True, 'result': True}
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _handle
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+    fake = FakeTelegram(port=args.port, throttle_rate=args.throttle_rate, latency=args.latency)
+    print(f'Fake Bot API listening, TELEGRAM_API_URL={fake.api_url}')
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+"""Replays the Mini App's traffic mix and reports latency, throughput and query counts.
+
+    python -m benchmarks.loadtest --users 5000 --pollutions 50000 --seconds 20 --output run.json
+    python -m benchmarks.loadtest --database-url sqlite:////tmp/eco-1m.db --no-seed --output big.json
+    python -m benchmarks.loadtest --compare before.json after.json
+
+Client threads pick operations at random by weight, the way main.js calls
+the API: opening the app (init + config), location heartbeats every few
+seconds, loading the map (a viewport listing, delta sync, clusters when
+zoomed out), reporting and cleaning a pollution, the leaderboard, the
+profile and the public stats. --mix overrides weights, e.g.
+--mix heartbeat=0,report=20.
+
+Requests run in-process through the Flask test client, so SQL statements
+can be attributed to the operation that sent them (statements from the
+heartbeat flusher thread are listed under "background"). The report is
+JSON: per operation count, failures, p50/p95/p99/mean latency and queries
+per request, plus overall throughput. --compare prints p95 and throughput
+changes between two saved reports.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+
+from benchmarks.common import TYPES, init_data, random_point, session_headers, setup_app
+
+# Relative frequency of each operation in a typical session
+MIX = {
+    'init': 8,
+    'config': 4,
+    'heartbeat': 30,
+    'map_load': 10,
+    'map_changes': 12,
+    'clusters': 6,
+    'stats_public': 4,
+    'leaderboard': 5,
+    'profile': 6,
+    'report': 3,
+    'clean': 2,
+}
+
+
+class Ids:
+    """Ids the operations pick from; reports add pollutions, cleans take them."""
+
+    def __init__(self, user_ids, active_ids):
+        self.lock = threading.Lock()
+        self.user_ids = user_ids
+        self.active_ids = active_ids
+
+    def add_active(self, p_id):
+        with self.lock:
+            self.active_ids.append(p_id)
+
+    def take_active(self, rng):
+        with self.lock:
+            if not self.active_ids:
+                return None
+            i = rng.randrange(len(self.active_ids))
+            self.active_ids[i], self.active_ids[-1] = self.active_ids[-1], self.active_ids[i]
+            return self.active_ids.pop()
+
+
+def viewport(rng, span=0.04):
+    lat, lng = random_point(rng, local_share=0.8)
+    return f'{lng - span:.4f},{lat - span:.4f},{lng + span:.4f},{lat + span:.4f}'
+
+
+def operations(ids):
+    """name -> fn(client, rng, state) returning the response."""
+
+    def init(client, rng, state):
+        return client.post('/api/init', json={'initData': init_data(10_000_000 + rng.choice(ids.user_ids))})
+
+    def heartbeat(client, rng, state):
+        lat, lng = random_point(rng, local_share=0.8)
+        return client.post('/api/user/location', json={'lat': lat, 'lng': lng},
+                           headers=session_headers(rng.choice(ids.user_ids)))
+
+    def map_load(client, rng, state):
+        response = client.get(f'/api/pollutions?bbox={viewport(rng)}')
+        state['cursor'] = response.headers.get('X-Sync-Cursor', state.get('cursor', '0'))
+        return response
+
+    def map_changes(client, rng, state):
+        response = client.get(f'/api/pollutions/changes?since={state.get("cursor", "0")}')
+        if response.status_code == 200:
+            state['cursor'] = response.get_json()['cursor']
+        return response
+
+    def clusters(client, rng, state):
+        return client.get(f'/api/pollutions/clusters?zoom={rng.randint(5, 10)}&bbox={viewport(rng, span=2)}')
+
+    def report(client, rng, state):
+        lat, lng = random_point(rng, local_share=0.8)
+        response = client.post('/api/pollutions', json={
+            'lat': lat, 'lng': lng, 'level': rng.randint(1, 3),
+            'types': rng.sample(TYPES, 2), 'description': 'loadtest',
+            'photos': [f'https://example.com/loadtest/{rng.getrandbits(32)}.jpg'],
+        }, headers=session_headers(rng.choice(ids.user_ids)))
+        if response.status_code == 200:
+            ids.add_active(response.get_json()['id'])
+        return response
+
+    def clean(client, rng, state):
+        p_id = ids.take_active(rng)
+        if p_id is None:
+            return None
+        return client.post(f'/api/pollutions/{p_id}/clean', json={
+            'comment': 'loadtest',
+            'photos': [f'https://example.com/loadtest/{rng.getrandbits(32)}.jpg'],
+        }, headers=session_headers(rng.choice(ids.user_ids)))
+
+    def get(url):
+        return lambda client, rng, state: client.get(url(rng) if callable(url) else url)
+
+    return {
+        'init': init,
+        'config': get('/api/config'),
+        'heartbeat': heartbeat,
+        'map_load': map_load,
+        'map_changes': map_changes,
+        'clusters': clusters,
+        'stats_public': get('/api/stats/public'),
+        'leaderboard': get('/api/leaderboard'),
+        'profile': get(lambda rng: f'/api/profile/{rng.choice(ids.user_ids)}'),
+        'report': report,
+        'clean': clean,
+    }
+
+
+class Recorder:
+    """Latencies per operation and SQL statements per operation (thread-attributed)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.latencies = {}
+        self.failures = {}
+        self.queries = {}
+
+    def on_execute(self, *args):
+        name = getattr(self.local, 'operation', None) or 'background'
+        with self.lock:
+            self.queries[name] = self.queries.get(name, 0) + 1
+
+    def run(self, name, fn):
+        self.local.operation = name
+        started = time.perf_counter()
+        try:
+            response = fn()
+            if response is None:
+                return
+            response.get_data()
+            response.close()
+            ok = response.status_code < 400
+        finally:
+            self.local.operation = None
+        elapsed = (time.perf_counter() - started) * 1000
+        with self.lock:
+            if ok:
+                self.latencies.setdefault(name, []).append(elapsed)
+            else:
+                self.failures[name] = self.failures.get(name, 0) + 1
+
+    def report(self, elapsed):
+        result = {}
+        for name in sorted(set(self.latencies) | set(self.failures) | set(self.queries)):
+            samples = sorted(self.latencies.get(name, []))
+            count = len(samples) + self.failures.get(name, 0)
+            entry = {'requests': count, 'failed': self.failures.get(name, 0)}
+            if samples:
+                entry.update({
+                    'p50_ms': round(samples[len(samples) // 2], 2),
+                    'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+                    'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 2),
+                    'mean_ms': round(sum(samples) / len(samples), 2),
+                })
+            if count:
+                entry['queries_per_request'] = round(self.queries.get(name, 0) / count, 2)
+            else:
+                entry['queries'] = self.queries.get(name, 0)
+            result[name] = entry
+        total = sum(e['requests'] for e in result.values())
+        return {
+            'seconds': round(elapsed, 2),
+            'requests': total,
+            'throughput_rps': round(total / elapsed, 1),
+            'failed': sum(e['failed'] for e in result.values()),
+            'operations': result,
+        }
+
+
+def parse_mix(text):
+    mix = dict(MIX)
+    for part in filter(None, (text or '').split(',')):
+        name, _, weight = part.partition('=')
+        if name not in MIX:
+            raise SystemExit(f'Unknown operation in --mix: {name}')
+        mix[name] = float(weight)
+    return mix
+
+
+def load_ids(app):
+    from models import db, User, Pollution
+
+    with app.app_context():
+        user_ids = [row[0] for row in db.session.query(User.id)]
+        active_ids = [row[0] for row in db.session.query(Pollution.id).filter(Pollution.status == 'active')]
+    return Ids(user_ids, active_ids)
+
+
+def run(app, mix, threads, seconds, seed_value=1):
+    from sqlalchemy import event
+    from models import db
+    import heartbeats
+
+    ids = load_ids(app)
+    ops = operations(ids)
+    names = [name for name in mix if mix[name] > 0]
+    weights = [mix[name] for name in names]
+    recorder = Recorder()
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', recorder.on_execute)
+    deadline = time.perf_counter() + seconds
+
+    def worker(i):
+        rng = random.Random(seed_value * 1000 + i)
+        client = app.test_client()
+        state = {}
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            recorder.run(name, lambda: ops[name](client, rng, state))
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    try:
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - started
+        heartbeats.flush_now()
+    finally:
+        event.remove(engine, 'before_cursor_execute', recorder.on_execute)
+    return recorder.report(elapsed)
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    def change(old, new):
+        if not old or new is None:
+            return '-'
+        return f'{(new - old) / old * 100:+.0f}%'
+
+    print(f'{"operation":14} {"p95 before":>11} {"p95 after":>10} {"change":>7} {"q/req":>11}')
+    for name in sorted(set(before['operations']) | set(after['operations'])):
+        old = before['operations'].get(name, {})
+        new = after['operations'].get(name, {})
+        queries = f'{old.get("queries_per_request", "-")} -> {new.get("queries_per_request", "-")}'
+        print(f'{name:14} {old.get("p95_ms", "-"):>11} {new.get("p95_ms", "-"):>10} '
+              f'{change(old.get("p95_ms"), new.get("p95_ms")):>7} {queries:>11}')
+    print(f'{"throughput":14} {before["throughput_rps"]:>11} {after["throughput_rps"]:>10} '
+          f'{change(before["throughput_rps"], after["throughput_rps"]):>7}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    parser.add_argument('--no-seed', action='store_true', help='use the data already in --database-url')
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--pollutions', type=int, default=50000)
+    parser.add_argument('--photos-per-pollution', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--mix', help='name=weight,... overrides, see MIX')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    app = setup_app(args.database_url)
+    dataset = {'users': None, 'pollutions': None}
+    if not args.no_seed:
+        from benchmarks.seed import seed_database
+        dataset = {'users': args.users, 'pollutions': args.pollutions,
+                   **seed_database(app, args.users, args.pollutions, args.photos_per_pollution)}
+
+    with app.app_context():
+        from models import db
+        dialect = db.engine.dialect.name
+    report = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'database': dialect,
+        'dataset': dataset,
+        'threads': args.threads,
+        'mix': parse_mix(args.mix),
+    }
+    report.update(run(app, report['mix'], args.threads, args.seconds))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+    sys.exit(1 if report['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Fails if a listing endpoint sends more statements than its fixed budget.
+
+    python -m benchmarks.query_budget
+
+Each listing is requested against a small dataset and one spanning several
+streaming.YIELD_PER chunks. Its budget does not depend on the number of
+rows, except for the photos of listings that selectinload them: SQLAlchemy
+loads those with one IN query per SELECTIN_BATCH rows of each chunk. An N+1
+pattern goes over the budget. Exits with status 1 on any overrun, so it
+can gate a deploy; tests/test_query_budget.py runs the same check under
+pytest.
+"""
+import math
+import sys
+
+import streaming
+from benchmarks.common import admin_headers, setup_app, seed, count_queries
+
+# Statements per listing, besides the photo loads below
+BUDGETS = {
+    'get_pollutions': 2,
+    'get_pollutions_bbox': 2,
+    'get_user_pollutions': 1,
+    'get_user_history': 1,
+    'admin_get_pollutions': 1,
+    'admin_get_users': 1,
+    'admin_get_analytics': 1,
+    'get_leaderboard': 1,
+}
+# Listings that selectinload photos, with the rows they fetch at a time
+# (None: all at once)
+PHOTO_CHUNKS = {
+    'get_pollutions': streaming.YIELD_PER,
+    'get_pollutions_bbox': streaming.YIELD_PER,
+    'get_user_pollutions': None,
+    'get_user_history': None,
+    'admin_get_pollutions': streaming.YIELD_PER,
+}
+# Parent rows per IN query of SQLAlchemy's selectinload
+SELECTIN_BATCH = 500
+
+
+def listing_urls():
+    return {
+        'get_pollutions': '/api/pollutions',
+        'get_pollutions_bbox': '/api/pollutions?bbox=55.9,37.1,73.2,45.6',
+        'get_user_pollutions': '/api/pollutions/user/1',
+        'get_user_history': '/api/history/user/1',
+        'admin_get_pollutions': '/api/admin/pollutions',
+        'admin_get_users': '/api/admin/users',
+        'admin_get_analytics': '/api/admin/analytics?granularity=week&dimension=type',
+        'get_leaderboard': '/api/leaderboard',
+    }
+
+
+def budget(name, rows):
+    """Statements allowed for a listing that returned the given number of rows."""
+    allowed = BUDGETS[name]
+    if name in PHOTO_CHUNKS:
+        chunk = PHOTO_CHUNKS[name] or max(rows, 1)
+        for start in range(0, rows, chunk):
+            allowed += math.ceil(min(chunk, rows - start) / SELECTIN_BATCH)
+    return allowed
+
+
+def run_counts(app):
+    """{name: (statements, budget)} for every listing."""
+    client = app.test_client()
+    counts = {}
+    for name, url in listing_urls().items():
+        with count_queries(app) as counter:
+            response = client.get(url, headers=admin_headers() if name.startswith('admin_') else None)
+            # Streaming listings only query while the body is consumed
+            data = response.get_json()
+            response.close()
+        assert response.status_code == 200, f'{name}: HTTP {response.status_code}'
+        rows = data if isinstance(data, list) else data.get('items', ())
+        counts[name] = (counter.count, budget(name, len(rows)))
+    return counts
+
+
+def main():
+    app = setup_app()
+    failed = False
+    for pollutions, seed_value in ((40, 42), (2500, 7)):
+        seed(app, users=20, pollutions=pollutions, photos_per_pollution=2, cleaned_share=0.2,
+             seed_value=seed_value)
+        print(f'after seeding {pollutions} pollutions:')
+        for name, (count, allowed) in run_counts(app).items():
+            status = 'ok' if count <= allowed else 'over budget'
+            failed |= status != 'ok'
+            print(f'  {name:24} {count:4} of {allowed:4} queries  {status}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
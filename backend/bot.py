@@ -1,15 +1,65 @@
+import logging
 import os
 import telebot
-from telebot import types
+from telebot import apihelper, types, util
 from dotenv import load_dotenv
 
 load_dotenv()
 
+import auth  # ADMIN_IDS, shared with the API's admin role
+import webhook  # reads BOT_WEBHOOK_* from the environment loaded above
+
 BOT_TOKEN = os.getenv('BOT_TOKEN', 'YOUR_BOT_TOKEN')
 MINI_APP_URL = os.getenv('MINI_APP_URL', 'https://your-mini-app-url.com')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+log = logging.getLogger('ecopatrol')
+
+if TELEGRAM_API_URL:
+    apihelper.API_URL = TELEGRAM_API_URL
+
+# With a webhook the handlers run on webhook.Dispatcher's pool, without one
+# on telebot's own polling threads
+bot = telebot.TeleBot(BOT_TOKEN, threaded=not webhook.WEBHOOK_URL, num_threads=webhook.WORKERS)
+ADMIN_IDS = auth.ADMIN_IDS
+
+LANGUAGE_PROMPT = "Выберите язык / Tilni tanlang / Choose language:"
+
+WELCOME_MESSAGES = {
+    'uz': "Salom! 👋\n\n**Eko-patrul**ga xush kelibsiz — sayyoramizni qutqarish uchun sizning vositangiz.\n\n📍 Axlatni xaritada belgilang.\n🧹 Tozalash ishlarini bajaring.\n💰 Mukofotlar oling.\n\nBoshlash uchun pastdagi tugmani bosing!",
+    'ru': "Привет! 👋\n\nДобро пожаловать в **Экопатруль** — твой инструмент для спасения планеты.\n\n📍 Отмечай мусор на карте.\n🧹 Убирай загрязнения.\n💰 Получай виртуальные награды.\n\nНажми на кнопку ниже, чтобы начать!",
+    'en': "Hello! 👋\n\nWelcome to **EcoPatrol** — your tool for saving the planet.\n\n📍 Mark litter on the map.\n🧹 Clean up pollutions.\n💰 Earn virtual rewards.\n\nClick the button below to start!"
+}
 
-bot = telebot.TeleBot(BOT_TOKEN)
-ADMIN_IDS = [5644397480]
+BUTTON_TEXTS = {
+    'uz': "Eko-patrulni ochish 🌍",
+    'ru': "Открыть Экопатруль 🌍",
+    'en': "Open EcoPatrol 🌍"
+}
+
+
+def build_markups():
+    """Keyboards as ready JSON, built once: telebot sends a str reply_markup as is."""
+    languages = types.InlineKeyboardMarkup(row_width=1)
+    languages.add(
+        types.InlineKeyboardButton("🇺🇿 O'zbekcha", callback_data="lang_uz"),
+        types.InlineKeyboardButton("🇷🇺 Русский", callback_data="lang_ru"),
+        types.InlineKeyboardButton("🇬🇧 English", callback_data="lang_en"),
+    )
+    welcome = {}
+    for lang, text in BUTTON_TEXTS.items():
+        markup = types.InlineKeyboardMarkup()
+        markup.add(types.InlineKeyboardButton(text, web_app=types.WebAppInfo(MINI_APP_URL)))
+        welcome[lang] = markup.to_json()
+    admin = types.InlineKeyboardMarkup()
+    # The panel authenticates with Telegram's signed initData, see auth.py
+    admin.add(types.InlineKeyboardButton("Открыть Админ-панель 🛠️",
+                                         web_app=types.WebAppInfo(f"{MINI_APP_URL}/admin.html")))
+    return languages.to_json(), welcome, admin.to_json()
+
+
+LANGUAGE_MARKUP, WELCOME_MARKUPS, ADMIN_MARKUP = build_markups()
 
 @bot.message_handler(commands=['admin'])
 def admin_command(message):
@@ -17,66 +67,61 @@ def admin_command(message):
         bot.reply_to(message, "У вас нет прав доступа к этой команде. ⛔")
         return
 
-    markup = types.InlineKeyboardMarkup()
-    # Using a query param to "authenticate" on the frontend side for now
-    web_app = types.WebAppInfo(f"{MINI_APP_URL}/admin.html?admin_tg_id={message.from_user.id}")
-    btn = types.InlineKeyboardButton("Открыть Админ-панель 🛠️", web_app=web_app)
-    markup.add(btn)
-
     bot.send_message(
         message.chat.id,
         "Добро пожаловать в панель управления, Шеф! 😎\n\nЗдесь вы можете управлять пользователями и загрязнениями.",
-        reply_markup=markup
+        reply_markup=ADMIN_MARKUP
     )
 
 @bot.message_handler(commands=['start'])
 def start(message):
-    print(f"--- BOT START --- User ID: {message.from_user.id}, Username: @{message.from_user.username}, Name: {message.from_user.first_name}")
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    btn_uz = types.InlineKeyboardButton("🇺🇿 O'zbekcha", callback_data="lang_uz")
-    btn_ru = types.InlineKeyboardButton("🇷🇺 Русский", callback_data="lang_ru")
-    btn_en = types.InlineKeyboardButton("🇬🇧 English", callback_data="lang_en")
-    markup.add(btn_uz, btn_ru, btn_en)
-    
-    bot.send_message(
-        message.chat.id, 
-        "Выберите язык / Tilni tanlang / Choose language:", 
-        reply_markup=markup
-    )
+    log.info("bot: /start from %s (@%s, %s)", message.from_user.id, message.from_user.username, message.from_user.first_name)
+    bot.send_message(message.chat.id, LANGUAGE_PROMPT, reply_markup=LANGUAGE_MARKUP)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('lang_'))
+@bot.callback_query_handler(func=lambda call: call.data in ('lang_uz', 'lang_ru', 'lang_en'))
 def set_language(call):
     lang_code = call.data.split('_')[1]
-    
-    # Text for different languages
-    welcome_messages = {
-        'uz': "Salom! 👋\n\n**Eko-patrul**ga xush kelibsiz — sayyoramizni qutqarish uchun sizning vositangiz.\n\n📍 Axlatni xaritada belgilang.\n🧹 Tozalash ishlarini bajaring.\n💰 Mukofotlar oling.\n\nBoshlash uchun pastdagi tugmani bosing!",
-        'ru': "Привет! 👋\n\nДобро пожаловать в **Экопатруль** — твой инструмент для спасения планеты.\n\n📍 Отмечай мусор на карте.\n🧹 Убирай загрязнения.\n💰 Получай виртуальные награды.\n\nНажми на кнопку ниже, чтобы начать!",
-        'en': "Hello! 👋\n\nWelcome to **EcoPatrol** — your tool for saving the planet.\n\n📍 Mark litter on the map.\n🧹 Clean up pollutions.\n💰 Earn virtual rewards.\n\nClick the button below to start!"
-    }
-    
-    btn_texts = {
-        'uz': "Eko-patrulni ochish 🌍",
-        'ru': "Открыть Экопатруль 🌍",
-        'en': "Open EcoPatrol 🌍"
-    }
-
-    markup = types.InlineKeyboardMarkup()
-    web_app = types.WebAppInfo(MINI_APP_URL)
-    btn = types.InlineKeyboardButton(btn_texts[lang_code], web_app=web_app)
-    markup.add(btn)
 
     bot.edit_message_text(
-        welcome_messages[lang_code],
+        WELCOME_MESSAGES[lang_code],
         call.message.chat.id,
         call.message.message_id,
-        reply_markup=markup,
+        reply_markup=WELCOME_MARKUPS[lang_code],
         parse_mode='Markdown'
     )
-    
+
     # Answer callback to remove loading state
     bot.answer_callback_query(call.id)
 
-if __name__ == '__main__':
-    print("Bot is starting...")
+
+def run_webhook():
+    """Registers BOT_WEBHOOK_URL with Telegram and serves it (see webhook.py)."""
+    server = webhook.WebhookServer(bot, path=webhook.path_of(webhook.WEBHOOK_URL))
+    try:
+        bot.set_webhook(url=webhook.WEBHOOK_URL, secret_token=webhook.SECRET or None,
+                        max_connections=webhook.WORKERS, allowed_updates=['message', 'callback_query'])
+    except Exception as e:
+        # E.g. no valid HTTPS certificate yet: keep the bot answering by polling
+        log.warning("bot: webhook registration failed (%s), falling back to polling", e)
+        server.stop()
+        bot.threaded = True
+        bot.worker_pool = util.ThreadPool(bot, num_threads=webhook.WORKERS)
+        run_polling()
+        return
+    log.info("bot: webhook listening on 127.0.0.1:%s%s", server.port, server.path)
+    server.serve_forever()
+
+
+def run_polling():
+    # A registered webhook makes getUpdates fail; polling takes over again
+    bot.remove_webhook()
+    log.info("bot: polling")
     bot.infinity_polling()
+
+
+if __name__ == '__main__':
+    log.info("bot: starting")
+    if webhook.WEBHOOK_URL:
+        run_webhook()
+    else:
+        run_polling()
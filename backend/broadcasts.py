@@ -0,0 +1,171 @@
+"""Broadcast jobs: one admin announcement fanned out to a user segment.
+
+The API only inserts a Broadcast row; the notifier worker (notifier.py) runs
+it with a BroadcastRunner. Recipients are streamed in users.id order with a
+server-side cursor, sent through a thread pool that shares the outbox
+RateLimiter (so broadcasts and regular notifications together stay under
+Telegram's global limit), and progress is committed after every chunk. A
+worker that dies mid-broadcast resumes after last_user_id; at most one chunk
+can be delivered twice.
+"""
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+from telebot.apihelper import ApiTelegramException
+
+import geo
+from models import db, User, Broadcast
+from outbox import RateLimiter, PERMANENT_ERRORS, backoff
+
+SENDERS = int(os.getenv('BROADCAST_SENDERS', '8'))
+CHUNK_SIZE = int(os.getenv('BROADCAST_CHUNK_SIZE', '200'))
+MAX_ATTEMPTS = 3
+# A running broadcast whose progress has not moved for this long belongs to a
+# dead worker and is picked up again
+STALE_AFTER = timedelta(seconds=int(os.getenv('BROADCAST_STALE_SECONDS', '60')))
+
+
+log = logging.getLogger('ecopatrol')
+
+
+def _segment(broadcast):
+    conditions = [User.telegram_id.isnot(None)]
+    if broadcast.language:
+        conditions.append(User.language == broadcast.language)
+    if broadcast.radius_km:
+        min_lng, min_lat, max_lng, max_lat = geo.radius_bbox(
+            broadcast.center_lat, broadcast.center_lng, broadcast.radius_km)
+        conditions += [User.lat.between(min_lat, max_lat), User.lng.between(min_lng, max_lng)]
+    return conditions
+
+
+def _in_radius(broadcast, row):
+    if not broadcast.radius_km:
+        return True
+    return geo.distance_km(broadcast.center_lat, broadcast.center_lng, row.lat, row.lng) <= broadcast.radius_km
+
+
+def estimate(broadcast):
+    """Recipient count; the radius is approximated by its bounding box."""
+    return db.session.execute(select(func.count(User.id)).where(*_segment(broadcast))).scalar()
+
+
+def recipient_chunks(broadcast, chunk_size=CHUNK_SIZE):
+    """Yields lists of (id, telegram_id, lat, lng) rows after broadcast.last_user_id.
+
+    Only the bounding box of the radius is applied here; see _in_radius.
+    """
+    stmt = select(User.id, User.telegram_id, User.lat, User.lng).where(
+        User.id > broadcast.last_user_id, *_segment(broadcast)).order_by(User.id)
+    if db.engine.dialect.name != 'postgresql':
+        # SQLite cannot commit progress while another connection keeps a
+        # read cursor open, so page through the primary key instead
+        last_id = broadcast.last_user_id
+        while True:
+            rows = db.session.execute(stmt.where(User.id > last_id).limit(chunk_size)).all()
+            if not rows:
+                return
+            last_id = rows[-1].id
+            yield rows
+        return
+    # Named (server-side) cursor on its own connection; the session keeps
+    # committing progress on another one
+    with db.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(stmt)
+        for rows in result.partitions():
+            yield rows
+
+
+class BroadcastRunner:
+    def __init__(self, bot, limiter=None, senders=SENDERS, chunk_size=CHUNK_SIZE):
+        self.bot = bot
+        self.limiter = limiter or RateLimiter()
+        self.senders = senders
+        self.chunk_size = chunk_size
+
+    def _deliver(self, chat_id, text):
+        """Sends one message, retrying 429s and transient errors. Returns True if delivered."""
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            self.limiter.acquire()
+            try:
+                self.bot.send_message(chat_id, text)
+            except ApiTelegramException as e:
+                retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after')
+                self.limiter.sent(chat_id, retry_after=retry_after)
+                if e.error_code in PERMANENT_ERRORS:
+                    return False
+                if retry_after is None:
+                    time.sleep(min(backoff(attempt), 10.0))
+                continue
+            except Exception:
+                self.limiter.sent(chat_id)
+                time.sleep(min(backoff(attempt), 10.0))
+                continue
+            self.limiter.sent(chat_id)
+            return True
+        return False
+
+    def _claim(self):
+        stale = datetime.utcnow() - STALE_AFTER
+        query = Broadcast.query.filter(
+            (Broadcast.status == 'queued')
+            | ((Broadcast.status == 'running') & (Broadcast.updated_at < stale))
+        ).order_by(Broadcast.id).limit(1)
+        broadcast = query.with_for_update(skip_locked=True).first()
+        if broadcast is None:
+            db.session.rollback()
+            return None
+        if broadcast.status == 'queued':
+            broadcast.started_at = datetime.utcnow()
+        broadcast.status = 'running'
+        broadcast.updated_at = datetime.utcnow()
+        db.session.commit()
+        return broadcast
+
+    def run(self, broadcast):
+        """Sends broadcast to its remaining recipients, committing progress per chunk."""
+        text = broadcast.message
+        with ThreadPoolExecutor(max_workers=self.senders) as pool:
+            for rows in recipient_chunks(broadcast, self.chunk_size):
+                db.session.refresh(broadcast)
+                if broadcast.status == 'cancelled':
+                    return
+                started = time.perf_counter()
+                targets = [r for r in rows if _in_radius(broadcast, r)]
+                results = list(pool.map(lambda r: self._deliver(r.telegram_id, text), targets))
+                elapsed = time.perf_counter() - started
+                delivered = sum(results)
+                broadcast.sent += delivered
+                broadcast.failed += len(results) - delivered
+                broadcast.last_user_id = rows[-1].id
+                broadcast.current_rate = round(len(results) / elapsed, 1) if elapsed > 0 else 0.0
+                broadcast.updated_at = datetime.utcnow()
+                db.session.commit()
+        db.session.refresh(broadcast)
+        if broadcast.status == 'running':
+            broadcast.status = 'done'
+            broadcast.current_rate = 0.0
+            broadcast.finished_at = broadcast.updated_at = datetime.utcnow()
+            db.session.commit()
+
+    def run_once(self):
+        """Runs the next pending broadcast to completion. Returns False if there was none."""
+        broadcast = self._claim()
+        if broadcast is None:
+            return False
+        self.run(broadcast)
+        return True
+
+    def run_forever(self, idle_sleep=2.0):
+        while True:
+            try:
+                if not self.run_once():
+                    time.sleep(idle_sleep)
+            except Exception:
+                db.session.rollback()
+                log.exception("Broadcast runner failed")
+                time.sleep(idle_sleep)
@@ -0,0 +1,129 @@
+"""Delta sync for the map: which pollutions changed since a client's cursor.
+
+Every insert or update of a Pollution stamps it with the next value of the
+'pollutions' VersionCounter, and deletions leave a PollutionTombstone with a
+version from the same counter. A cursor is simply the last version a client
+has seen, so GET /api/pollutions/changes?since=<cursor> is two index range
+scans. Tombstones older than TOMBSTONE_RETENTION_DAYS are compacted away;
+cursors older than the compacted range get 410 and must reload the full list.
+"""
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.orm import selectinload
+
+from dbutil import increment
+from models import db, Pollution, PollutionTombstone, VersionCounter
+
+COUNTER = 'pollutions'
+# Highest tombstone version removed by compact(); older cursors are expired
+FLOOR = 'pollutions_compacted'
+RETENTION_DAYS = int(os.getenv('TOMBSTONE_RETENTION_DAYS', '30'))
+DEFAULT_LIMIT = 500
+
+
+class CursorExpired(Exception):
+    pass
+
+
+def next_version(connection=None):
+    return increment(VersionCounter.__table__, {'name': COUNTER}, 'value', connection)
+
+
+def reserve_versions(n):
+    """Hands out n consecutive versions at once, for rows written in bulk."""
+    last = increment(VersionCounter.__table__, {'name': COUNTER}, 'value', amount=n)
+    return range(last - n + 1, last + 1)
+
+
+@event.listens_for(Pollution, 'before_insert')
+@event.listens_for(Pollution, 'before_update')
+def _stamp_version(mapper, connection, target):
+    target.version = next_version(connection)
+
+
+def _counter(name):
+    value = db.session.execute(select(VersionCounter.value).where(VersionCounter.name == name)).scalar()
+    return value or 0
+
+
+def current_cursor():
+    return str(_counter(COUNTER))
+
+
+def parse_cursor(cursor):
+    try:
+        value = int(cursor)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if value < 0:
+        raise ValueError('Invalid cursor')
+    return value
+
+
+def tombstone(query):
+    """Records deletion of the pollutions matched by query. Call before deleting them.
+
+    Takes three statements however many rows match: the versions are
+    reserved in one increment, and tombstones are updated and inserted in bulk.
+    """
+    ids = [pid for (pid,) in query.with_entities(Pollution.id).all()]
+    if not ids:
+        return
+    now = datetime.utcnow()
+    # One version per row keeps versions unique, so pages never split one
+    rows = [{'pollution_id': pid, 'version': version, 'deleted_at': now}
+            for pid, version in zip(ids, reserve_versions(len(ids)))]
+    # A tombstone stays behind when a re-created id is deleted again
+    existing = set(db.session.scalars(
+        select(PollutionTombstone.pollution_id).where(PollutionTombstone.pollution_id.in_(ids))))
+    updates = [row for row in rows if row['pollution_id'] in existing]
+    inserts = [row for row in rows if row['pollution_id'] not in existing]
+    if updates:
+        db.session.execute(update(PollutionTombstone), updates)
+    if inserts:
+        db.session.execute(insert(PollutionTombstone), inserts)
+
+
+def since(cursor, limit=DEFAULT_LIMIT):
+    """Returns (changed pollutions, deleted ids, next cursor, has_more)."""
+    version = parse_cursor(cursor)
+    if version < _counter(FLOOR):
+        raise CursorExpired()
+    changed = Pollution.query.filter(Pollution.version > version).options(selectinload(Pollution.photos)) \
+        .order_by(Pollution.version).limit(limit + 1).all()
+    deleted = PollutionTombstone.query.filter(PollutionTombstone.version > version) \
+        .order_by(PollutionTombstone.version).limit(limit + 1).all()
+
+    # Merge both streams by version and cut at limit; versions are unique
+    # across them, so the cursor can point right after the last entry
+    entries = sorted([(p.version, p) for p in changed] + [(t.version, t) for t in deleted],
+                     key=lambda e: e[0])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    cursor = entries[-1][0] if entries else version
+    return (
+        [e for _, e in entries if isinstance(e, Pollution)],
+        [e.pollution_id for _, e in entries if isinstance(e, PollutionTombstone)],
+        str(cursor),
+        has_more,
+    )
+
+
+def compact(retention_days=RETENTION_DAYS):
+    """Drops tombstones older than the retention window. Returns how many were removed."""
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    old = PollutionTombstone.query.filter(PollutionTombstone.deleted_at < cutoff)
+    floor = old.with_entities(func.max(PollutionTombstone.version)).scalar()
+    if floor is None:
+        return 0
+    removed = PollutionTombstone.query.filter(PollutionTombstone.version <= floor) \
+        .delete(synchronize_session=False)
+    counter = db.session.get(VersionCounter, FLOOR)
+    if counter is None:
+        db.session.add(VersionCounter(name=FLOOR, value=floor))
+    else:
+        counter.value = max(counter.value, floor)
+    db.session.commit()
+    return removed
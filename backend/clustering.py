@@ -0,0 +1,87 @@
+"""Hierarchical grid of active pollutions for low zoom levels.
+
+Every active pollution is counted in one cell per depth in CLUSTER_DEPTHS,
+the cell being the prefix of its geo_cell quadkey. Writers call record() in
+the same transaction as the change, so reading clusters never has to look at
+the pollutions table and the payload size only depends on the viewport.
+"""
+from collections import defaultdict
+
+from sqlalchemy import and_, case, func, or_
+
+import geo
+from dbutil import upsert_add_many
+from models import db, Pollution, PollutionCluster
+
+CLUSTER_DEPTHS = range(4, 18)
+# A cell at depth zoom + GRID_OFFSET is ~1/8 of a 256px tile, i.e. ~32px
+GRID_OFFSET = 3
+LEVELS = (1, 2, 3)
+
+
+def depth_for_zoom(zoom):
+    return max(CLUSTER_DEPTHS.start, min(CLUSTER_DEPTHS.stop - 1, int(zoom) + GRID_OFFSET))
+
+
+def record(points, sign):
+    """Adds (sign=1) or removes (sign=-1) pollutions given as (lat, lng, level)."""
+    deltas = defaultdict(lambda: defaultdict(int))
+    for lat, lng, level in points:
+        key = geo.quadkey(lat, lng)
+        for depth in CLUSTER_DEPTHS:
+            cell = deltas[(depth, key[:depth])]
+            cell['count'] += sign
+            cell['lat_sum'] += sign * lat
+            cell['lng_sum'] += sign * lng
+            if level in LEVELS:
+                cell[f'level_{level}'] += sign
+    upsert_add_many(PollutionCluster.__table__, ('depth', 'cell'), [
+        {'depth': depth, 'cell': cell, 'count': 0, 'lat_sum': 0.0, 'lng_sum': 0.0,
+         **{f'level_{level}': 0 for level in LEVELS}, **values}
+        for (depth, cell), values in sorted(deltas.items())
+    ])
+
+
+def rebuild():
+    """Recomputes the whole grid from the pollutions table."""
+    db.session.query(PollutionCluster).delete()
+    for depth in CLUSTER_DEPTHS:
+        cell = func.substr(Pollution.geo_cell, 1, depth)
+        rows = [
+            {'depth': depth, 'cell': c, 'count': n, 'lat_sum': lat_sum, 'lng_sum': lng_sum,
+             'level_1': l1, 'level_2': l2, 'level_3': l3}
+            for c, n, lat_sum, lng_sum, l1, l2, l3 in db.session.query(
+                cell,
+                func.count(Pollution.id),
+                func.sum(Pollution.lat),
+                func.sum(Pollution.lng),
+                *[func.sum(case((Pollution.level == level, 1), else_=0)) for level in LEVELS],
+            ).filter(Pollution.status == 'active', Pollution.geo_cell.isnot(None)).group_by(cell)
+        ]
+        if rows:
+            db.session.execute(PollutionCluster.__table__.insert(), rows)
+    db.session.commit()
+
+
+def clusters_in_bbox(bbox, zoom):
+    """Non-empty cells of the grid for the zoom level, optionally within a bbox."""
+    depth = depth_for_zoom(zoom)
+    query = PollutionCluster.query.filter(PollutionCluster.depth == depth, PollutionCluster.count > 0)
+    if bbox:
+        ranges = geo.quadkey_ranges(geo.cover_bbox(bbox, max_zoom=depth))
+        query = query.filter(or_(*[
+            PollutionCluster.cell >= start if end is None
+            else and_(PollutionCluster.cell >= start, PollutionCluster.cell < end)
+            for start, end in ranges
+        ]))
+    result = []
+    for c in query:
+        max_level = next((level for level in reversed(LEVELS) if getattr(c, f'level_{level}') > 0), None)
+        result.append({
+            'cell': c.cell,
+            'count': c.count,
+            'lat': c.lat_sum / c.count,
+            'lng': c.lng_sum / c.count,
+            'max_level': max_level,
+        })
+    return result
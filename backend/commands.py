@@ -0,0 +1,68 @@
+"""Maintenance commands, run from backend/ as: flask --app app <command>"""
+import click
+
+import analytics
+import changes
+import clustering
+import counters
+import migrations
+import stats
+
+
+def register(app):
+    @app.cli.command('rebuild-clusters')
+    def rebuild_clusters():
+        """Recompute the map cluster grid from the pollutions table."""
+        clustering.rebuild()
+        click.echo('Cluster grid rebuilt')
+
+    @app.cli.command('backfill-counters')
+    def backfill_counters():
+        """Recompute users' reported_count, cleaned_count and reports_cleaned_count."""
+        counters.backfill()
+        click.echo('User counters backfilled')
+
+    @app.cli.command('backfill-analytics')
+    def backfill_analytics():
+        """Recompute the daily and weekly analytics rollups from the pollutions table."""
+        rows = analytics.rebuild()
+        click.echo(f'Analytics rollups rebuilt ({rows} rows)')
+
+    @app.cli.command('reconcile-stats')
+    @click.option('--dry-run', is_flag=True, help='Only report drift, do not fix it.')
+    def reconcile_stats(dry_run):
+        """Compare the running stats with the real aggregates and fix drift."""
+        drift = stats.reconcile(fix=not dry_run)
+        if not drift:
+            click.echo('Stats are consistent')
+            return
+        for name, (stored, actual) in drift.items():
+            click.echo(f'{name}: stored={stored} actual={actual}')
+        click.echo('Drift reported' if dry_run else 'Drift fixed')
+
+    @app.cli.command('compact-tombstones')
+    @click.option('--retention-days', type=int, default=changes.RETENTION_DAYS, show_default=True)
+    def compact_tombstones(retention_days):
+        """Drop delta-sync tombstones older than the retention window."""
+        removed = changes.compact(retention_days)
+        click.echo(f'{removed} tombstones removed')
+
+    @app.cli.command('db-status')
+    def db_status():
+        """List schema revisions and whether they are applied."""
+        for revision, description, applied in migrations.status():
+            click.echo(f"{'x' if applied else ' '} {revision}  {description}")
+
+    @app.cli.command('db-upgrade')
+    @click.option('--to', 'target', help='Stop after this revision.')
+    def db_upgrade(target):
+        """Apply pending schema revisions."""
+        ran = migrations.upgrade(target)
+        click.echo(f'Applied {len(ran)} revision(s)')
+
+    @app.cli.command('db-downgrade')
+    @click.argument('target')
+    def db_downgrade(target):
+        """Revert revisions newer than TARGET ('base' for all)."""
+        reverted = migrations.downgrade(target)
+        click.echo(f'Reverted {len(reverted)} revision(s)')
@@ -0,0 +1,49 @@
+"""Per-user reported_count / cleaned_count / reports_cleaned_count counters.
+
+The helpers issue relative UPDATEs (count = count + n) inside the caller's
+transaction, so concurrent workers never overwrite each other's increments.
+"""
+from sqlalchemy import case, func
+
+from models import db, User, Pollution
+
+
+def bump(user_id, reported=0, cleaned=0, reports_cleaned=0):
+    values = {}
+    if reported:
+        values[User.reported_count] = User.reported_count + reported
+    if cleaned:
+        values[User.cleaned_count] = User.cleaned_count + cleaned
+    if reports_cleaned:
+        values[User.reports_cleaned_count] = User.reports_cleaned_count + reports_cleaned
+    if user_id and values:
+        User.query.filter_by(id=user_id).update(values, synchronize_session=False)
+
+
+def forget_pollutions(query):
+    """Decrements the counters of everyone involved in the pollutions about to be deleted."""
+    reported = query.with_entities(
+        Pollution.user_id, func.count(Pollution.id),
+        func.sum(case((Pollution.status == 'cleaned', 1), else_=0)),
+    ).group_by(Pollution.user_id).all()
+    cleaned = query.with_entities(Pollution.cleaner_id, func.count(Pollution.id)) \
+        .filter(Pollution.status == 'cleaned', Pollution.cleaner_id.isnot(None)) \
+        .group_by(Pollution.cleaner_id).all()
+    for user_id, n, n_cleaned in reported:
+        bump(user_id, reported=-n, reports_cleaned=-(n_cleaned or 0))
+    for user_id, n in cleaned:
+        bump(user_id, cleaned=-n)
+
+
+def backfill():
+    """Recomputes every user's counters from the pollutions table."""
+    reported = db.session.query(func.count(Pollution.id)) \
+        .filter(Pollution.user_id == User.id).scalar_subquery()
+    cleaned = db.session.query(func.count(Pollution.id)) \
+        .filter(Pollution.cleaner_id == User.id, Pollution.status == 'cleaned').scalar_subquery()
+    reports_cleaned = db.session.query(func.count(Pollution.id)) \
+        .filter(Pollution.user_id == User.id, Pollution.status == 'cleaned').scalar_subquery()
+    User.query.update({User.reported_count: reported, User.cleaned_count: cleaned,
+                       User.reports_cleaned_count: reports_cleaned},
+                      synchronize_session=False)
+    db.session.commit()
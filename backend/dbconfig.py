@@ -0,0 +1,113 @@
+"""SQLAlchemy engine options from the environment, plus pool metrics.
+
+    DB_POOL_SIZE=5            connections kept per worker process
+    DB_MAX_OVERFLOW=5         extra connections allowed under bursts
+    DB_POOL_TIMEOUT=10        seconds to wait for a free connection
+    DB_POOL_RECYCLE=1800      reconnect connections older than this (seconds)
+    DB_POOL_PRE_PING=1        test a connection before handing it out, so a
+                              restarted PostgreSQL costs a reconnect, not a 500
+    DB_STATEMENT_TIMEOUT_MS=0 abort statements running longer (PostgreSQL)
+    DB_PGBOUNCER=0            running behind PgBouncer in transaction mode:
+                              no client-side pool (PgBouncer pools) and the
+                              statement timeout is set per transaction, since
+                              startup options are not forwarded
+
+With gunicorn -w 4 a worker holds up to DB_POOL_SIZE + DB_MAX_OVERFLOW
+connections; keep 4 x that below PostgreSQL's max_connections.
+"""
+import os
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool
+
+
+def _flag(name, default):
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes', 'on')
+
+
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '5'))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+POOL_PRE_PING = _flag('DB_POOL_PRE_PING', '1')
+STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '0'))
+PGBOUNCER = _flag('DB_PGBOUNCER', '0')
+APPLICATION_NAME = os.getenv('DB_APPLICATION_NAME', 'ecopatrol')
+
+
+def engine_options(url):
+    """Value for SQLALCHEMY_ENGINE_OPTIONS."""
+    if url.startswith('sqlite'):
+        if ':memory:' in url or url.rstrip('/') == 'sqlite:':
+            # Single shared connection; pool sizing does not apply
+            return {}
+        return {
+            'pool_size': POOL_SIZE,
+            'max_overflow': MAX_OVERFLOW,
+            'pool_timeout': POOL_TIMEOUT,
+            'pool_pre_ping': POOL_PRE_PING,
+        }
+    connect_args = {'application_name': APPLICATION_NAME}
+    if PGBOUNCER:
+        return {'poolclass': NullPool, 'connect_args': connect_args}
+    if STATEMENT_TIMEOUT_MS:
+        connect_args['options'] = f'-c statement_timeout={STATEMENT_TIMEOUT_MS}'
+    return {
+        'pool_size': POOL_SIZE,
+        'max_overflow': MAX_OVERFLOW,
+        'pool_timeout': POOL_TIMEOUT,
+        'pool_recycle': POOL_RECYCLE,
+        'pool_pre_ping': POOL_PRE_PING,
+        'connect_args': connect_args,
+    }
+
+
+class PoolStats:
+    """Counts pool events of one engine; read through pool_status()."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidated = 0
+        self.max_checked_out = 0
+        self.checked_out = 0
+
+    def _add(self, **deltas):
+        with self.lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+
+_stats = {}
+
+
+def instrument(engine):
+    """Installs pool counters and, behind PgBouncer, the per-transaction timeout."""
+    if engine in _stats:
+        return
+    stats = _stats[engine] = PoolStats()
+    event.listen(engine, 'connect', lambda *a: stats._add(connects=1))
+    event.listen(engine, 'checkout', lambda *a: stats._add(checkouts=1, checked_out=1))
+    event.listen(engine, 'checkin', lambda *a: stats._add(checked_out=-1))
+    event.listen(engine, 'invalidate', lambda *a: stats._add(invalidated=1))
+    if PGBOUNCER and STATEMENT_TIMEOUT_MS and engine.dialect.name == 'postgresql':
+        @event.listens_for(engine, 'begin')
+        def _statement_timeout(conn):
+            conn.exec_driver_sql(f'SET LOCAL statement_timeout = {STATEMENT_TIMEOUT_MS}')
+
+
+def pool_status(engine):
+    pool = engine.pool
+    status = {'class': type(pool).__name__, 'pgbouncer': PGBOUNCER, 'pre_ping': POOL_PRE_PING}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        method = getattr(pool, name, None)
+        if callable(method):
+            status[name] = method()
+    stats = _stats.get(engine)
+    if stats:
+        status.update(connects=stats.connects, checkouts=stats.checkouts,
+                      invalidated=stats.invalidated, max_checked_out=stats.max_checked_out)
+    return status
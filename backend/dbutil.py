@@ -0,0 +1,79 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db
+
+_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def upsert_add(table, keys, deltas):
+    """INSERT the row or add deltas to the existing one, in a single statement.
+
+    keys must be the table's primary key (or a unique index); the statement
+    runs inside the current session transaction.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect not in _INSERTS:
+        raise NotImplementedError(f'upsert is not supported on {dialect}')
+    stmt = _INSERTS[dialect](table).values(**keys, **deltas)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={name: table.c[name] + stmt.excluded[name] for name in deltas},
+    )
+    db.session.execute(stmt)
+
+
+def upsert_add_many(table, key_names, rows):
+    """upsert_add() for many rows in one executemany; rows must all have the same columns."""
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    if dialect not in _INSERTS:
+        raise NotImplementedError(f'upsert is not supported on {dialect}')
+    stmt = _INSERTS[dialect](table)
+    deltas = [name for name in rows[0] if name not in key_names]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key_names),
+        set_={name: table.c[name] + stmt.excluded[name] for name in deltas},
+    )
+    db.session.execute(stmt, rows)
+
+
+def insert_ignore(table, values, index_elements):
+    """INSERT the row unless it conflicts on index_elements. Returns True if inserted."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect not in _INSERTS:
+        raise NotImplementedError(f'upsert is not supported on {dialect}')
+    stmt = _INSERTS[dialect](table).values(**values).on_conflict_do_nothing(index_elements=index_elements)
+    return db.session.execute(stmt).rowcount > 0
+
+
+def insert_ignore_many(table, rows, index_elements):
+    """insert_ignore() for many rows in one executemany."""
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    if dialect not in _INSERTS:
+        raise NotImplementedError(f'upsert is not supported on {dialect}')
+    stmt = _INSERTS[dialect](table).on_conflict_do_nothing(index_elements=index_elements)
+    db.session.execute(stmt, rows)
+
+
+def increment(table, keys, column, connection=None, amount=1):
+    """Adds amount to column of the row (creating it with amount) and returns the new value.
+
+    On PostgreSQL the row stays locked until the transaction ends, so values
+    become visible in the order they were handed out.
+    """
+    connection = connection or db.session
+    dialect = connection.get_bind().dialect.name if connection is db.session else connection.dialect.name
+    if dialect not in _INSERTS:
+        raise NotImplementedError(f'upsert is not supported on {dialect}')
+    stmt = _INSERTS[dialect](table).values(**keys, **{column: amount})
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={column: table.c[column] + amount},
+    ).returning(table.c[column])
+    return connection.execute(stmt).scalar()
@@ -0,0 +1,167 @@
+import math
+
+from sqlalchemy import and_, or_
+
+# Zoom level of the quadkey stored on every row. At z18 a cell is ~150m wide
+# in Uzbekistan, which is fine-grained enough for any viewport the map allows.
+GEO_CELL_ZOOM = 18
+
+# Upper bound on the number of tiles a bbox is covered with. Fewer tiles means
+# coarser ranges (more rows filtered by the exact lat/lng check), more tiles
+# means more OR-ed range predicates.
+MAX_COVER_TILES = 16
+
+MAX_LAT = 85.05112878
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def tile_xy(lat, lng, zoom):
+    """Returns the slippy-map tile (x, y) containing the point at the given zoom."""
+    lat = _clamp(lat, -MAX_LAT, MAX_LAT)
+    n = 1 << zoom
+    x = int((lng + 180.0) / 360.0 * n)
+    lat_rad = math.radians(lat)
+    y = int((1.0 - math.log(math.tan(lat_rad) + 1.0 / math.cos(lat_rad)) / math.pi) / 2.0 * n)
+    return _clamp(x, 0, n - 1), _clamp(y, 0, n - 1)
+
+
+def tile_to_quadkey(x, y, zoom):
+    digits = []
+    for i in range(zoom, 0, -1):
+        mask = 1 << (i - 1)
+        digit = 0
+        if x & mask:
+            digit += 1
+        if y & mask:
+            digit += 2
+        digits.append(str(digit))
+    return ''.join(digits)
+
+
+def quadkey_to_tile(quadkey):
+    x = y = 0
+    zoom = len(quadkey)
+    for i, digit in enumerate(quadkey):
+        mask = 1 << (zoom - i - 1)
+        if digit in '13':
+            x |= mask
+        if digit in '23':
+            y |= mask
+    return x, y, zoom
+
+
+def quadkey(lat, lng, zoom=GEO_CELL_ZOOM):
+    """Quadkey of the point; every prefix of it is the quadkey of a parent tile."""
+    x, y = tile_xy(lat, lng, zoom)
+    return tile_to_quadkey(x, y, zoom)
+
+
+def tile_bounds(x, y, zoom):
+    """Returns (min_lng, min_lat, max_lng, max_lat) of a tile."""
+    n = 1 << zoom
+
+    def lat_of(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return x / n * 360.0 - 180.0, lat_of(y + 1), (x + 1) / n * 360.0 - 180.0, lat_of(y)
+
+
+def parse_bbox(value):
+    """Parses 'min_lng,min_lat,max_lng,max_lat'. Returns None if malformed."""
+    try:
+        parts = [float(v) for v in value.split(',')]
+    except (AttributeError, ValueError):
+        return None
+    if len(parts) != 4:
+        return None
+    min_lng, min_lat, max_lng, max_lat = parts
+    if min_lng > max_lng or min_lat > max_lat:
+        return None
+    return (_clamp(min_lng, -180.0, 180.0), _clamp(min_lat, -MAX_LAT, MAX_LAT),
+            _clamp(max_lng, -180.0, 180.0), _clamp(max_lat, -MAX_LAT, MAX_LAT))
+
+
+def cover_bbox(bbox, max_tiles=MAX_COVER_TILES, max_zoom=GEO_CELL_ZOOM):
+    """Covers a bbox with at most max_tiles tiles of a single zoom level.
+
+    Returns the list of quadkeys, picking the deepest zoom that still fits.
+    """
+    min_lng, min_lat, max_lng, max_lat = bbox
+    best = ['']
+    for zoom in range(1, max_zoom + 1):
+        x0, y0 = tile_xy(max_lat, min_lng, zoom)
+        x1, y1 = tile_xy(min_lat, max_lng, zoom)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > max_tiles:
+            break
+        best = [tile_to_quadkey(x, y, zoom)
+                for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+    return best
+
+
+def _prefix_end(prefix):
+    # First key that no longer shares the prefix: drop trailing '3's (digits
+    # are 0-3) and bump the last remaining digit. None means no upper bound.
+    prefix = prefix.rstrip('3')
+    if not prefix:
+        return None
+    return prefix[:-1] + str(int(prefix[-1]) + 1)
+
+
+def _touches(end, start):
+    # Nothing can sort between end and start if start is end padded with '0's.
+    return end >= start or (start.startswith(end) and not start[len(end):].strip('0'))
+
+
+def quadkey_ranges(quadkeys):
+    """Turns tile prefixes into merged [start, end) key ranges."""
+    ranges = []
+    for prefix in sorted(quadkeys):
+        start, end = prefix, _prefix_end(prefix)
+        if ranges and ranges[-1][1] is not None and _touches(ranges[-1][1], start):
+            prev_end = ranges[-1][1]
+            ranges[-1] = (ranges[-1][0], None if end is None else max(prev_end, end))
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def bbox_filter(column, bbox, lat_column, lng_column, max_tiles=MAX_COVER_TILES):
+    """SQLAlchemy criteria selecting rows of a quadkey column inside a bbox.
+
+    The quadkey ranges hit the index; the lat/lng check trims the tile edges.
+    """
+    min_lng, min_lat, max_lng, max_lat = bbox
+    clauses = []
+    for start, end in quadkey_ranges(cover_bbox(bbox, max_tiles)):
+        if end is None:
+            clauses.append(column >= start)
+        else:
+            clauses.append(and_(column >= start, column < end))
+    return and_(
+        or_(*clauses),
+        lat_column.between(min_lat, max_lat),
+        lng_column.between(min_lng, max_lng),
+    )
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance between two points."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def radius_bbox(lat, lng, radius_km):
+    """Bounding box (min_lng, min_lat, max_lng, max_lat) of a circle."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    dlng = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    return (_clamp(lng - dlng, -180.0, 180.0), _clamp(lat - dlat, -MAX_LAT, MAX_LAT),
+            _clamp(lng + dlng, -180.0, 180.0), _clamp(lat + dlat, -MAX_LAT, MAX_LAT))
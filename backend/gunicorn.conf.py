@@ -0,0 +1,43 @@
+"""gunicorn settings, picked up automatically when gunicorn runs in backend/.
+
+    ECO_WORKER_CLASS=sync        sync (default) or gevent
+    ECO_WORKERS=4                worker processes
+    ECO_WORKER_CONNECTIONS=500   concurrent requests per gevent worker
+    ECO_TIMEOUT=30               seconds before a stuck worker is restarted
+
+A sync worker serves one request at a time, so four slow clients (a
+trickling upload, a phone on 2G) are enough to stall the API. In gevent
+mode every request runs in a greenlet and waits on sockets cooperatively:
+psycogreen makes psycopg2 yield while PostgreSQL works, the same way
+gevent's monkey patching covers sockets, sleeps and threads. Handlers and
+models are the same in both modes.
+
+Greenlets of one worker share its connection pool, so in gevent mode raise
+DB_POOL_SIZE (see dbconfig.py) or put PgBouncer in front of PostgreSQL.
+The variables can live in backend/.env; command-line flags still win.
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+worker_class = os.getenv('ECO_WORKER_CLASS', 'sync')
+workers = int(os.getenv('ECO_WORKERS', '4'))
+worker_connections = int(os.getenv('ECO_WORKER_CONNECTIONS', '500'))
+timeout = int(os.getenv('ECO_TIMEOUT', '30'))
+
+
+def post_worker_init(worker):
+    if worker_class != 'gevent':
+        return
+    try:
+        import psycopg2  # noqa: F401
+    except ImportError:
+        return  # SQLite: local file access, nothing to make cooperative
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        worker.log.warning('psycogreen is not installed: PostgreSQL queries will block the whole gevent worker')
+        return
+    patch_psycopg()
@@ -0,0 +1,118 @@
+"""Write coalescing for /api/user/location heartbeats.
+
+main.js reports the user's position over and over; writing each one is a
+commit. Instead every worker keeps only the latest position per user id (taken
+from the session token, see auth.py) in memory and a background thread writes them all in one bulk
+UPDATE every HEARTBEAT_FLUSH_SECONDS (or earlier once HEARTBEAT_MAX_PENDING
+users are waiting). A stored position is therefore at most one flush interval
+old, and pending positions are flushed when the worker exits.
+
+Every flush also moves users to the users.geo_cell bucket of their new
+position, the spatial index nearby.py matches new reports against.
+
+HEARTBEAT_FLUSH_SECONDS=0 turns coalescing off and writes every heartbeat
+immediately.
+"""
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime
+
+from sqlalchemy import bindparam, update
+
+import geo
+from models import db, User
+
+FLUSH_SECONDS = float(os.getenv('HEARTBEAT_FLUSH_SECONDS', '5'))
+MAX_PENDING = int(os.getenv('HEARTBEAT_MAX_PENDING', '5000'))
+
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_pending = {}  # user id -> (lat, lng, seen_at)
+_app = None
+_thread = None
+_thread_pid = None
+
+
+log = logging.getLogger('ecopatrol')
+
+
+def init_app(app):
+    global _app
+    _app = app
+    atexit.register(flush_now)
+
+
+def _write(items):
+    stmt = update(User.__table__).where(User.__table__.c.id == bindparam('user_id')).values(
+        lat=bindparam('new_lat'), lng=bindparam('new_lng'), geo_cell=bindparam('new_cell'),
+        last_seen_at=bindparam('seen_at'))
+    # One executemany in one transaction instead of a commit per heartbeat;
+    # positions are not part of any HTTP-cached response
+    db.session.execute(stmt, [
+        {'user_id': user_id, 'new_lat': lat, 'new_lng': lng, 'new_cell': geo.quadkey(lat, lng), 'seen_at': seen_at}
+        for user_id, (lat, lng, seen_at) in items
+    ], execution_options={'http_cache_signal': False})
+    db.session.commit()
+
+
+def _ensure_thread():
+    global _thread, _thread_pid
+    # gunicorn forks workers after import; each worker needs its own thread
+    if _thread is not None and _thread_pid == os.getpid():
+        return
+    with _lock:
+        if _thread is not None and _thread_pid == os.getpid():
+            return
+        _thread = threading.Thread(target=_run, name='heartbeat-flusher', daemon=True)
+        _thread_pid = os.getpid()
+        _thread.start()
+
+
+def record(user_id, lat, lng):
+    """Remembers the latest position of a user; it reaches the DB on the next flush."""
+    seen_at = datetime.utcnow()
+    if FLUSH_SECONDS <= 0:
+        _write([(user_id, (lat, lng, seen_at))])
+        return
+    with _lock:
+        _pending[user_id] = (lat, lng, seen_at)
+        full = len(_pending) >= MAX_PENDING
+    _ensure_thread()
+    if full:
+        _wakeup.set()
+
+
+def pending_count():
+    return len(_pending)
+
+
+def flush_now():
+    """Writes all pending positions in one transaction. Returns how many users were updated."""
+    global _pending
+    with _lock:
+        items, _pending = _pending, {}
+    if not items:
+        return 0
+    try:
+        if _app is not None:
+            with _app.app_context():
+                _write(items.items())
+        else:
+            _write(items.items())
+    except Exception:
+        log.exception("Heartbeat flush failed")
+        # Put them back unless a newer position arrived meanwhile
+        with _lock:
+            for user_id, value in items.items():
+                _pending.setdefault(user_id, value)
+        return 0
+    return len(items)
+
+
+def _run():
+    while True:
+        _wakeup.wait(FLUSH_SECONDS)
+        _wakeup.clear()
+        flush_now()
@@ -0,0 +1,110 @@
+"""Conditional GET for public endpoints that change only on writes.
+
+Each cacheable resource has a version in signals.py. Committed sessions bump
+the resources of the tables they wrote (see TABLE_RESOURCES), so endpoints
+decorated with @conditional(...) can derive a strong ETag from those versions
+plus the request URL and answer If-None-Match with 304 before the view runs:
+no ORM query, no serialization.
+
+Browsers get "Cache-Control: no-cache" (always revalidate, cheap thanks to
+the ETag). nginx may additionally keep a response for PROXY_SECONDS via
+X-Accel-Expires, which it strips before the response reaches the client.
+"""
+import hashlib
+import os
+from functools import wraps
+
+from flask import make_response, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import signals
+
+PROXY_SECONDS = int(os.getenv('HTTP_CACHE_PROXY_SECONDS', '2'))
+
+# Which resource versions a write to each table invalidates
+TABLE_RESOURCES = {
+    'pollutions': 'pollutions',
+    'photos': 'pollutions',
+    'pollution_tombstones': 'pollutions',
+    'users': 'users',
+    'stat_counters': 'stats',
+    'global_settings': 'settings',
+}
+RESOURCES = sorted(set(TABLE_RESOURCES.values()))
+
+
+def _touched(session):
+    return session.info.setdefault('http_cache_touched', set())
+
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    touched = _touched(session)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        resource = TABLE_RESOURCES.get(getattr(obj, '__tablename__', None))
+        if resource:
+            touched.add(resource)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _on_execute(state):
+    # Bulk Query.update()/delete() and Core DML run through session.execute
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    if not state.execution_options.get('http_cache_signal', True):
+        return
+    table = getattr(state.statement, 'table', None)
+    resource = TABLE_RESOURCES.get(getattr(table, 'name', None))
+    if resource:
+        _touched(state.session).add(resource)
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    for resource in session.info.pop('http_cache_touched', ()):
+        signals.bump(resource)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _after_rollback(session, previous_transaction):
+    session.info.pop('http_cache_touched', None)
+
+
+def invalidate_all():
+    """Makes every client revalidate, e.g. after a deploy changed response shapes."""
+    for resource in RESOURCES:
+        signals.bump(resource)
+
+
+def etag(resources):
+    key = '|'.join([request.full_path, request.headers.get('Accept', '')]
+                   + [str(signals.version(r)) for r in resources])
+    return hashlib.sha1(key.encode()).hexdigest()[:24]
+
+
+def _cache_headers(response, tag):
+    response.set_etag(tag)
+    response.headers['Cache-Control'] = 'public, no-cache'
+    response.headers['Vary'] = 'Accept'
+    if PROXY_SECONDS:
+        response.headers['X-Accel-Expires'] = str(PROXY_SECONDS)
+    return response
+
+
+def conditional(*resources):
+    """Serves the view with an ETag and answers a matching If-None-Match with 304."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Taken before the view reads anything, so a concurrent write can
+            # only make the tag older than the body, never newer
+            tag = etag(resources)
+            if tag in request.if_none_match:
+                return _cache_headers(make_response('', 304), tag)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                _cache_headers(response, tag)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,189 @@
+"""Local, content-addressed photo store behind POST /api/photos.
+
+Originals are saved as PHOTO_DIR/<aa>/<sha256>.<ext>, named by the SHA-256
+of their bytes: the same photo uploaded twice (a retry, or a report and its
+cleanup sent with the same picture) maps to the same file and is written
+once. A path never changes content, so /media/photos/... is served as
+immutable; nginx reads the files directly and the Flask route below serves
+the same paths when it does not.
+
+Resized WebP variants (VARIANTS) are rendered by a small thread pool after
+the upload returns. A variant requested before it is ready falls through to
+the Flask route, which renders it on the spot. Pillow is optional: without
+it no variants are made and thumbnail_url() returns the original.
+
+Listings link thumbnails (thumbnail_url). Photos of older reports still
+live on Cloudinary; those get a resize transformation in the URL instead.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+URL_PREFIX = '/media/photos'
+PHOTO_DIR = os.getenv('PHOTO_DIR', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'instance', 'media', 'photos'))
+MAX_BYTES = int(float(os.getenv('PHOTO_MAX_MB', '10')) * 1024 * 1024)
+WORKERS = int(os.getenv('PHOTO_WORKERS', '2'))
+# Longest side in pixels
+VARIANTS = {'thumb': 320, 'large': 1280}
+WEBP_QUALITY = 80
+CACHE_SECONDS = 365 * 24 * 3600
+
+FORMATS = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+)
+_NAME = re.compile(r'^([0-9a-f]{2})/([0-9a-f]{64})(?:_([a-z]+))?\.([a-z]+)$')
+_CLOUDINARY_UPLOAD = '/image/upload/'
+
+log = logging.getLogger('ecopatrol')
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_pending = {}  # sha256 -> Future rendering its variants
+
+
+class InvalidPhoto(ValueError):
+    pass
+
+
+def sniff(data):
+    """File extension of a JPEG, PNG or WebP image, or None."""
+    for magic, ext in FORMATS:
+        if data.startswith(magic):
+            return ext
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def _path(name):
+    return os.path.join(PHOTO_DIR, *name.split('/'))
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _variant_name(digest, variant):
+    return f'{digest[:2]}/{digest}_{variant}.webp'
+
+
+def render(digest, ext):
+    """Writes the missing variants of an original. Returns their names."""
+    if Image is None:
+        return []
+    source = _path(f'{digest[:2]}/{digest}.{ext}')
+    written = []
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+        for variant, size in VARIANTS.items():
+            name = _variant_name(digest, variant)
+            path = _path(name)
+            if os.path.exists(path):
+                continue
+            copy = image.copy()
+            copy.thumbnail((size, size))
+            tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            # Variants drop EXIF, including the GPS position of the camera
+            copy.save(tmp, 'WEBP', quality=WEBP_QUALITY, method=4)
+            os.replace(tmp, path)
+            written.append(name)
+    return written
+
+
+def _executor():
+    global _pool, _pool_pid
+    # gunicorn forks workers after import; each worker needs its own pool
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='photo-variants')
+            _pool_pid = os.getpid()
+            _pending.clear()
+        return _pool
+
+
+def _schedule(digest, ext):
+    if Image is None:
+        return None
+    pool = _executor()
+    with _lock:
+        future = _pending.get(digest)
+        if future is None:
+            future = _pending[digest] = pool.submit(render, digest, ext)
+            future.add_done_callback(lambda _: _pending.pop(digest, None))
+        return future
+
+
+def save(stream):
+    """Stores an uploaded image; returns a dict with its urls, hash and whether it existed."""
+    data = stream.read(MAX_BYTES + 1)
+    if len(data) > MAX_BYTES:
+        raise InvalidPhoto(f'Photo is larger than {MAX_BYTES // (1024 * 1024)} MB')
+    ext = sniff(data)
+    if ext is None:
+        raise InvalidPhoto('Only JPEG, PNG and WebP images are accepted')
+    digest = hashlib.sha256(data).hexdigest()
+    name = f'{digest[:2]}/{digest}.{ext}'
+    deduped = os.path.exists(_path(name))
+    if not deduped:
+        _write(_path(name), data)
+    if any(not os.path.exists(_path(_variant_name(digest, v))) for v in VARIANTS):
+        _schedule(digest, ext)
+    url = f'{URL_PREFIX}/{name}'
+    return {'url': url, 'thumb_url': thumbnail_url(url), 'hash': digest, 'deduped': deduped}
+
+
+def variant_url(url, variant):
+    """URL of a resized variant of the photo at url (the url itself if there is none)."""
+    if not url:
+        return url
+    if url.startswith(URL_PREFIX + '/'):
+        match = _NAME.match(url[len(URL_PREFIX) + 1:])
+        if Image is None or not match or match.group(3):
+            return url
+        return f'{URL_PREFIX}/{_variant_name(match.group(2), variant)}'
+    if 'res.cloudinary.com' in url and _CLOUDINARY_UPLOAD in url:
+        size = VARIANTS[variant]
+        return url.replace(_CLOUDINARY_UPLOAD, f'{_CLOUDINARY_UPLOAD}w_{size},h_{size},c_limit,f_auto,q_auto/', 1)
+    return url
+
+
+def thumbnail_url(url):
+    return variant_url(url, 'thumb')
+
+
+def locate(name):
+    """File path for a /media/photos/<name> request, rendering a missing variant. None if unknown."""
+    match = _NAME.match(name)
+    if not match:
+        return None
+    path = _path(name)
+    if os.path.exists(path):
+        return path
+    prefix, digest, variant, ext = match.groups()
+    if variant not in VARIANTS or ext != 'webp' or Image is None:
+        return None
+    for original_ext in ('jpg', 'png', 'webp'):
+        if os.path.exists(_path(f'{prefix}/{digest}.{original_ext}')):
+            try:
+                _schedule(digest, original_ext).result()
+            except Exception as e:
+                log.warning("media: cannot render variants of %s: %s", digest, e)
+            return path if os.path.exists(path) else None
+    return None
@@ -0,0 +1,309 @@
+"""Per-request instrumentation, exposed in Prometheus text format at /api/metrics.
+
+For every request, labelled by route pattern and method:
+
+    eco_http_request_duration_seconds   histogram, request start to last body byte
+    eco_http_requests_total             counter, also by status
+    eco_http_response_size_bytes       histogram of body sizes
+    eco_sql_statements_per_request      histogram
+    eco_sql_seconds_total               time spent in SQL statements
+    eco_serialization_seconds_total     time spent turning rows into JSON
+
+plus statements run outside requests (heartbeat flushes, CLI) and the
+connection pool gauges of dbconfig.pool_status.
+
+gunicorn workers are separate processes, so each one writes a snapshot of
+its numbers to METRICS_DIR/<pid>.json at most every METRICS_SNAPSHOT_SECONDS
+and the scrape sums all snapshots, the way signals.py shares cache
+versions. Counters of workers that exited stay in the total; gauges only
+come from live workers.
+
+Set METRICS_TOKEN to require "Authorization: Bearer <token>" on scrapes;
+nginx only lets /api/metrics through from localhost either way.
+"""
+import hmac
+import json
+import os
+import threading
+import time
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+
+import dbconfig
+import profiler
+
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics'))
+SNAPSHOT_SECONDS = float(os.getenv('METRICS_SNAPSHOT_SECONDS', '5'))
+TOKEN = os.getenv('METRICS_TOKEN', '')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 10_240, 102_400, 1_048_576, 10_485_760)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+HELP = {
+    'eco_http_request_duration_seconds': ('histogram', 'Time from request start to the last byte of the body.'),
+    'eco_http_requests_total': ('counter', 'Finished requests.'),
+    'eco_http_response_size_bytes': ('histogram', 'Response body size.'),
+    'eco_sql_statements_per_request': ('histogram', 'SQL statements sent while serving one request.'),
+    'eco_sql_seconds_total': ('counter', 'Time spent in SQL statements.'),
+    'eco_serialization_seconds_total': ('counter', 'Time spent serializing response bodies.'),
+    'eco_background_sql_statements_total': ('counter', 'SQL statements sent outside requests.'),
+    'eco_background_sql_seconds_total': ('counter', 'Time spent in SQL statements outside requests.'),
+    'eco_db_pool': ('gauge', 'Connection pool state of live workers (see /api/health).'),
+}
+
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+_counters = {}  # (name, labels) -> value
+_local = threading.local()
+_last_snapshot = 0.0
+_engine = None
+
+
+class RequestStats:
+    __slots__ = ('started', 'endpoint', 'method', 'sql_count', 'sql_seconds',
+                 'serialize_seconds', 'size', 'status', 'samples')
+
+    def __init__(self, endpoint, method):
+        self.started = time.perf_counter()
+        self.endpoint = endpoint
+        self.method = method
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.size = 0
+        self.status = 0
+        self.samples = None
+
+
+def _observe(name, labels, buckets, value):
+    key = (name, labels)
+    row = _histograms.get(key)
+    if row is None:
+        row = _histograms[key] = [0] * (len(buckets) + 2)
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            row[i] += 1
+    row[-2] += 1
+    row[-1] += value
+
+
+def _inc(name, labels, value=1):
+    key = (name, labels)
+    _counters[key] = _counters.get(key, 0) + value
+
+
+def add_serialization(seconds):
+    """Adds serialization time to the current request, if any."""
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats.serialize_seconds += seconds
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """jsonify() with its encoding time counted as serialization."""
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            add_serialization(time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._eco_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._eco_started
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats.sql_count += 1
+        stats.sql_seconds += elapsed
+        return
+    with _lock:
+        _inc('eco_background_sql_statements_total', ())
+        _inc('eco_background_sql_seconds_total', (), elapsed)
+
+
+def _start():
+    rule = request.url_rule
+    stats = _local.stats = RequestStats(rule.rule if rule else 'unmatched', request.method)
+    stats.samples = profiler.start()
+
+
+def _counting(body, stats):
+    for chunk in body:
+        stats.size += len(chunk)
+        yield chunk
+
+
+def _attach(response):
+    stats = getattr(_local, 'stats', None)
+    if stats is None:
+        return response
+    stats.status = response.status_code
+    if response.is_streamed:
+        # Streamed listings run their queries while the body is sent; the
+        # request is finished in _finish once the server has closed it
+        response.response = _counting(response.response, stats)
+    else:
+        stats.size = response.content_length or 0
+    response.call_on_close(lambda: _finish(stats))
+    return response
+
+
+def _finish(stats):
+    _local.stats = None
+    duration = time.perf_counter() - stats.started
+    labels = (('endpoint', stats.endpoint), ('method', stats.method))
+    with _lock:
+        _observe('eco_http_request_duration_seconds', labels, DURATION_BUCKETS, duration)
+        _observe('eco_http_response_size_bytes', labels, SIZE_BUCKETS, stats.size)
+        _observe('eco_sql_statements_per_request', labels, STATEMENT_BUCKETS, stats.sql_count)
+        _inc('eco_http_requests_total', labels + (('status', str(stats.status)),))
+        _inc('eco_sql_seconds_total', labels, stats.sql_seconds)
+        _inc('eco_serialization_seconds_total', labels, stats.serialize_seconds)
+    profiler.stop(stats.samples, duration, f'{stats.method} {stats.endpoint}')
+    _maybe_snapshot()
+
+
+def init_app(app, engine):
+    global _engine
+    _engine = engine
+    app.json = TimedJSONProvider(app)
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_start)
+    app.after_request(_attach)
+
+
+def _pool_gauges():
+    if _engine is None:
+        return {}
+    status = dbconfig.pool_status(_engine)
+    return {k: v for k, v in status.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+
+
+def _snapshot():
+    gauges = _pool_gauges()
+    with _lock:
+        return {
+            'histograms': [[name, list(labels), row[:]] for (name, labels), row in _histograms.items()],
+            'counters': [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            'pool': gauges,
+        }
+
+
+def _write_snapshot():
+    global _last_snapshot
+    _last_snapshot = time.monotonic()
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f'{os.getpid()}.json')
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp, path)
+
+
+def _maybe_snapshot():
+    if time.monotonic() - _last_snapshot >= SNAPSHOT_SECONDS:
+        try:
+            _write_snapshot()
+        except OSError:
+            pass  # metrics must never fail a request
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _collect():
+    """Sums the snapshots of all workers, this one taken just now."""
+    _write_snapshot()
+    histograms, counters, pools = {}, {}, {}
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric, labels, row in data['histograms']:
+            key = (metric, tuple(map(tuple, labels)))
+            total = histograms.setdefault(key, [0] * len(row))
+            for i, value in enumerate(row):
+                total[i] += value
+        for metric, labels, value in data['counters']:
+            key = (metric, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        pid = int(name[:-len('.json')])
+        if data.get('pool') and _alive(pid):
+            pools[pid] = data['pool']
+    return histograms, counters, pools
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _buckets(metric):
+    if metric == 'eco_http_request_duration_seconds':
+        return DURATION_BUCKETS
+    if metric == 'eco_http_response_size_bytes':
+        return SIZE_BUCKETS
+    return STATEMENT_BUCKETS
+
+
+def authorized():
+    if not TOKEN:
+        return True
+    header = request.headers.get('Authorization', '')
+    return hmac.compare_digest(header, f'Bearer {TOKEN}')
+
+
+def render():
+    """The Prometheus text exposition of all workers."""
+    histograms, counters, pools = _collect()
+    lines = []
+    by_metric = {}
+    for (metric, labels), row in histograms.items():
+        by_metric.setdefault(metric, []).append(('h', labels, row))
+    for (metric, labels), value in counters.items():
+        by_metric.setdefault(metric, []).append(('c', labels, value))
+    for metric in sorted(by_metric):
+        kind, text = HELP[metric]
+        lines.append(f'# HELP {metric} {text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for series, labels, value in sorted(by_metric[metric], key=lambda s: s[1]):
+            if series == 'c':
+                lines.append(f'{metric}{_label_text(labels)} {value:g}')
+                continue
+            buckets = _buckets(metric)
+            cumulative = value[:-2] + [value[-2]]
+            for bound, count in zip(list(buckets) + ['+Inf'], cumulative):
+                lines.append(f'{metric}_bucket{_label_text(labels, [("le", bound)])} {count}')
+            lines.append(f'{metric}_sum{_label_text(labels)} {value[-1]:g}')
+            lines.append(f'{metric}_count{_label_text(labels)} {value[-2]}')
+    if pools:
+        kind, text = HELP['eco_db_pool']
+        lines.append(f'# HELP eco_db_pool {text}')
+        lines.append(f'# TYPE eco_db_pool {kind}')
+        for pid, gauges in sorted(pools.items()):
+            for name, value in sorted(gauges.items()):
+                lines.append(f'eco_db_pool{_label_text([("pid", pid), ("state", name)])} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,104 @@
+"""Brings an existing database up to date with models.py.
+
+Run by update_vps.sh after every deploy. db.create_all() only creates missing
+tables; columns and indexes of existing tables come from the versioned
+revisions of the migrations package. Model columns and indexes that no
+revision owns yet are still added here as a fallback; the ones a revision
+owns are left to its upgrade and downgrade.
+"""
+from sqlalchemy import inspect, text
+
+from app import app
+from models import db, User, Pollution, PollutionCluster, StatCounter, AnalyticsRollup
+import analytics
+import clustering
+import http_cache
+import tiles
+import migrations
+import stats
+import geo
+
+
+def add_missing_columns():
+    """Adds model columns that no revision owns. Returns the set of (table, column) names added."""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    owned, _ = migrations.owned()
+    added = set()
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or (table.name, column.name) in owned:
+                continue
+            ddl = column.type.compile(dialect=db.engine.dialect)
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            print(f"  + {table.name}.{column.name} ({ddl})")
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {ddl}'))
+            added.add((table.name, column.name))
+    return added
+
+
+def create_missing_indexes():
+    """Creates model indexes that no revision owns."""
+    _, owned = migrations.owned()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in owned:
+                index.create(db.engine, checkfirst=True)
+
+
+def backfill_geo_cells(batch_size=1000):
+    for model in (Pollution, User):
+        total = 0
+        while True:
+            rows = model.query.filter(model.geo_cell.is_(None), model.lat.isnot(None), model.lng.isnot(None)) \
+                .limit(batch_size).all()
+            if not rows:
+                break
+            for row in rows:
+                row.geo_cell = geo.quadkey(row.lat, row.lng)
+            db.session.commit()
+            total += len(rows)
+        if total:
+            print(f"  geo_cell backfilled for {total} {model.__tablename__}")
+
+
+def build_cluster_grid():
+    if PollutionCluster.query.first() is None and Pollution.query.filter_by(status='active').first():
+        clustering.rebuild()
+        print("  cluster grid built")
+
+
+def build_analytics():
+    if AnalyticsRollup.query.first() is None and Pollution.query.first():
+        analytics.rebuild()
+        print("  analytics rollups built")
+
+
+def migrate():
+    db.create_all()
+    migrations.upgrade()
+    add_missing_columns()
+    create_missing_indexes()
+    backfill_geo_cells()
+    build_cluster_grid()
+    build_analytics()
+    if StatCounter.query.first() is None:
+        stats.reconcile()
+        print("  stats counters initialized")
+    # Response shapes may have changed with the deploy
+    http_cache.invalidate_all()
+    tiles.clear()
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        print("Migrating database...")
+        migrate()
+        print("Done")
@@ -0,0 +1,50 @@
+"""Indexes matching the endpoints' WHERE / ORDER BY clauses.
+
+Frozen copy of the names declared in models.py at the time, so a fresh
+database (db.create_all) and a migrated one end up with the same set.
+"""
+from sqlalchemy import inspect, text
+
+INDEXES = [
+    # /api/admin/pollutions?status=... ordered by created_at
+    ('ix_pollutions_status_created_at', 'pollutions', 'status, created_at'),
+    # /api/pollutions/user/<id>, deleting a user
+    ('ix_pollutions_user_created_at', 'pollutions', 'user_id, created_at'),
+    # /api/history/user/<id>: cleaner_id = ? AND status = 'cleaned' ORDER BY created_at
+    ('ix_pollutions_cleaner_status_created_at', 'pollutions', 'cleaner_id, status, created_at'),
+    # Keyset orders of /api/admin/pollutions (sort=created_at|reward|level)
+    ('ix_pollutions_created_at_id', 'pollutions', 'created_at, id'),
+    ('ix_pollutions_reward_id', 'pollutions', 'reward, id'),
+    ('ix_pollutions_level_id', 'pollutions', 'level, id'),
+    # selectinload(Pollution.photos) and photo deletes
+    ('ix_photos_pollution_id', 'photos', 'pollution_id'),
+    # /api/leaderboard
+    ('ix_users_balance_desc', 'users', 'balance DESC'),
+]
+
+# Most map traffic only reads active reports; on PostgreSQL these stay small
+# while cleaned reports pile up
+PARTIAL_INDEXES = [
+    ('ix_pollutions_active_geo_cell', 'pollutions', 'geo_cell', "status = 'active'"),
+    ('ix_pollutions_active_created_at', 'pollutions', 'created_at', "status = 'active'"),
+]
+
+
+def upgrade(conn):
+    for name, table, columns in INDEXES:
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})'))
+    if conn.dialect.name == 'postgresql':
+        for name, table, columns, where in PARTIAL_INDEXES:
+            # geo_cell may only come with 0002, which then adds its index
+            if columns not in {c['name'] for c in inspect(conn).get_columns(table)}:
+                continue
+            conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns}) WHERE {where}'))
+
+
+def downgrade(conn):
+    for name, _, _, _ in PARTIAL_INDEXES:
+        conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
+    # ix_users_balance_desc predates this revision in models.py
+    for name, _, _ in INDEXES:
+        if name != 'ix_users_balance_desc':
+            conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
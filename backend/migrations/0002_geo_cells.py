@@ -0,0 +1,38 @@
+"""Quadkey geo_cell of users and pollutions, with their indexes.
+
+Frozen copy of models.py at the time (geo.GEO_CELL_ZOOM = 18). The column
+first came from migrate_all.py's ALTER pass; databases that have it only
+get the indexes they miss. geo_cell values are filled by migrate_all.py's
+backfill_geo_cells().
+"""
+from sqlalchemy import text
+
+from migrations import add_columns, drop_columns
+
+COLUMNS = [
+    ('users', 'geo_cell', 'VARCHAR(18)'),
+    ('pollutions', 'geo_cell', 'VARCHAR(18)'),
+]
+INDEXES = [
+    # "New pollution near you" lookups of users around a report
+    ('ix_users_geo_cell', 'users', 'geo_cell'),
+    # /api/pollutions?bbox=...: status = 'active' AND geo_cell range
+    ('ix_pollutions_status_geo_cell', 'pollutions', 'status, geo_cell'),
+]
+# See 0001_endpoint_indexes.py, which skips it while geo_cell is missing
+PARTIAL_INDEX = ('ix_pollutions_active_geo_cell', 'pollutions', 'geo_cell', "status = 'active'")
+
+
+def upgrade(conn):
+    add_columns(conn, COLUMNS)
+    for name, table, columns in INDEXES:
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})'))
+    if conn.dialect.name == 'postgresql':
+        name, table, columns, where = PARTIAL_INDEX
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns}) WHERE {where}'))
+
+
+def downgrade(conn):
+    for name in [PARTIAL_INDEX[0]] + [name for name, _, _ in INDEXES]:
+        conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
+    drop_columns(conn, COLUMNS)
@@ -0,0 +1,27 @@
+"""Per-user reported_count, cleaned_count and reports_cleaned_count (see counters.py).
+
+Counts the existing pollutions into them when any of the columns is new.
+"""
+from sqlalchemy import text
+
+from migrations import add_columns, drop_columns
+
+COLUMNS = [
+    ('users', 'reported_count', 'INTEGER DEFAULT 0 NOT NULL'),
+    ('users', 'cleaned_count', 'INTEGER DEFAULT 0 NOT NULL'),
+    ('users', 'reports_cleaned_count', 'INTEGER DEFAULT 0 NOT NULL'),
+]
+
+
+def upgrade(conn):
+    if add_columns(conn, COLUMNS):
+        conn.execute(text(
+            'UPDATE users SET '
+            'reported_count = (SELECT count(*) FROM pollutions p WHERE p.user_id = users.id), '
+            "cleaned_count = (SELECT count(*) FROM pollutions p WHERE p.cleaner_id = users.id AND p.status = 'cleaned'), "
+            "reports_cleaned_count = (SELECT count(*) FROM pollutions p WHERE p.user_id = users.id AND p.status = 'cleaned')"
+        ))
+
+
+def downgrade(conn):
+    drop_columns(conn, COLUMNS)
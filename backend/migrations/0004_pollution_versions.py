@@ -0,0 +1,21 @@
+"""Pollution version for the delta sync API (see changes.py).
+
+Existing rows keep version 0: they are older than any cursor, which clients
+get with a full listing.
+"""
+from sqlalchemy import text
+
+from migrations import add_columns, drop_columns
+
+COLUMNS = [('pollutions', 'version', 'BIGINT DEFAULT 0 NOT NULL')]
+INDEXES = [('ix_pollutions_version', 'pollutions', 'version')]
+
+
+def upgrade(conn):
+    add_columns(conn, COLUMNS)
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_pollutions_version ON pollutions (version)'))
+
+
+def downgrade(conn):
+    conn.execute(text('DROP INDEX IF EXISTS ix_pollutions_version'))
+    drop_columns(conn, COLUMNS)
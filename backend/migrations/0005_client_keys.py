@@ -0,0 +1,18 @@
+"""Idempotency key of submitted reports, unique per user (see reports.py)."""
+from sqlalchemy import text
+
+from migrations import add_columns, drop_columns
+
+COLUMNS = [('pollutions', 'client_key', 'VARCHAR(64)')]
+INDEXES = [('ix_pollutions_user_client_key', 'pollutions', 'user_id, client_key')]
+
+
+def upgrade(conn):
+    add_columns(conn, COLUMNS)
+    conn.execute(text(
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_pollutions_user_client_key ON pollutions (user_id, client_key)'))
+
+
+def downgrade(conn):
+    conn.execute(text('DROP INDEX IF EXISTS ix_pollutions_user_client_key'))
+    drop_columns(conn, COLUMNS)
@@ -0,0 +1,16 @@
+"""When a pollution was cleaned, for the analytics rollups.
+
+Stays NULL for reports cleaned before it; analytics counts those on the day
+of the report.
+"""
+from migrations import add_columns, drop_columns
+
+COLUMNS = [('pollutions', 'cleaned_at', 'TIMESTAMP')]
+
+
+def upgrade(conn):
+    add_columns(conn, COLUMNS)
+
+
+def downgrade(conn):
+    drop_columns(conn, COLUMNS)
@@ -0,0 +1,142 @@
+"""Versioned schema migrations.
+
+Revisions are the numbered modules next to this file (0001_name.py, ...),
+applied in order. Each defines upgrade(conn) and downgrade(conn), gets a
+Connection inside its own transaction and may check conn.dialect.name for
+database-specific DDL. Applied revisions are recorded in schema_migrations.
+
+A revision lists what it owns in COLUMNS [(table, column, ddl)] and INDEXES
+[(name, table, columns)], so migrate_all.py leaves those to upgrade and
+downgrade instead of recreating them from models.py. Columns are added with
+add_columns(), which skips the ones a database already has from
+db.create_all() or from the ALTER pass that predates these revisions.
+
+    flask --app app db-status
+    flask --app app db-upgrade [--to 0002]
+    flask --app app db-downgrade 0001        # 'base' reverts everything
+
+migrate_all.py (run by update_vps.sh) calls upgrade() on every deploy.
+"""
+import importlib.util
+import os
+import re
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from models import db
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+_FILENAME = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+
+class Revision:
+    def __init__(self, revision, name, path):
+        self.revision = revision
+        self.name = name
+        self.path = path
+        self._module = None
+
+    @property
+    def module(self):
+        if self._module is None:
+            spec = importlib.util.spec_from_file_location(f'migrations.r{self.revision}', self.path)
+            self._module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(self._module)
+        return self._module
+
+    @property
+    def description(self):
+        return (self.module.__doc__ or self.name).strip().splitlines()[0]
+
+
+def revisions():
+    found = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = _FILENAME.match(filename)
+        if match:
+            found.append(Revision(match.group(1), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return sorted(found, key=lambda r: r.revision)
+
+
+def add_columns(conn, columns):
+    """Adds the missing ones of (table, column, ddl). Returns the names added."""
+    inspector = inspect(conn)
+    added = []
+    for table, column, ddl in columns:
+        if column not in {c['name'] for c in inspector.get_columns(table)}:
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+            inspector.clear_cache()
+            added.append(column)
+    return added
+
+
+def drop_columns(conn, columns):
+    for table, column, _ in reversed(columns):
+        conn.execute(text(f'ALTER TABLE {table} DROP COLUMN {column}'))
+
+
+def owned():
+    """(table, column) pairs and index names that revisions own."""
+    columns, indexes = set(), set()
+    for rev in revisions():
+        columns.update((table, column) for table, column, _ in getattr(rev.module, 'COLUMNS', ()))
+        indexes.update(name for name, *_ in getattr(rev.module, 'INDEXES', ()))
+    return columns, indexes
+
+
+def _ensure_table(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'revision VARCHAR(32) PRIMARY KEY, applied_at TIMESTAMP NOT NULL)'
+    ))
+
+
+def applied(engine=None):
+    engine = engine or db.engine
+    with engine.begin() as conn:
+        _ensure_table(conn)
+        return {row[0] for row in conn.execute(text('SELECT revision FROM schema_migrations'))}
+
+
+def upgrade(target=None, engine=None):
+    """Applies pending revisions up to target (default: all). Returns the applied ids."""
+    engine = engine or db.engine
+    done = applied(engine)
+    ran = []
+    for rev in revisions():
+        if target is not None and rev.revision > target:
+            break
+        if rev.revision in done:
+            continue
+        print(f"  migration {rev.revision}: {rev.description}")
+        with engine.begin() as conn:
+            rev.module.upgrade(conn)
+            conn.execute(text('INSERT INTO schema_migrations (revision, applied_at) VALUES (:r, :t)'),
+                         {'r': rev.revision, 't': datetime.utcnow()})
+        ran.append(rev.revision)
+    return ran
+
+
+def downgrade(target, engine=None):
+    """Reverts applied revisions newer than target ('base' for all). Returns the reverted ids."""
+    engine = engine or db.engine
+    done = applied(engine)
+    reverted = []
+    for rev in reversed(revisions()):
+        if target != 'base' and rev.revision <= target:
+            break
+        if rev.revision not in done:
+            continue
+        print(f"  revert {rev.revision}: {rev.description}")
+        with engine.begin() as conn:
+            rev.module.downgrade(conn)
+            conn.execute(text('DELETE FROM schema_migrations WHERE revision = :r'), {'r': rev.revision})
+        reverted.append(rev.revision)
+    return reverted
+
+
+def status(engine=None):
+    """List of (revision, description, applied) in order."""
+    done = applied(engine)
+    return [(rev.revision, rev.description, rev.revision in done) for rev in revisions()]
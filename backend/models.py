@@ -1,5 +1,8 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+
+import geo
 
 db = SQLAlchemy()
 
@@ -19,7 +22,19 @@ class User(db.Model):
     lat = db.Column(db.Float, nullable=True)
     lng = db.Column(db.Float, nullable=True)
     last_seen_at = db.Column(db.DateTime, nullable=True)
+    # Quadkey of the last known (lat, lng), kept by heartbeats.py; see nearby.py
+    geo_cell = db.Column(db.String(geo.GEO_CELL_ZOOM))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Denormalized counters, maintained by the write endpoints (see counters.py):
+    # reports made, cleanups done, and own reports that someone cleaned
+    reported_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    cleaned_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    reports_cleaned_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        db.Index('ix_users_balance_desc', balance.desc()),
+        db.Index('ix_users_geo_cell', 'geo_cell'),
+    )
 
     # Relationships
     pollutions = db.relationship('Pollution', backref='author', lazy=True, foreign_keys='Pollution.user_id')
@@ -40,9 +55,41 @@ class Pollution(db.Model):
     cleaner_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     clean_comment = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # When it was cleaned; NULL for reports cleaned before the column existed
+    cleaned_at = db.Column(db.DateTime)
+    # Quadkey of (lat, lng) at geo.GEO_CELL_ZOOM, used as a spatial index
+    geo_cell = db.Column(db.String(geo.GEO_CELL_ZOOM))
+    # Value of the 'pollutions' VersionCounter at the last write, see changes.py
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    # Idempotency key chosen by the client; a retried submission with the same key is a no-op
+    client_key = db.Column(db.String(64))
 
     photos = db.relationship('Photo', backref='pollution', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_pollutions_status_geo_cell', 'status', 'geo_cell'),
+        db.Index('ix_pollutions_version', 'version'),
+        # Endpoint indexes from migrations/0001_endpoint_indexes.py; on
+        # PostgreSQL that revision also adds partial indexes for status='active'
+        db.Index('ix_pollutions_status_created_at', 'status', 'created_at'),
+        db.Index('ix_pollutions_user_created_at', 'user_id', 'created_at'),
+        db.Index('ix_pollutions_cleaner_status_created_at', 'cleaner_id', 'status', 'created_at'),
+        db.Index('ix_pollutions_created_at_id', 'created_at', 'id'),
+        db.Index('ix_pollutions_reward_id', 'reward', 'id'),
+        db.Index('ix_pollutions_level_id', 'level', 'id'),
+        db.Index('ix_pollutions_user_client_key', 'user_id', 'client_key', unique=True),
+    )
+
+
+@event.listens_for(User, 'before_insert')
+@event.listens_for(User, 'before_update')
+@event.listens_for(Pollution, 'before_insert')
+@event.listens_for(Pollution, 'before_update')
+def _set_geo_cell(mapper, connection, target):
+    if target.lat is not None and target.lng is not None:
+        target.geo_cell = geo.quadkey(target.lat, target.lng)
+
+
 class Photo(db.Model):
     __tablename__ = 'photos'
     id = db.Column(db.Integer, primary_key=True)
@@ -51,7 +98,122 @@ class Photo(db.Model):
     type = db.Column(db.String(10), nullable=False)  # 'before', 'after'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_photos_pollution_id', 'pollution_id'),
+    )
+
 class GlobalSetting(db.Model):
     __tablename__ = 'global_settings'
     key = db.Column(db.String(50), primary_key=True)
     value = db.Column(db.String(255), nullable=False)
+
+
+class PollutionCluster(db.Model):
+    """Precomputed grid of active pollutions: one row per quadkey cell and depth.
+
+    Kept up to date incrementally by clustering.record(), see clustering.py.
+    """
+    __tablename__ = 'pollution_clusters'
+    depth = db.Column(db.Integer, primary_key=True)
+    cell = db.Column(db.String(geo.GEO_CELL_ZOOM), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    lat_sum = db.Column(db.Float, nullable=False, default=0.0)
+    lng_sum = db.Column(db.Float, nullable=False, default=0.0)
+    level_1 = db.Column(db.Integer, nullable=False, default=0)
+    level_2 = db.Column(db.Integer, nullable=False, default=0)
+    level_3 = db.Column(db.Integer, nullable=False, default=0)
+
+
+class AnalyticsRollup(db.Model):
+    """Reports, cleanups and cleanup rewards per day or week and dimension.
+
+    Kept up to date incrementally by analytics.record(), see analytics.py.
+    """
+    __tablename__ = 'analytics_rollups'
+    granularity = db.Column(db.String(4), primary_key=True)  # 'day', 'week'
+    dimension = db.Column(db.String(10), primary_key=True)  # 'all', 'level', 'type', 'region'
+    bucket = db.Column(db.Date, primary_key=True)  # first local day of the period
+    metric = db.Column(db.String(10), primary_key=True)  # 'reported', 'cleaned'
+    key = db.Column(db.String(32), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    rewards = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class StatCounter(db.Model):
+    """Running totals behind the stats endpoints, see stats.py."""
+    __tablename__ = 'stat_counters'
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class OutboxMessage(db.Model):
+    """Telegram message waiting to be sent by the notifier worker (notifier.py)."""
+    __tablename__ = 'outbox_messages'
+    id = db.Column(db.Integer, primary_key=True)
+    chat_id = db.Column(db.BigInteger, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    parse_mode = db.Column(db.String(20))
+    disable_preview = db.Column(db.Boolean, nullable=False, default=False)
+    # Optional caller-chosen key; a second enqueue with the same key is a no-op
+    dedupe_key = db.Column(db.String(255), unique=True)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # 'pending', 'sent', 'failed', 'skipped'
+    # Optional category; 'nearby' alerts are throttled and kept out of quiet hours
+    kind = db.Column(db.String(20))
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+        db.Index('ix_outbox_kind_chat_sent', 'kind', 'chat_id', 'sent_at'),
+    )
+
+
+class Broadcast(db.Model):
+    """Admin announcement to all users or a language/geo segment, see broadcasts.py."""
+    __tablename__ = 'broadcasts'
+    id = db.Column(db.Integer, primary_key=True)
+    message = db.Column(db.Text, nullable=False)
+    # Segment; every filter is optional
+    language = db.Column(db.String(10))
+    center_lat = db.Column(db.Float)
+    center_lng = db.Column(db.Float)
+    radius_km = db.Column(db.Float)
+    status = db.Column(db.String(10), nullable=False, default='queued')  # 'queued', 'running', 'done', 'cancelled'
+    # Recipients are processed in users.id order; everything up to this id is done
+    last_user_id = db.Column(db.Integer, nullable=False, default=0)
+    estimated_total = db.Column(db.Integer, nullable=False, default=0)
+    sent = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    # Messages per second over the last processed chunk
+    current_rate = db.Column(db.Float, nullable=False, default=0.0)
+    created_by = db.Column(db.BigInteger)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+
+class NearbyJob(db.Model):
+    """A new report whose nearby users still have to be alerted, see nearby.py."""
+    __tablename__ = 'nearby_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    pollution_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class VersionCounter(db.Model):
+    """Named monotonic counters, incremented with dbutil.increment()."""
+    __tablename__ = 'version_counters'
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class PollutionTombstone(db.Model):
+    """Marks a deleted pollution for delta sync clients, see changes.py."""
+    __tablename__ = 'pollution_tombstones'
+    pollution_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
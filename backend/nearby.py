@@ -0,0 +1,142 @@
+"""'New pollution near you' alerts.
+
+reports.create() schedules a NearbyJob per new report in its own
+transaction; the notifier worker (notifier.py) runs the jobs with a
+NearbyRunner, so reporting never waits for the fan-out.
+
+Users are matched through users.geo_cell, the quadkey of their last known
+position that heartbeats.py updates on every flush. A report's radius is
+covered with a few quadkey ranges (geo.bbox_filter), so matching reads
+only the index entries of the users around it, and the exact distance is
+checked on those rows. Users not seen for NEARBY_SEEN_HOURS and the
+reporter are left out. Alerts go through the outbox as kind 'nearby',
+where the dispatcher throttles them per user and holds them during quiet
+hours (see outbox.py).
+"""
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+
+import geo
+import outbox
+from models import db, User, Pollution, NearbyJob
+
+ENABLED = os.getenv('NEARBY_ALERTS', '1') == '1'
+RADIUS_KM = float(os.getenv('NEARBY_RADIUS_KM', '1.5'))
+SEEN_WITHIN = timedelta(hours=float(os.getenv('NEARBY_SEEN_HOURS', '24')))
+BATCH_SIZE = int(os.getenv('NEARBY_BATCH_SIZE', '20'))
+KIND = 'nearby'
+
+TEXTS = {
+    'uz': "📍 Yaqiningizda ({distance}) yangi ifloslanish belgilandi: {types}.\n\n"
+          "Uni tozalang va {reward} ball oling! Eko-patrulni oching 🌍",
+    'ru': "📍 Рядом с вами ({distance}) отметили новое загрязнение: {types}.\n\n"
+          "Уберите его и получите {reward} баллов! Откройте Экопатруль 🌍",
+    'en': "📍 A new pollution was reported near you ({distance}): {types}.\n\n"
+          "Clean it up and earn {reward} points! Open EcoPatrol 🌍",
+}
+UNITS = {
+    'uz': ('m', 'km'),
+    'ru': ('м', 'км'),
+    'en': ('m', 'km'),
+}
+
+
+log = logging.getLogger('ecopatrol')
+
+
+def schedule(pollution_ids):
+    """Queues the fan-out for new reports in the current transaction."""
+    if not ENABLED or not pollution_ids:
+        return
+    now = datetime.utcnow()
+    db.session.execute(insert(NearbyJob), [{'pollution_id': p_id, 'created_at': now} for p_id in pollution_ids])
+
+
+def match(lat, lng, radius_km=RADIUS_KM, seen_after=None, exclude_user_id=None):
+    """Users within radius_km of the point, as [(row, distance_km)] nearest first.
+
+    Rows have id, telegram_id, language, lat and lng.
+    """
+    bbox = geo.radius_bbox(lat, lng, radius_km)
+    stmt = select(User.id, User.telegram_id, User.language, User.lat, User.lng) \
+        .where(geo.bbox_filter(User.geo_cell, bbox, User.lat, User.lng))
+    if seen_after is not None:
+        stmt = stmt.where(User.last_seen_at >= seen_after)
+    if exclude_user_id is not None:
+        stmt = stmt.where(User.id != exclude_user_id)
+    matched = []
+    for row in db.session.execute(stmt):
+        distance = geo.distance_km(lat, lng, row.lat, row.lng)
+        if distance <= radius_km:
+            matched.append((row, distance))
+    matched.sort(key=lambda item: item[1])
+    return matched
+
+
+def _distance_text(distance_km, language):
+    meters, km = UNITS.get(language, UNITS['ru'])
+    if distance_km < 1:
+        return f'{max(10, round(distance_km * 1000, -1)):.0f} {meters}'
+    return f'{distance_km:.1f} {km}'
+
+
+def message(pollution, distance_km, language):
+    template = TEXTS.get(language) or TEXTS['ru']
+    return template.format(
+        distance=_distance_text(distance_km, language),
+        types=', '.join(pollution.types or []) or '—',
+        reward=f'{pollution.reward or 0:g}',
+    )
+
+
+class NearbyRunner:
+    def __init__(self, radius_km=RADIUS_KM, batch_size=BATCH_SIZE):
+        self.radius_km = radius_km
+        self.batch_size = batch_size
+
+    def _claim(self):
+        query = NearbyJob.query.order_by(NearbyJob.id).limit(self.batch_size)
+        return query.with_for_update(skip_locked=True).all()
+
+    def fan_out(self, pollution):
+        """Queues an alert for every user near the pollution. Returns how many."""
+        users = match(pollution.lat, pollution.lng, self.radius_km,
+                      seen_after=datetime.utcnow() - SEEN_WITHIN, exclude_user_id=pollution.user_id)
+        outbox.enqueue_many([{
+            'chat_id': row.telegram_id,
+            'text': message(pollution, distance, row.language),
+            'dedupe_key': f'{KIND}:{pollution.id}:{row.id}',
+            'kind': KIND,
+        } for row, distance in users])
+        return len(users)
+
+    def run_once(self):
+        """Fans out one batch of new reports. Returns how many jobs were done."""
+        jobs = self._claim()
+        if not jobs:
+            db.session.rollback()
+            return 0
+        pollutions = {p.id: p for p in Pollution.query.filter(
+            Pollution.id.in_([job.pollution_id for job in jobs]))}
+        for job in jobs:
+            p = pollutions.get(job.pollution_id)
+            # Cleaned or deleted before its turn came: nothing to tell anyone
+            if p is not None and p.status == 'active':
+                self.fan_out(p)
+            db.session.delete(job)
+        db.session.commit()
+        return len(jobs)
+
+    def run_forever(self, idle_sleep=1.0):
+        while True:
+            try:
+                if not self.run_once():
+                    time.sleep(idle_sleep)
+            except Exception:
+                db.session.rollback()
+                log.exception("Nearby runner failed")
+                time.sleep(idle_sleep)
@@ -0,0 +1,52 @@
+"""Background worker that delivers queued Telegram messages (see outbox.py),
+runs admin broadcasts (see broadcasts.py) and fans out "new pollution near
+you" alerts (see nearby.py).
+
+Run next to the API: python notifier.py
+"""
+import logging
+import os
+import threading
+
+import telebot
+from telebot import apihelper
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app import app
+from broadcasts import BroadcastRunner
+from nearby import NearbyRunner
+from outbox import Dispatcher, RateLimiter
+
+BOT_TOKEN = os.getenv('BOT_TOKEN', 'YOUR_BOT_TOKEN')
+# Lets the worker talk to a local fake Bot API, e.g. benchmarks/fake_telegram.py
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+log = logging.getLogger('ecopatrol')
+
+
+def create_bot():
+    if TELEGRAM_API_URL:
+        apihelper.API_URL = TELEGRAM_API_URL
+    return telebot.TeleBot(BOT_TOKEN, threaded=False)
+
+
+def run_broadcasts(limiter):
+    with app.app_context():
+        BroadcastRunner(create_bot(), limiter).run_forever()
+
+
+def run_nearby():
+    with app.app_context():
+        NearbyRunner().run_forever()
+
+
+if __name__ == '__main__':
+    log.info("Notifier is starting")
+    # One limiter for both loops keeps the bot under Telegram's global rate
+    limiter = RateLimiter()
+    threading.Thread(target=run_broadcasts, args=(limiter,), daemon=True).start()
+    threading.Thread(target=run_nearby, daemon=True).start()
+    with app.app_context():
+        Dispatcher(create_bot(), limiter).run_forever()
@@ -0,0 +1,245 @@
+"""Persistent outbox for Telegram messages.
+
+API requests only enqueue() a row inside their own transaction; the notifier
+worker (notifier.py) drains the table with a Dispatcher, which batches,
+respects Telegram's rate limits, retries with exponential backoff and gives
+up on permanent errors.
+
+Messages of an unsolicited kind (THROTTLED_KINDS, e.g. 'nearby' alerts from
+nearby.py) get two more rules at send time: during QUIET_HOURS they wait
+until the morning, and a chat gets at most one of them per throttle period;
+the rest are marked 'skipped'.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from telebot.apihelper import ApiTelegramException
+
+from sqlalchemy import func, select
+
+from dbutil import insert_ignore, insert_ignore_many
+from models import db, OutboxMessage
+
+# Telegram allows ~1 message per second to the same chat and ~30 per second
+# overall for a bot.
+PER_CHAT_INTERVAL = float(os.getenv('OUTBOX_PER_CHAT_INTERVAL', '1.0'))
+GLOBAL_RATE = float(os.getenv('OUTBOX_GLOBAL_RATE', '30'))
+BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 3600.0
+
+# Local hours (start-end, may wrap midnight) when unsolicited messages wait;
+# Uzbekistan is UTC+5 all year
+QUIET_HOURS = os.getenv('OUTBOX_QUIET_HOURS', '22-8')
+UTC_OFFSET = timedelta(hours=float(os.getenv('OUTBOX_UTC_OFFSET_HOURS', '5')))
+# kind -> at most one sent message per chat within this period
+THROTTLED_KINDS = {
+    'nearby': timedelta(minutes=float(os.getenv('NEARBY_THROTTLE_MINUTES', '60'))),
+}
+
+# 400 (bad request) and 403 (bot blocked / chat not found) will not get
+# better by retrying
+PERMANENT_ERRORS = (400, 403)
+
+
+log = logging.getLogger('ecopatrol')
+
+
+def _row(chat_id, text, dedupe_key=None, parse_mode=None, disable_preview=False, kind=None):
+    now = datetime.utcnow()
+    return {
+        'chat_id': chat_id,
+        'text': text,
+        'parse_mode': parse_mode,
+        'disable_preview': disable_preview,
+        'dedupe_key': dedupe_key,
+        'kind': kind,
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now,
+    }
+
+
+def enqueue(chat_id, text, dedupe_key=None, parse_mode=None, disable_preview=False, kind=None):
+    """Queues a message in the current transaction. Returns False if dedupe_key was already used."""
+    return insert_ignore(OutboxMessage.__table__,
+                         _row(chat_id, text, dedupe_key, parse_mode, disable_preview, kind), ['dedupe_key'])
+
+
+def enqueue_many(messages):
+    """enqueue() for a list of keyword dicts, in one executemany; used dedupe_keys are skipped."""
+    insert_ignore_many(OutboxMessage.__table__, [_row(**m) for m in messages], ['dedupe_key'])
+
+
+def quiet_until(now):
+    """End of the quiet period (UTC) if now falls into QUIET_HOURS, else None."""
+    if not QUIET_HOURS:
+        return None
+    start, end = (int(h) for h in QUIET_HOURS.split('-'))
+    local = now + UTC_OFFSET
+    hour = local.hour
+    if not (start <= hour < end if start < end else hour >= start or hour < end):
+        return None
+    wake = local.replace(hour=end, minute=0, second=0, microsecond=0)
+    if wake <= local:
+        wake += timedelta(days=1)
+    return wake - UTC_OFFSET
+
+
+def backoff(attempts):
+    return min(BACKOFF_MAX, BACKOFF_BASE ** attempts)
+
+
+class RateLimiter:
+    """Global send slots plus a minimum interval per chat.
+
+    Thread-safe, so the outbox dispatcher and the broadcast sender pool can
+    share one instance and stay under the bot-wide limit together.
+    """
+
+    def __init__(self, global_rate=GLOBAL_RATE, per_chat_interval=PER_CHAT_INTERVAL, clock=time.monotonic):
+        self.min_gap = 1.0 / global_rate if global_rate > 0 else 0.0
+        self.per_chat_interval = per_chat_interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.next_global = 0.0
+        self.next_per_chat = {}
+
+    def chat_wait(self, chat_id):
+        """Seconds until chat_id may get the next message (0.0 if now)."""
+        with self.lock:
+            return max(0.0, self.next_per_chat.get(chat_id, 0.0) - self.clock())
+
+    def acquire(self):
+        """Blocks until the next global send slot."""
+        with self.lock:
+            now = self.clock()
+            slot = max(self.next_global, now)
+            self.next_global = slot + self.min_gap
+        if slot > now:
+            time.sleep(slot - now)
+
+    def sent(self, chat_id, retry_after=None):
+        """Records a send to chat_id; a 429 retry_after pauses the whole bot."""
+        with self.lock:
+            now = self.clock()
+            self.next_per_chat[chat_id] = now + max(self.per_chat_interval, retry_after or 0.0)
+            if retry_after:
+                self.next_global = max(self.next_global, now + retry_after)
+            if len(self.next_per_chat) > 10000:
+                self.next_per_chat = {k: v for k, v in self.next_per_chat.items() if v > now}
+
+
+class Dispatcher:
+    def __init__(self, bot, limiter=None, batch_size=BATCH_SIZE, clock=datetime.utcnow):
+        self.bot = bot
+        self.limiter = limiter or RateLimiter()
+        self.batch_size = batch_size
+        self.clock = clock
+
+    def _claim(self):
+        query = OutboxMessage.query.filter(
+            OutboxMessage.status == 'pending',
+            OutboxMessage.next_attempt_at <= self.clock(),
+        ).order_by(OutboxMessage.next_attempt_at, OutboxMessage.id).limit(self.batch_size)
+        # Lets several dispatchers share the table on PostgreSQL
+        return query.with_for_update(skip_locked=True).all()
+
+    def _send(self, msg):
+        self.bot.send_message(
+            msg.chat_id, msg.text,
+            parse_mode=msg.parse_mode,
+            disable_web_page_preview=msg.disable_preview,
+        )
+
+    def _failed(self, msg, error, retry_after=None, permanent=False):
+        msg.attempts += 1
+        msg.last_error = str(error)[:1000]
+        if permanent or msg.attempts >= MAX_ATTEMPTS:
+            msg.status = 'failed'
+        else:
+            delay = retry_after if retry_after is not None else backoff(msg.attempts)
+            msg.next_attempt_at = self.clock() + timedelta(seconds=delay)
+
+    def _last_sent(self, batch):
+        """{(kind, chat_id): last sent_at} for the throttled messages in batch."""
+        last = {}
+        for kind, period in THROTTLED_KINDS.items():
+            chats = {msg.chat_id for msg in batch if msg.kind == kind}
+            if not chats:
+                continue
+            rows = db.session.execute(
+                select(OutboxMessage.chat_id, func.max(OutboxMessage.sent_at))
+                .where(OutboxMessage.kind == kind, OutboxMessage.chat_id.in_(chats),
+                       OutboxMessage.sent_at >= self.clock() - period)
+                .group_by(OutboxMessage.chat_id)).all()
+            last.update({(kind, chat_id): sent_at for chat_id, sent_at in rows})
+        return last
+
+    def _held(self, msg, last_sent, quiet_end):
+        """Applies quiet hours and throttling to msg; True if it must not be sent now."""
+        period = THROTTLED_KINDS.get(msg.kind)
+        if period is None:
+            return False
+        if quiet_end is not None:
+            msg.next_attempt_at = quiet_end
+            return True
+        sent_at = last_sent.get((msg.kind, msg.chat_id))
+        if sent_at is not None and self.clock() - sent_at < period:
+            msg.status = 'skipped'
+            msg.last_error = 'throttled'
+            return True
+        return False
+
+    def run_once(self):
+        """Sends one batch of due messages. Returns how many were attempted."""
+        batch = self._claim()
+        attempted = 0
+        last_sent = self._last_sent(batch)
+        quiet_end = quiet_until(self.clock())
+        for msg in batch:
+            if self._held(msg, last_sent, quiet_end):
+                continue
+            wait = self.limiter.chat_wait(msg.chat_id)
+            if wait:
+                # Another message to this chat just went out. Move this one
+                # back until the chat is free, or a burst to one chat would
+                # fill every batch and keep other chats waiting behind it
+                msg.next_attempt_at = self.clock() + timedelta(seconds=wait)
+                continue
+            self.limiter.acquire()
+            attempted += 1
+            try:
+                self._send(msg)
+            except ApiTelegramException as e:
+                retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after')
+                self.limiter.sent(msg.chat_id, retry_after=retry_after)
+                self._failed(msg, e, retry_after=retry_after, permanent=e.error_code in PERMANENT_ERRORS)
+                continue
+            except Exception as e:
+                self.limiter.sent(msg.chat_id)
+                self._failed(msg, e)
+                continue
+            self.limiter.sent(msg.chat_id)
+            msg.status = 'sent'
+            msg.attempts += 1
+            msg.sent_at = self.clock()
+            if msg.kind in THROTTLED_KINDS:
+                last_sent[(msg.kind, msg.chat_id)] = msg.sent_at
+        db.session.commit()
+        return attempted
+
+    def run_forever(self, idle_sleep=1.0):
+        while True:
+            try:
+                if not self.run_once():
+                    time.sleep(idle_sleep)
+            except Exception:
+                db.session.rollback()
+                log.exception("Outbox dispatcher failed")
+                time.sleep(idle_sleep)
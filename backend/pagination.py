@@ -0,0 +1,50 @@
+"""Keyset (seek) pagination over a sort column plus the primary key.
+
+The cursor is an opaque url-safe string holding the last row's sort value and
+id, so fetching page N costs the same as page 1 regardless of table size.
+"""
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+def encode_cursor(value, row_id):
+    if isinstance(value, datetime):
+        value = {'dt': value.isoformat()}
+    raw = json.dumps([value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns (value, id); raises ValueError on a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, row_id = json.loads(raw)
+    except Exception as e:
+        raise ValueError('Invalid cursor') from e
+    if isinstance(value, dict) and 'dt' in value:
+        value = datetime.fromisoformat(value['dt'])
+    return value, int(row_id)
+
+
+def clamp_limit(limit):
+    if not limit or limit < 1:
+        return DEFAULT_LIMIT
+    return min(limit, MAX_LIMIT)
+
+
+def seek(query, sort_column, id_column, descending, cursor):
+    """Orders the query by (sort_column, id) and skips past the cursor row."""
+    key = tuple_(sort_column, id_column)
+    if cursor:
+        value, row_id = decode_cursor(cursor)
+        bound = tuple_(value, row_id)
+        query = query.filter(key < bound if descending else key > bound)
+    if descending:
+        return query.order_by(sort_column.desc(), id_column.desc())
+    return query.order_by(sort_column.asc(), id_column.asc())
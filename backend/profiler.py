@@ -0,0 +1,114 @@
+"""Opt-in sampling profiler for slow requests.
+
+    PROFILE_SLOW_MS=0          keep stacks of requests slower than this (0 = off)
+    PROFILE_INTERVAL_MS=5      sampling period
+    PROFILE_DIR=instance/profiles
+    PROFILE_MAX_FILES=200      oldest dumps are deleted beyond this
+
+While on, a daemon thread looks at the stacks of the threads that are
+serving a request every PROFILE_INTERVAL_MS (sys._current_frames, so the
+handlers themselves run untouched). When a request turns out slower than
+the threshold, its samples are written in the collapsed format, one
+"root;...;leaf count" line per distinct stack, which flamegraph.pl,
+speedscope and inferno read directly:
+
+    flamegraph.pl instance/profiles/*.folded > slow.svg
+
+Samples are per OS thread, so this needs sync (or threaded) gunicorn
+workers; under gevent all greenlets of a worker share one thread.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', '0'))
+INTERVAL = float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'profiles'))
+MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '200'))
+
+_lock = threading.Lock()
+_active = {}  # thread id -> Counter of collapsed stacks
+_thread = None
+_thread_pid = None
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})'
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _run():
+    while True:
+        time.sleep(INTERVAL)
+        with _lock:
+            if not _active:
+                continue
+            frames = sys._current_frames()
+            for ident, samples in _active.items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    samples[_collapse(frame)] += 1
+
+
+def _ensure_thread():
+    global _thread, _thread_pid
+    # Started lazily in each gunicorn worker, after the fork
+    if _thread is not None and _thread_pid == os.getpid():
+        return
+    with _lock:
+        if _thread is not None and _thread_pid == os.getpid():
+            return
+        _thread = threading.Thread(target=_run, name='profiler', daemon=True)
+        _thread_pid = os.getpid()
+        _thread.start()
+
+
+def start():
+    """Starts sampling the calling thread; returns a handle for stop(), None when off."""
+    if not SLOW_MS:
+        return None
+    _ensure_thread()
+    samples = Counter()
+    with _lock:
+        _active[threading.get_ident()] = samples
+    return samples
+
+
+def stop(samples, duration, label):
+    """Stops sampling; dumps the stacks if the request took longer than PROFILE_SLOW_MS."""
+    if samples is None:
+        return
+    with _lock:
+        # The request may finish on another thread than it started on
+        for ident, value in list(_active.items()):
+            if value is samples:
+                del _active[ident]
+    if duration * 1000 < SLOW_MS or not samples:
+        return
+    try:
+        _dump(samples, duration, label)
+    except OSError:
+        pass
+
+
+def _dump(samples, duration, label):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = ''.join(c if c.isalnum() else '_' for c in label).strip('_')
+    name = f'{time.strftime("%Y%m%d-%H%M%S")}-{int(duration * 1000)}ms-{slug}-{os.getpid()}.folded'
+    path = os.path.join(PROFILE_DIR, name)
+    with open(path, 'w') as f:
+        for stack, count in samples.most_common():
+            f.write(f'{stack} {count}\n')
+    files = sorted(os.listdir(PROFILE_DIR))
+    for old in files[:-MAX_FILES]:
+        os.remove(os.path.join(PROFILE_DIR, old))
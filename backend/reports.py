@@ -0,0 +1,142 @@
+"""Report submission, one at a time or in bulk, safe to retry.
+
+A report may carry a client_key chosen by the Mini App (a UUID). Keys are
+unique per user (ix_pollutions_user_client_key), so a report sent again
+after a lost response, or synced twice from the offline queue, returns the
+existing pollution instead of creating a second one and paying the
+reporting reward again.
+
+create() writes a whole batch with a fixed number of statements: one lookup
+of the keys already used, a multi-row INSERT of the pollutions and one of
+their photos, and relative UPDATEs of the reporter's balance and counters.
+"""
+import os
+from datetime import datetime
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+import analytics
+import changes
+import clustering
+import counters
+import geo
+import nearby
+import settings_cache
+import stats
+import tiles
+from models import db, Pollution, Photo, User
+
+# Paid to the reporter for every new report
+REPORT_REWARD = 500.0
+MAX_BATCH = int(os.getenv('REPORTS_MAX_BATCH', '50'))
+KEY_LENGTH = 64
+
+
+class InvalidReport(ValueError):
+    pass
+
+
+def validate(data):
+    """Returns the report fields of a request body, raising InvalidReport when they are unusable."""
+    try:
+        lat, lng, level = float(data['lat']), float(data['lng']), int(data['level'])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidReport('lat, lng and level are required')
+    types = data.get('types') or []
+    photos = data.get('photos') or []
+    if not isinstance(types, list) or not isinstance(photos, list):
+        raise InvalidReport('types and photos must be lists')
+    key = data.get('client_key')
+    if key is not None and (not isinstance(key, str) or not 0 < len(key) <= KEY_LENGTH):
+        raise InvalidReport(f'client_key must be a string of up to {KEY_LENGTH} characters')
+    return {
+        'lat': lat, 'lng': lng, 'level': level, 'types': types,
+        'description': data.get('description', ''), 'photos': photos, 'client_key': key,
+    }
+
+
+def _reward(level):
+    # Reward for cleaning it up: from settings, defaulting to the level
+    setting = settings_cache.get(f'reward_level_{level}')
+    return float(setting) if setting else float(level)
+
+
+def create(user_id, items):
+    """Adds validated reports of one user; returns [(pollution id, created)] in order.
+
+    Runs in the caller's transaction. Raises IntegrityError when a concurrent
+    request inserted one of the client keys first.
+    """
+    keys = {item['client_key'] for item in items if item['client_key']}
+    existing = {}
+    if keys:
+        existing = dict(db.session.execute(
+            select(Pollution.client_key, Pollution.id)
+            .where(Pollution.user_id == user_id, Pollution.client_key.in_(keys))).all())
+
+    # Each slot is (existing id, None) or (None, index into new)
+    new, slots, first = [], [], {}
+    for item in items:
+        key = item['client_key']
+        if key in existing:
+            slots.append((existing[key], None))
+        elif key in first:
+            slots.append((None, first[key]))  # sent twice in the same batch
+        else:
+            if key:
+                first[key] = len(new)
+            slots.append((None, len(new)))
+            new.append(item)
+    if not new:
+        return [(p_id, False) for p_id, _ in slots]
+
+    versions = changes.reserve_versions(len(new))
+    now = datetime.utcnow()
+    rows = [{
+        'user_id': user_id, 'lat': item['lat'], 'lng': item['lng'], 'level': item['level'],
+        'types': item['types'], 'description': item['description'], 'status': 'active',
+        'reward': _reward(item['level']), 'geo_cell': geo.quadkey(item['lat'], item['lng']),
+        'version': version, 'client_key': item['client_key'], 'created_at': now,
+    } for item, version in zip(new, versions)]
+    ids = db.session.scalars(insert(Pollution).returning(Pollution.id, sort_by_parameter_order=True), rows).all()
+
+    photos = [{'pollution_id': p_id, 'url': url, 'type': 'before'}
+              for p_id, item in zip(ids, new) for url in item['photos']]
+    if photos:
+        db.session.execute(insert(Photo), photos)
+
+    nearby.schedule(ids)
+    points = [(item['lat'], item['lng'], item['level']) for item in new]
+    clustering.record(points, 1)
+    tiles.touch(points)
+    analytics.record('reported', [(now, row['level'], row['types'], row['geo_cell'], 1, 0.0) for row in rows])
+    paid = REPORT_REWARD * len(new)
+    rewarded = User.query.filter_by(id=user_id) \
+        .update({User.balance: User.balance + paid}, synchronize_session=False)
+    if rewarded:
+        counters.bump(user_id, reported=len(new))
+    stats.bump(active_pollutions=len(new), total_balance=paid if rewarded else 0)
+
+    created = set()
+    results = []
+    for p_id, index in slots:
+        if p_id is None:
+            p_id = ids[index]
+            results.append((p_id, p_id not in created))
+            created.add(p_id)
+        else:
+            results.append((p_id, False))
+    return results
+
+
+def submit(user_id, items):
+    """create() and commit; a key race with a concurrent retry resolves to the winner's report."""
+    try:
+        results = create(user_id, items)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        results = create(user_id, items)
+        db.session.commit()
+    return results
@@ -0,0 +1,46 @@
+"""In-process cache of the global_settings table.
+
+Values are reloaded when the 'settings' signal changes (another worker saved
+settings) or after SETTINGS_CACHE_TTL seconds, whichever comes first, so the
+hot paths (create_pollution, /api/config) normally never touch the DB.
+"""
+import os
+import threading
+import time
+
+import signals
+from models import GlobalSetting
+
+TTL = float(os.getenv('SETTINGS_CACHE_TTL', '60'))
+SIGNAL = 'settings'
+
+_lock = threading.Lock()
+_values = None
+_version = None
+_loaded_at = 0.0
+
+
+def _current():
+    global _values, _version, _loaded_at
+    version = signals.version(SIGNAL)
+    now = time.monotonic()
+    if _values is not None and version == _version and now - _loaded_at < TTL:
+        return _values
+    with _lock:
+        if _values is None or version != _version or now - _loaded_at >= TTL:
+            _values = {s.key: s.value for s in GlobalSetting.query.all()}
+            _version = version
+            _loaded_at = now
+        return _values
+
+
+def get(key, default=None):
+    return _current().get(key, default)
+
+
+def invalidate():
+    """Drops this worker's copy and signals the other workers. Call after commit."""
+    global _values
+    with _lock:
+        _values = None
+    signals.bump(SIGNAL)
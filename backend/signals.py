@@ -0,0 +1,34 @@
+"""Cross-process change signals for in-process caches.
+
+gunicorn runs several workers, so a write handled by one worker has to reach
+the caches of the others. Each named signal is an empty file whose mtime is
+bumped after a committed write; readers compare it with the mtime they saw
+when filling their cache. A stat() is far cheaper than a DB round trip.
+"""
+import os
+import time
+
+SIGNAL_DIR = os.getenv('SIGNAL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'signals'))
+
+
+def _path(name):
+    return os.path.join(SIGNAL_DIR, name)
+
+
+def version(name):
+    """Current version of the signal, 0 if it was never bumped."""
+    try:
+        return os.stat(_path(name)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def bump(name):
+    """Marks the named resource as changed. Call after the DB commit."""
+    path = _path(name)
+    os.makedirs(SIGNAL_DIR, exist_ok=True)
+    # Never move backwards, even if two bumps land within the clock resolution
+    stamp = max(time.time_ns(), version(name) + 1)
+    with open(path, 'a'):
+        os.utime(path, ns=(stamp, stamp))
+    return stamp
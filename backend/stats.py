@@ -0,0 +1,61 @@
+"""Incrementally maintained aggregates for /api/stats/public and /api/admin/stats.
+
+Write endpoints call bump() inside their transaction; the stats endpoints
+read the handful of stat_counters rows instead of scanning users and
+pollutions. reconcile() recomputes the true values to detect (and fix) drift.
+"""
+from dbutil import upsert_add
+from models import db, User, Pollution, StatCounter
+
+COUNTERS = ('total_users', 'active_pollutions', 'cleaned_pollutions', 'total_rewards', 'total_balance')
+# Sums of floats are compared with a tolerance
+DRIFT_TOLERANCE = 1e-6
+
+
+def bump(**deltas):
+    for name, delta in deltas.items():
+        if name not in COUNTERS:
+            raise KeyError(name)
+        if delta:
+            upsert_add(StatCounter.__table__, {'name': name}, {'value': delta})
+
+
+def forget_pollutions(query):
+    """Takes pollutions that are about to be deleted out of the running totals."""
+    rows = query.with_entities(Pollution.status, db.func.count(Pollution.id), db.func.sum(Pollution.reward)) \
+        .group_by(Pollution.status).all()
+    for status, count, rewards in rows:
+        if status == 'active':
+            bump(active_pollutions=-count)
+        elif status == 'cleaned':
+            bump(cleaned_pollutions=-count, total_rewards=-(rewards or 0.0))
+
+
+def snapshot():
+    values = dict.fromkeys(COUNTERS, 0.0)
+    values.update(db.session.query(StatCounter.name, StatCounter.value).all())
+    return values
+
+
+def compute():
+    """The true aggregates, straight from the base tables."""
+    return {
+        'total_users': float(User.query.count()),
+        'active_pollutions': float(Pollution.query.filter_by(status='active').count()),
+        'cleaned_pollutions': float(Pollution.query.filter_by(status='cleaned').count()),
+        'total_rewards': float(db.session.query(db.func.sum(Pollution.reward)).filter_by(status='cleaned').scalar() or 0),
+        'total_balance': float(db.session.query(db.func.sum(User.balance)).scalar() or 0),
+    }
+
+
+def reconcile(fix=True):
+    """Returns {name: (stored, actual)} for drifted counters, resetting them if fix."""
+    actual = compute()
+    stored = snapshot()
+    drift = {name: (stored[name], actual[name]) for name in COUNTERS
+             if abs(stored[name] - actual[name]) > DRIFT_TOLERANCE}
+    if fix and drift:
+        for name in drift:
+            bump(**{name: actual[name] - stored[name]})
+        db.session.commit()
+    return drift
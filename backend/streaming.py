@@ -0,0 +1,111 @@
+"""Streaming JSON responses for large listings.
+
+Rows are pulled from the DB in batches (Query.yield_per, a server-side cursor
+on PostgreSQL) and serialized one by one into ~64 KB chunks, so memory stays
+flat no matter how big the table is and the first byte leaves early. The
+response is a regular JSON array, or NDJSON (one object per line) when the
+client sends ?format=ndjson or Accept: application/x-ndjson.
+"""
+import json
+import time
+
+from flask import Response, request, stream_with_context
+
+import metrics
+from models import db
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+YIELD_PER = 1000
+CHUNK_BYTES = 64 * 1024
+
+
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str).encode()
+
+
+def wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best == 'application/x-ndjson'
+
+
+def _chunks(parts):
+    buffer, size = [], 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= CHUNK_BYTES:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _encode(item, serialize):
+    started = time.perf_counter()
+    data = dumps(serialize(item))
+    metrics.add_serialization(time.perf_counter() - started)
+    return data
+
+
+def _array(items, serialize, head=b'[', tail=lambda: b']'):
+    yield head
+    first = True
+    for item in items:
+        if not first:
+            yield b','
+        first = False
+        yield _encode(item, serialize)
+    yield tail()
+
+
+def _lines(items, serialize):
+    for item in items:
+        yield _encode(item, serialize)
+        yield b'\n'
+
+
+def _released(chunks, session):
+    # The rows are read after the view returned and the request's session
+    # was already removed from the registry; close it here so the connection
+    # goes back to the pool with the last chunk, not when the GC finds it
+    try:
+        yield from chunks
+    finally:
+        session.close()
+
+
+def _response(parts, mimetype):
+    session = db.session()
+    return Response(stream_with_context(_released(_chunks(parts), session)), mimetype=mimetype)
+
+
+def json_list(items, serialize):
+    """Streams serialize(item) for every item as a JSON array (or NDJSON)."""
+    if wants_ndjson():
+        return _response(_lines(items, serialize), 'application/x-ndjson')
+    return _response(_array(items, serialize), 'application/json')
+
+
+def json_page(items, serialize, trailer):
+    """Streams {"items": [...], **trailer()} with trailer evaluated after the last item.
+
+    In NDJSON mode the trailer becomes the last line.
+    """
+    if wants_ndjson():
+        def lines():
+            yield from _lines(items, serialize)
+            yield dumps(trailer())
+            yield b'\n'
+        return _response(lines(), 'application/x-ndjson')
+
+    def tail():
+        extra = dumps(trailer())
+        return b']' + (b',' + extra[1:] if extra != b'{}' else b'}')
+    return _response(_array(items, serialize, head=b'{"items":[', tail=tail), 'application/json')
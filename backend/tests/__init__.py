@@ -0,0 +1 @@
+"""pytest suite for the API. Run from backend/: python -m pytest tests"""
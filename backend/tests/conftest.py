@@ -0,0 +1,35 @@
+import os
+
+import pytest
+from sqlalchemy import MetaData
+
+from benchmarks.common import setup_app
+
+
+@pytest.fixture(scope='session')
+def app():
+    """The app bound to a throwaway database, shared by the whole session.
+
+    SQLite by default; TEST_DATABASE_URL=postgresql://... runs the suite on
+    an (empty) PostgreSQL database instead.
+    """
+    return setup_app(os.getenv('TEST_DATABASE_URL'))
+
+
+@pytest.fixture(scope='module')
+def empty_db(app):
+    """Drops every table (revision ones included) and recreates the models' schema.
+
+    Each module seeds its own data, so the row counts it relies on do not
+    depend on which modules ran before it.
+    """
+    import http_cache
+    from models import db
+
+    with app.app_context():
+        db.session.remove()
+        tables = MetaData()
+        tables.reflect(db.engine)
+        tables.drop_all(db.engine)
+        db.create_all()
+        http_cache.invalidate_all()
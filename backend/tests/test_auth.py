@@ -0,0 +1,94 @@
+"""initData verification, session tokens and /api/init (see auth.py)."""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.common import init_data, seed
+
+TG_ID = 10_000_001
+
+
+@pytest.fixture(scope='module')
+def auth(app, empty_db):
+    import auth
+
+    seed(app, users=5, pollutions=0)
+    return auth
+
+
+def token_user(user_id=1, telegram_id=TG_ID, language='uz'):
+    return SimpleNamespace(id=user_id, telegram_id=telegram_id, language=language)
+
+
+def test_init_data_verified(auth):
+    user = auth.verify_init_data(init_data(TG_ID, username='eco'))
+    assert (user['id'], user['username']) == (TG_ID, 'eco')
+
+
+def test_tampered_init_data_refused(auth):
+    tampered = init_data(TG_ID).replace('10000001', '10000002')
+    with pytest.raises(auth.InvalidInitData, match='signature'):
+        auth.verify_init_data(tampered)
+
+
+def test_expired_init_data_refused(auth):
+    expired = init_data(TG_ID, auth_date=time.time() - auth.INIT_DATA_MAX_AGE - 60)
+    with pytest.raises(auth.InvalidInitData, match='expired'):
+        auth.verify_init_data(expired)
+
+
+def test_foreign_bot_init_data_refused(auth):
+    with pytest.raises(auth.InvalidInitData, match='signature'):
+        auth.verify_init_data(init_data(TG_ID), bot_token='1:other-bot')
+
+
+def test_init_data_without_hash_refused(auth):
+    with pytest.raises(auth.InvalidInitData):
+        auth.verify_init_data(init_data(TG_ID).split('&hash=')[0])
+
+
+def test_token_round_trip(auth):
+    session = auth.parse(auth.issue(token_user()))
+    assert (session.user_id, session.telegram_id, session.role, session.language) == (1, TG_ID, 'user', 'uz')
+    admin = auth.parse(auth.issue(token_user(telegram_id=auth.ADMIN_IDS[0])))
+    assert admin.is_admin
+
+
+def test_forged_token_refused(auth):
+    payload, signature = auth.issue(token_user()).split('.')
+    forged = auth._b64encode(auth._b64decode(payload).replace(b'"u":1', b'"u":2')) + '.' + signature
+    assert auth.parse(forged) is None
+
+
+def test_expired_token_refused(auth):
+    assert auth.parse(auth.issue(token_user(), ttl=-1)) is None
+    now = time.time()
+    token = auth.issue(token_user(), ttl=60, now=now)
+    assert auth.parse(token, now=now + 59) is not None
+    assert auth.parse(token, now=now + 60) is None
+
+
+@pytest.mark.parametrize('token', [None, '', 'abc', 'a.b.c', '!!.!!'])
+def test_malformed_token_refused(auth, token):
+    assert auth.parse(token) is None
+
+
+def test_init_refuses_bad_init_data(app, auth):
+    client = app.test_client()
+    tampered = init_data(TG_ID).replace('10000001', '10000002')
+    assert client.post('/api/init', json={'initData': tampered}).status_code == 401
+    assert client.post('/api/init', json={'telegram_id': TG_ID}).status_code == 401
+
+
+@pytest.mark.parametrize('body', [{}, {'telegram_id': 'abc'}, {'telegram_id': None}, {'telegram_id': [1]}])
+def test_unsigned_init_needs_numeric_telegram_id(app, auth, monkeypatch, body):
+    monkeypatch.setattr(auth, 'ALLOW_UNSIGNED', True)
+    assert app.test_client().post('/api/init', json=body).status_code == 400
+
+
+def test_unsigned_init(app, auth, monkeypatch):
+    monkeypatch.setattr(auth, 'ALLOW_UNSIGNED', True)
+    response = app.test_client().post('/api/init', json={'telegram_id': str(TG_ID)})
+    assert response.status_code == 200
+    assert auth.parse(response.get_json()['token']).telegram_id == TG_ID
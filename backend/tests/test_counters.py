@@ -0,0 +1,35 @@
+"""Per-user counters kept by the write endpoints match a backfill (see counters.py)."""
+import counters
+from benchmarks.common import admin_headers, seed, session_headers
+from models import db, User
+
+
+def snapshot():
+    return {u.id: (u.reported_count, u.cleaned_count, u.reports_cleaned_count) for u in User.query}
+
+
+def test_counters_match_backfill(app, empty_db):
+    seed(app, users=5, pollutions=30, cleaned_share=0.5)
+    with app.app_context():
+        counters.backfill()
+    client = app.test_client()
+    report = {'lat': 41.3, 'lng': 69.24, 'level': 1, 'types': ['plastic'], 'photos': []}
+    p_id = client.post('/api/pollutions', json=report, headers=session_headers(1)).get_json()['id']
+    assert client.post(f'/api/pollutions/{p_id}/clean', json={}, headers=session_headers(2)).status_code == 200
+
+    # cleaned_count is the user's reports cleaned by anyone, cleanups_count the cleanups they did
+    with app.app_context():
+        reporter, cleaner = db.session.get(User, 1), db.session.get(User, 2)
+        expected = ((reporter.reports_cleaned_count, reporter.cleaned_count),
+                    (cleaner.reports_cleaned_count, cleaner.cleaned_count))
+    profiles = [client.get(f'/api/profile/{user_id}').get_json() for user_id in (1, 2)]
+    assert tuple((p['cleaned_count'], p['cleanups_count']) for p in profiles) == expected
+
+    client.delete(f'/api/admin/pollutions/{p_id}', headers=admin_headers())
+    client.delete('/api/admin/pollutions/3', headers=admin_headers())
+    client.delete('/api/admin/users/4', headers=admin_headers())
+
+    with app.app_context():
+        incremental = snapshot()
+        counters.backfill()
+        assert incremental == snapshot()
@@ -0,0 +1,17 @@
+"""Every read endpoint's SELECTs must be served by an index (see benchmarks/explain_check.py)."""
+import pytest
+
+from benchmarks.explain_check import endpoint_urls, prepare, unexpected_scans
+
+
+@pytest.fixture(scope='module')
+def scans(app, empty_db):
+    prepare(app)
+    return unexpected_scans(app)
+
+
+@pytest.mark.parametrize('name', endpoint_urls())
+def test_no_sequential_scan(scans, name):
+    status, bad = scans[name]
+    assert status == 200, f'{name}: HTTP {status}'
+    assert not bad, f'{name}: sequential scan on {", ".join(sorted(bad))}'
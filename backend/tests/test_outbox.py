@@ -0,0 +1,32 @@
+"""Outbox dispatcher scheduling (see outbox.py)."""
+from datetime import datetime
+
+import outbox
+from models import db, OutboxMessage
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(chat_id)
+
+
+def test_burst_to_one_chat_does_not_hold_up_others(app, empty_db):
+    with app.app_context():
+        for i in range(60):
+            outbox.enqueue(1, f'burst {i}')
+        outbox.enqueue(2, 'other chat')
+        db.session.commit()
+
+        bot = RecordingBot()
+        # No global limit; chat 1 stays busy for the whole test
+        dispatcher = outbox.Dispatcher(bot, outbox.RateLimiter(global_rate=0, per_chat_interval=60))
+        for _ in range(3):
+            dispatcher.run_once()
+
+        assert bot.sent == [1, 2]
+        waiting = OutboxMessage.query.filter_by(chat_id=1, status='pending').all()
+        assert len(waiting) == 59
+        assert all(msg.next_attempt_at > datetime.utcnow() for msg in waiting)
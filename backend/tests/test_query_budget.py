@@ -0,0 +1,21 @@
+"""Listing endpoints stay within a fixed statement budget (see benchmarks/query_budget.py)."""
+import pytest
+
+from benchmarks.common import seed
+from benchmarks.query_budget import listing_urls, run_counts
+
+
+@pytest.fixture(scope='module')
+def runs(app, empty_db):
+    seed(app, users=20, pollutions=40, photos_per_pollution=2, cleaned_share=0.2)
+    small = run_counts(app)
+    # Enough active rows for several streaming.YIELD_PER chunks
+    seed(app, users=20, pollutions=2500, photos_per_pollution=2, cleaned_share=0.2, seed_value=7)
+    return {'small': small, 'large': run_counts(app)}
+
+
+@pytest.mark.parametrize('name', listing_urls())
+def test_query_count_within_budget(runs, name):
+    for dataset, counts in runs.items():
+        count, allowed = counts[name]
+        assert count <= allowed, f'{name} on the {dataset} dataset: {count} statements, budget {allowed} (N+1)'
@@ -0,0 +1,249 @@
+"""Mapbox Vector Tiles of active pollutions, served at /api/tiles/<z>/<x>/<y>.pbf.
+
+Each tile has one layer, "pollutions", with a point per active report and
+its level and types (comma-separated) as attributes; the feature id is the
+pollution id. All reports of a tile share the tile's quadkey as geo_cell
+prefix, so reading a tile is a single index range scan.
+
+Tiles are encoded by the pure-Python encoder below. On PostgreSQL with the
+PostGIS extension ST_AsMVT does it inside the database instead
+(TILES_POSTGIS=auto, 0 or 1).
+
+Encoded tiles are kept in TILE_CACHE_DIR/<z>/<x>/<y>.pbf, shared by all
+workers. Writers call touch() with the points they add or remove, next to
+clustering.record(); after the commit the cached tiles containing those
+points, at every zoom, are deleted and rebuilt on the next request.
+"""
+import hashlib
+import math
+import os
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+import geo
+import signals
+from models import db, Pollution
+
+MIN_ZOOM = int(os.getenv('TILES_MIN_ZOOM', '10'))
+MAX_ZOOM = int(os.getenv('TILES_MAX_ZOOM', '16'))
+EXTENT = 4096
+LAYER = 'pollutions'
+TILE_CACHE_DIR = os.getenv('TILE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'tiles'))
+POSTGIS = os.getenv('TILES_POSTGIS', 'auto')
+SIGNAL = 'tiles'
+
+_postgis_available = None
+
+
+# --- Protobuf encoding (vector_tile.proto v2) ---
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field, data):
+    return _key(field, 2) + _varint(len(data)) + data
+
+
+def _uint_field(field, value):
+    return _key(field, 0) + _varint(value)
+
+
+def _packed(field, values):
+    return _bytes_field(field, b''.join(_varint(v) for v in values))
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 31)
+
+
+def _tile_pixel(lat, lng, z, x, y):
+    """Position of the point inside tile (z, x, y), in 0..EXTENT."""
+    n = 1 << z
+    lat = max(-geo.MAX_LAT, min(geo.MAX_LAT, lat))
+    lat_rad = math.radians(lat)
+    px = ((lng + 180.0) / 360.0 * n - x) * EXTENT
+    py = ((1.0 - math.log(math.tan(lat_rad) + 1.0 / math.cos(lat_rad)) / math.pi) / 2.0 * n - y) * EXTENT
+    return int(round(px)), int(round(py))
+
+
+def encode(rows, z, x, y):
+    """rows of (id, lat, lng, level, types) -> one-layer MVT bytes."""
+    keys = ['level', 'types']
+    values, value_index = [], {}
+
+    def value_id(value):
+        if value not in value_index:
+            value_index[value] = len(values)
+            if isinstance(value, int):
+                values.append(_uint_field(5, value))
+            else:
+                values.append(_bytes_field(1, value.encode()))
+        return value_index[value]
+
+    features = []
+    for p_id, lat, lng, level, types in rows:
+        px, py = _tile_pixel(lat, lng, z, x, y)
+        tags = [0, value_id(int(level or 1)), 1, value_id(','.join(types or []))]
+        features.append(_bytes_field(2, b''.join([
+            _uint_field(1, p_id),
+            _packed(2, tags),
+            _uint_field(3, 1),  # POINT
+            _packed(4, [(1 & 0x7) | (1 << 3), _zigzag(px), _zigzag(py)]),  # MoveTo(1)
+        ])))
+    if not features:
+        return b''
+    layer = b''.join([
+        _uint_field(15, 2),
+        _bytes_field(1, LAYER.encode()),
+        *features,
+        *(_bytes_field(3, k.encode()) for k in keys),
+        *(_bytes_field(4, v) for v in values),
+        _uint_field(5, EXTENT),
+    ])
+    return _bytes_field(3, layer)
+
+
+# --- Reading a tile from the database ---
+
+def _range(z, x, y):
+    (start, end), = geo.quadkey_ranges([geo.tile_to_quadkey(x, y, z)])
+    return start, end
+
+
+def _use_postgis():
+    global _postgis_available
+    if POSTGIS == '0' or db.engine.dialect.name != 'postgresql':
+        return False
+    if POSTGIS == '1':
+        return True
+    if _postgis_available is None:
+        _postgis_available = bool(db.session.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'postgis'")).scalar())
+    return _postgis_available
+
+
+def _build_postgis(z, x, y):
+    start, end = _range(z, x, y)
+    upper = 'AND p.geo_cell < :end' if end is not None else ''
+    sql = text(f"""
+        WITH mvt AS (
+            SELECT p.id, p.level,
+                   (SELECT string_agg(t, ',') FROM json_array_elements_text(p.types::json) AS t) AS types,
+                   ST_AsMVTGeom(ST_Transform(ST_SetSRID(ST_MakePoint(p.lng, p.lat), 4326), 3857),
+                                ST_TileEnvelope(:z, :x, :y), {EXTENT}, 0, false) AS geom
+            FROM pollutions p
+            WHERE p.status = 'active' AND p.geo_cell >= :start {upper}
+        )
+        SELECT ST_AsMVT(mvt, '{LAYER}', {EXTENT}, 'geom', 'id') FROM mvt
+    """)
+    data = db.session.execute(sql, {'z': z, 'x': x, 'y': y, 'start': start, 'end': end}).scalar()
+    return bytes(data or b'')
+
+
+def _build_python(z, x, y):
+    start, end = _range(z, x, y)
+    query = db.session.query(Pollution.id, Pollution.lat, Pollution.lng, Pollution.level, Pollution.types) \
+        .filter(Pollution.status == 'active', Pollution.geo_cell >= start)
+    if end is not None:
+        query = query.filter(Pollution.geo_cell < end)
+    return encode(query.order_by(Pollution.id), z, x, y)
+
+
+def build(z, x, y):
+    if _use_postgis():
+        return _build_postgis(z, x, y)
+    return _build_python(z, x, y)
+
+
+# --- Disk cache ---
+
+def _path(z, x, y):
+    return os.path.join(TILE_CACHE_DIR, str(z), str(x), f'{y}.pbf')
+
+
+def etag(stat):
+    return hashlib.sha1(f'{stat.st_mtime_ns}:{stat.st_size}'.encode()).hexdigest()[:24]
+
+
+def cached(z, x, y):
+    """os.stat() of the cached tile, or None."""
+    try:
+        return os.stat(_path(z, x, y))
+    except FileNotFoundError:
+        return None
+
+
+def get(z, x, y):
+    """Returns (data, stat) for the tile, building and caching it when needed."""
+    path = _path(z, x, y)
+    try:
+        with open(path, 'rb') as f:
+            return f.read(), os.fstat(f.fileno())
+    except FileNotFoundError:
+        pass
+    version = signals.version(SIGNAL)
+    data = build(z, x, y)
+    # Skip the write if a report changed while we were reading: the file
+    # could otherwise outlive the invalidation meant to remove it
+    if signals.version(SIGNAL) == version:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return data, os.stat(path)
+    return data, None
+
+
+def keys_for(lat, lng):
+    """(z, x, y) of every cached tile level that contains the point."""
+    return [(z, *geo.tile_xy(lat, lng, z)) for z in range(MIN_ZOOM, MAX_ZOOM + 1)]
+
+
+def touch(points):
+    """Marks tiles containing the (lat, lng, ...) points as stale once the session commits."""
+    stale = db.session.info.setdefault('stale_tiles', set())
+    for lat, lng, *_ in points:
+        stale.update(keys_for(lat, lng))
+
+
+def invalidate(keys):
+    signals.bump(SIGNAL)
+    for z, x, y in keys:
+        try:
+            os.remove(_path(z, x, y))
+        except FileNotFoundError:
+            pass
+
+
+def clear():
+    """Drops every cached tile, e.g. after a deploy or a bulk import."""
+    signals.bump(SIGNAL)
+    if not os.path.isdir(TILE_CACHE_DIR):
+        return
+    for root, _, files in os.walk(TILE_CACHE_DIR):
+        for name in files:
+            os.remove(os.path.join(root, name))
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    keys = session.info.pop('stale_tiles', None)
+    if keys:
+        invalidate(keys)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _after_rollback(session, previous_transaction):
+    session.info.pop('stale_tiles', None)
@@ -0,0 +1,135 @@
+"""Webhook receiver for bot.py.
+
+Telegram POSTs every update to BOT_WEBHOOK_URL; nginx forwards the path to
+this server on 127.0.0.1:BOT_WEBHOOK_PORT. A request is only checked (the
+X-Telegram-Bot-Api-Secret-Token header must match BOT_WEBHOOK_SECRET),
+parsed and queued; the bot's handlers run on a pool of BOT_WORKERS threads,
+so a burst of /start presses is answered in parallel instead of one by one.
+The queue is bounded: with BOT_QUEUE_SIZE updates already waiting the server
+answers 503 and Telegram delivers the update again later.
+
+    curl -X POST -H 'Content-Type: application/json' \\
+         -H 'X-Telegram-Bot-Api-Secret-Token: <secret>' \\
+         --data @update.json http://127.0.0.1:8443/bot-webhook
+"""
+import hmac
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from telebot import types
+
+WEBHOOK_URL = os.getenv('BOT_WEBHOOK_URL', '')
+PORT = int(os.getenv('BOT_WEBHOOK_PORT', '8443'))
+SECRET = os.getenv('BOT_WEBHOOK_SECRET', '')
+WORKERS = int(os.getenv('BOT_WORKERS', '8'))
+QUEUE_SIZE = int(os.getenv('BOT_QUEUE_SIZE', '500'))
+MAX_BODY = 1024 * 1024
+
+log = logging.getLogger('ecopatrol')
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Telegram opens up to max_connections (= WORKERS) at once; leave room
+    request_queue_size = 128
+
+
+def path_of(url):
+    return urlparse(url).path or '/'
+
+
+class Dispatcher:
+    """Runs bot.process_new_updates for single updates on a bounded thread pool."""
+
+    def __init__(self, bot, workers=WORKERS, queue_size=QUEUE_SIZE):
+        self.bot = bot
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bot-updates')
+        # Running plus waiting updates
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.handled = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def submit(self, update):
+        """Queues an update; False when the queue is full."""
+        if not self.slots.acquire(blocking=False):
+            return False
+        self.pool.submit(self._run, update)
+        return True
+
+    def _run(self, update):
+        try:
+            self.bot.process_new_updates([update])
+            with self._lock:
+                self.handled += 1
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            log.warning("bot: update %s failed: %s", update.update_id, e)
+        finally:
+            self.slots.release()
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+class WebhookServer:
+    def __init__(self, bot, path='/bot-webhook', secret=SECRET, host='127.0.0.1', port=PORT,
+                 workers=WORKERS, queue_size=QUEUE_SIZE):
+        self.path = path
+        self.secret = secret
+        self.dispatcher = Dispatcher(bot, workers, queue_size)
+        self.server = _Server((host, port), self._handler())
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def _accept(self, headers, body):
+        """HTTP status for one webhook request."""
+        if self.secret and not hmac.compare_digest(
+                headers.get('X-Telegram-Bot-Api-Secret-Token', ''), self.secret):
+            return 403
+        try:
+            update = types.Update.de_json(json.loads(body))
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return 400
+        return 200 if self.dispatcher.submit(update) else 503
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                if self.path != server.path:
+                    status = 404
+                elif length > MAX_BODY:
+                    status = 413
+                else:
+                    status = server._accept(self.headers, self.rfile.read(length))
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='bot-webhook', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.dispatcher.shutdown()
@@ -33,6 +33,14 @@ function isPointInPolygon(point, polygon) {
 
 let lastValidCenter = [69.2401, 41.2995]
 
+// Listings return thumbnails; the viewer shows the large variant of a
+// locally stored photo, or the Cloudinary original without the resize step
+function largePhotoUrl(url) {
+	if (!url) return url
+	if (url.startsWith('/media/photos/')) return url.replace(/_thumb\.webp$/, '_large.webp')
+	return url.replace(/\/image\/upload\/w_\d+,h_\d+,c_limit,f_auto,q_auto\//, '/image/upload/')
+}
+
 // Viewer Functions (Global)
 window.openPhotoViewer = function (url) {
 	console.log('--- EXECUTING openPhotoViewer ---', url)
@@ -42,7 +50,7 @@ window.openPhotoViewer = function (url) {
 		console.error('VIEWER ELEMENTS NOT FOUND', { viewer: !!viewer, img: !!img })
 		return
 	}
-	img.src = url
+	img.src = largePhotoUrl(url)
 	viewer.classList.add('active')
 	console.log('Viewer should be visible now (added .active)')
 	tg.HapticFeedback.impactOccurred('medium')
@@ -58,6 +66,7 @@ let markers = []
 let pollutionsVisible = true // Track state
 let lastGeolocateTime = 0 // Debounce geolocate
 let currentUser = null
+let sessionToken = null // from /api/init, sent as Authorization: Bearer
 let selectedLevel = 1
 let uploadedPhotos = []
 let currentPollution = null
@@ -150,11 +159,16 @@ window.setLanguage = async function (lang) {
 	// Update Backend if logged in
 	if (currentUser && currentUser.id) {
 		try {
-			await fetch(`${API_URL}/profile/${currentUser.id}/language`, {
-				method: 'POST',
-				headers: { 'Content-Type': 'application/json' },
-				body: JSON.stringify({ language: lang }),
-			})
+			const response = await authFetch(
+				`${API_URL}/profile/${currentUser.id}/language`,
+				{
+					method: 'POST',
+					headers: { 'Content-Type': 'application/json' },
+					body: JSON.stringify({ language: lang }),
+				},
+			)
+			// The session token carries the language; take the reissued one
+			if (response.ok) sessionToken = (await response.json()).token || sessionToken
 		} catch (e) {
 			if (navigator.onLine)
 				console.error('Failed to sync language to backend', e)
@@ -194,6 +208,7 @@ function setupConnectivityListeners() {
 		if (navigator.onLine) {
 			offlineOverlay.classList.add('hidden')
 			console.log('Online: connection restored')
+			syncPendingReports()
 		} else {
 			offlineOverlay.classList.remove('hidden')
 			console.log('Offline: connection lost')
@@ -471,12 +486,11 @@ async function checkLocationStatus() {
 			}
 
 			// Update last known location on server silently
-			if (currentUser && currentUser.telegram_id) {
-				fetch(`${API_URL}/user/location`, {
+			if (currentUser && sessionToken) {
+				authFetch(`${API_URL}/user/location`, {
 					method: 'POST',
 					headers: { 'Content-Type': 'application/json' },
 					body: JSON.stringify({
-						telegram_id: currentUser.telegram_id,
 						lat: position.coords.latitude,
 						lng: position.coords.longitude,
 					}),
@@ -642,6 +656,7 @@ async function handleRegistration() {
 		}
 
 		currentUser = data.user
+		sessionToken = data.token
 
 		localStorage.setItem('registered', 'true')
 		isRegistered = true
@@ -726,8 +741,9 @@ function initMap(initialCenter = null) {
 		map.resize()
 		console.log('Map load triggered')
 
-		// 1. Add Uzbekistan Border
+		// 1. Add Uzbekistan Border and the pollution tile layer
 		addUzbekistanBorder(map)
+		addPollutionTiles(map)
 
 		// 2. Load markers
 		loadPollutions()
@@ -788,6 +804,7 @@ function initMap(initialCenter = null) {
 	map.on('moveend', () => {
 		isDragging = false
 		document.getElementById('center-marker').classList.remove('dragging')
+		scheduleLoadPollutions()
 	})
 
 	// Handle zoom for marker sizing
@@ -846,6 +863,40 @@ function addUzbekistanBorder(map) {
 	}
 }
 
+// Every call that acts as the user sends the session token that /api/init
+// issues after verifying Telegram's signed initData
+async function renewSession() {
+	try {
+		const response = await fetch(`${API_URL}/init`, {
+			method: 'POST',
+			headers: { 'Content-Type': 'application/json' },
+			body: JSON.stringify({
+				telegram_id: currentUser && currentUser.telegram_id,
+				initData: tg.initData,
+			}),
+		})
+		if (!response.ok) return false
+		const data = await response.json()
+		if (!data.token) return false
+		sessionToken = data.token
+		return true
+	} catch (e) {
+		return false
+	}
+}
+
+async function authFetch(url, options = {}) {
+	const send = () =>
+		fetch(url, {
+			...options,
+			headers: { ...options.headers, Authorization: `Bearer ${sessionToken}` },
+		})
+	const response = await send()
+	// The token expired while the app stayed open: verify initData again, retry once
+	if (response.status === 401 && (await renewSession())) return send()
+	return response
+}
+
 async function authUser() {
 	if (currentUser) return // Already authenticated during registration
 
@@ -896,7 +947,9 @@ async function authUser() {
 
 		// User is fully registered
 		currentUser = data.user
+		sessionToken = data.token
 		updateProfileUI()
+		syncPendingReports()
 	} catch (e) {
 		console.error('Auth error:', e)
 	}
@@ -957,6 +1010,11 @@ function applyTheme(theme) {
 				'https://basemaps.cartocdn.com/gl/dark-matter-gl-style/style.json'
 			:	'https://basemaps.cartocdn.com/gl/voyager-gl-style/style.json'
 		map.setStyle(style)
+		// setStyle drops our own sources and layers
+		map.once('style.load', () => {
+			addUzbekistanBorder(map)
+			addPollutionTiles(map)
+		})
 	}
 }
 
@@ -1825,44 +1883,146 @@ function geolocate() {
 	)
 }
 
-async function loadPollutions() {
-	try {
-		console.log('Loading pollutions...')
-		const response = await fetch(`${API_URL}/pollutions`)
-		if (!response.ok) throw new Error('Failed to fetch pollutions')
-		const pollutions = await response.json()
-		console.log('Pollutions loaded:', pollutions)
+// Only the current viewport (plus a margin) is requested from the server
+function getViewportBbox() {
+	const b = map.getBounds()
+	const padLng = (b.getEast() - b.getWest()) * 0.25
+	const padLat = (b.getNorth() - b.getSouth()) * 0.25
+	return [
+		b.getWest() - padLng,
+		b.getSouth() - padLat,
+		b.getEast() + padLng,
+		b.getNorth() + padLat,
+	]
+		.map(v => v.toFixed(5))
+		.join(',')
+}
 
-		markers.forEach(m => m.remove())
-		markers = []
+let reloadPollutionsTimer = null
+function scheduleLoadPollutions() {
+	clearTimeout(reloadPollutionsTimer)
+	reloadPollutionsTimer = setTimeout(loadPollutions, 300)
+}
 
-		pollutions.forEach(p => {
-			const lat = parseFloat(p.lat)
-			const lng = parseFloat(p.lng)
+// Below this zoom the server returns aggregated clusters instead of reports
+const CLUSTER_MAX_ZOOM = 13
 
-			if (isNaN(lat) || isNaN(lng)) {
-				console.warn('Invalid pollution coordinates:', p)
-				return
-			}
+async function loadClusters() {
+	const zoom = map.getZoom()
+	const response = await fetch(
+		`${API_URL}/pollutions/clusters?zoom=${Math.floor(zoom)}&bbox=${getViewportBbox()}`,
+	)
+	if (!response.ok) throw new Error('Failed to fetch clusters')
+	const data = await response.json()
 
-			const el = document.createElement('div')
-			el.className = `pollution-marker level-${p.level || 1}`
+	markers.forEach(m => m.remove())
+	markers = []
 
-			const inner = document.createElement('div')
-			inner.className = 'pollution-marker-inner'
-			el.appendChild(inner)
+	data.clusters.forEach(c => {
+		const el = document.createElement('div')
+		el.className = `pollution-cluster level-${c.max_level || 1}`
+		el.textContent = c.count > 999 ? `${Math.round(c.count / 1000)}k` : c.count
 
-			const marker = new maplibregl.Marker({ element: el })
-				.setLngLat([lng, lat])
-				.addTo(map)
+		const marker = new maplibregl.Marker({ element: el })
+			.setLngLat([c.lng, c.lat])
+			.addTo(map)
 
-			el.addEventListener('click', e => {
-				e.stopPropagation()
-				console.log('Pollution clicked:', p)
-				showPollutionDetails(p)
-			})
-			markers.push(marker)
+		el.addEventListener('click', e => {
+			e.stopPropagation()
+			map.flyTo({ center: [c.lng, c.lat], zoom: Math.max(zoom + 2, CLUSTER_MAX_ZOOM) })
+		})
+		markers.push(marker)
+	})
+}
+
+// Individual reports come as vector tiles (/api/tiles/{z}/{x}/{y}.pbf): only
+// the tiles in view are downloaded, and the server and browser cache them
+const TILE_MAX_ZOOM = 16
+const LEVEL_COLORS = { 1: '#059669', 2: '#fbbf24', 3: '#ef4444' }
+let tileVersion = Date.now()
+let pollutionTileHandlers = false
+
+// Delta sync storage of earlier versions, no longer used
+localStorage.removeItem('pollution_sync')
+
+function pollutionTileUrl() {
+	return `${API_URL}/tiles/{z}/{x}/{y}.pbf?v=${tileVersion}`
+}
+
+function addPollutionTiles(map) {
+	if (!map.getSource('pollution-tiles')) {
+		map.addSource('pollution-tiles', {
+			type: 'vector',
+			tiles: [pollutionTileUrl()],
+			minzoom: CLUSTER_MAX_ZOOM,
+			maxzoom: TILE_MAX_ZOOM,
 		})
+	}
+
+	if (!map.getLayer('pollution-points')) {
+		map.addLayer({
+			id: 'pollution-points',
+			type: 'circle',
+			source: 'pollution-tiles',
+			'source-layer': 'pollutions',
+			minzoom: CLUSTER_MAX_ZOOM,
+			paint: {
+				'circle-radius': 9,
+				'circle-color': [
+					'match',
+					['get', 'level'],
+					2, LEVEL_COLORS[2],
+					3, LEVEL_COLORS[3],
+					LEVEL_COLORS[1],
+				],
+				'circle-stroke-width': 3,
+				'circle-stroke-color': '#ffffff',
+				'circle-opacity': 0.95,
+			},
+		})
+	}
+
+	// Layer event handlers survive setStyle, register them once
+	if (pollutionTileHandlers) return
+	pollutionTileHandlers = true
+	map.on('click', 'pollution-points', async e => {
+		const feature = e.features && e.features[0]
+		if (!feature) return
+		try {
+			const response = await fetch(`${API_URL}/pollutions/${feature.id}`)
+			if (!response.ok) throw new Error('Failed to fetch pollution')
+			const p = await response.json()
+			console.log('Pollution clicked:', p)
+			showPollutionDetails(p)
+		} catch (err) {
+			console.error('Load pollution error:', err)
+		}
+	})
+	map.on('mouseenter', 'pollution-points', () => {
+		map.getCanvas().style.cursor = 'pointer'
+	})
+	map.on('mouseleave', 'pollution-points', () => {
+		map.getCanvas().style.cursor = ''
+	})
+}
+
+// After a report or clean: the server has dropped its cached tiles, make
+// MapLibre fetch them again instead of reusing the ones it holds
+function reloadPollutionTiles() {
+	tileVersion = Date.now()
+	const source = map && map.getSource('pollution-tiles')
+	if (source) source.setTiles([pollutionTileUrl()])
+}
+
+async function loadPollutions() {
+	try {
+		if (map && map.getZoom() < CLUSTER_MAX_ZOOM) {
+			await loadClusters()
+			return
+		}
+		// Close up the tile layer draws the reports; drop the cluster bubbles
+		markers.forEach(m => m.remove())
+		markers = []
 	} catch (e) {
 		if (navigator.onLine) {
 			console.error('Load pollutions error:', e)
@@ -2005,6 +2165,18 @@ function showAddForm() {
 	}
 }
 
+// Photos go to the backend's own store (POST /api/photos). The returned URL
+// is derived from the image content, so uploading the same photo again
+// returns the same URL without storing a copy.
+async function uploadPhoto(file) {
+	const formData = new FormData()
+	formData.append('file', file)
+	const response = await authFetch(`${API_URL}/photos`, { method: 'POST', body: formData })
+	const data = await response.json()
+	if (!response.ok) throw new Error(data.error || 'Upload failed')
+	return data.url
+}
+
 async function handlePhotoUpload(event) {
 	const files = Array.from(event.target.files)
 	if (files.length === 0) return
@@ -2015,21 +2187,7 @@ async function handlePhotoUpload(event) {
 
 	for (const file of files) {
 		try {
-			const formData = new FormData()
-			formData.append('file', file)
-			formData.append('upload_preset', 'ecopatrol')
-
-			const response = await fetch(
-				`https://api.cloudinary.com/v1_1/dxjyi9id6/image/upload`,
-				{ method: 'POST', body: formData },
-			)
-
-			const data = await response.json()
-
-			if (data.error) throw new Error(data.error.message)
-			if (!data.secure_url) throw new Error('No url')
-
-			uploadedPhotos.push(data.secure_url)
+			uploadedPhotos.push(await uploadPhoto(file))
 			tg.HapticFeedback.notificationOccurred('success')
 		} catch (e) {
 			console.error('Upload error:', e)
@@ -2105,22 +2263,36 @@ async function submitPollution(lat, lng, tags = []) {
 			btn.disabled = true
 		}
 
-		const response = await fetch(`${API_URL}/pollutions`, {
-			method: 'POST',
-			headers: { 'Content-Type': 'application/json' },
-			body: JSON.stringify({
-				user_id: currentUser.id,
-				lat,
-				lng,
-				level: selectedLevel,
-				types: tags.length > 0 ? tags : ['trash'], // Fallback if needed, but validation handles it
-				description: desc,
-				photos: uploadedPhotos,
-			}),
-		})
+		const report = {
+			// Lets the server recognise a retry of the same report
+			client_key: newClientKey(),
+			lat,
+			lng,
+			level: selectedLevel,
+			types: tags.length > 0 ? tags : ['trash'], // Fallback if needed, but validation handles it
+			description: desc,
+			photos: uploadedPhotos,
+		}
+
+		let response
+		try {
+			response = await authFetch(`${API_URL}/pollutions`, {
+				method: 'POST',
+				headers: { 'Content-Type': 'application/json' },
+				body: JSON.stringify(report),
+			})
+		} catch (networkError) {
+			// No connection: keep the report and send it with the others later
+			queuePendingReport(report)
+			closeBottomSheet()
+			tg.HapticFeedback.notificationOccurred('warning')
+			tg.showAlert(window.t('submit_queued'))
+			return
+		}
 
 		if (response.ok) {
 			closeBottomSheet()
+			reloadPollutionTiles()
 			loadPollutions()
 			tg.HapticFeedback.notificationOccurred('success')
 			tg.showAlert(window.t('submit_success'))
@@ -2130,6 +2302,70 @@ async function submitPollution(lat, lng, tags = []) {
 	}
 }
 
+// --- Offline report queue ---
+// Reports made without a connection wait in localStorage and are sent in one
+// request to /api/pollutions/batch once the app is online again. Each keeps
+// its client_key, so a sync whose response got lost can simply be repeated:
+// the server returns the already created reports instead of duplicating them.
+const PENDING_REPORTS_KEY = 'pending_reports'
+const PENDING_REPORTS_BATCH = 50
+let pendingSyncInProgress = false
+
+function newClientKey() {
+	if (window.crypto && crypto.randomUUID) return crypto.randomUUID()
+	return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`
+}
+
+function loadPendingReports() {
+	try {
+		return JSON.parse(localStorage.getItem(PENDING_REPORTS_KEY)) || []
+	} catch (e) {
+		return []
+	}
+}
+
+function queuePendingReport(report) {
+	const pending = loadPendingReports()
+	pending.push(report)
+	localStorage.setItem(PENDING_REPORTS_KEY, JSON.stringify(pending))
+}
+
+async function syncPendingReports() {
+	if (pendingSyncInProgress || !currentUser || !navigator.onLine) return
+	let pending = loadPendingReports()
+	if (pending.length === 0) return
+
+	pendingSyncInProgress = true
+	let synced = 0
+	try {
+		while (pending.length > 0) {
+			const batch = pending.slice(0, PENDING_REPORTS_BATCH)
+			const response = await authFetch(`${API_URL}/pollutions/batch`, {
+				method: 'POST',
+				headers: { 'Content-Type': 'application/json' },
+				body: JSON.stringify({ reports: batch }),
+			})
+			if (!response.ok) break
+			const data = await response.json()
+			const done = new Set(data.results.map(r => r.client_key))
+			// Re-read: reports may have been queued while the request was running
+			pending = loadPendingReports().filter(r => !done.has(r.client_key))
+			localStorage.setItem(PENDING_REPORTS_KEY, JSON.stringify(pending))
+			synced += data.results.filter(r => r.created).length
+		}
+	} catch (e) {
+		console.log('Pending reports stay queued:', e)
+	} finally {
+		pendingSyncInProgress = false
+	}
+
+	if (synced > 0) {
+		reloadPollutionTiles()
+		loadPollutions()
+		tg.showAlert(window.t('submit_synced').replace('{count}', synced))
+	}
+}
+
 function showPollutionDetails(pollution) {
 	currentPollution = pollution
 	const content = document.getElementById('sheet-content')
@@ -2261,20 +2497,7 @@ async function handlePhotoUploadAfter(event) {
 
 	for (const file of files) {
 		try {
-			const formData = new FormData()
-			formData.append('file', file)
-			formData.append('upload_preset', 'ecopatrol')
-
-			const response = await fetch(
-				`https://api.cloudinary.com/v1_1/dxjyi9id6/image/upload`,
-				{
-					method: 'POST',
-					body: formData,
-				},
-			)
-
-			const data = await response.json()
-			uploadedPhotos.push(data.secure_url)
+			uploadedPhotos.push(await uploadPhoto(file))
 			updatePhotoPreviewAfter()
 			tg.HapticFeedback.notificationOccurred('success')
 		} catch (e) {
@@ -2309,13 +2532,12 @@ async function submitClean() {
 	const comment = document.getElementById('clean-comment')?.value || ''
 
 	try {
-		const response = await fetch(
+		const response = await authFetch(
 			`${API_URL}/pollutions/${currentPollution.id}/clean`,
 			{
 				method: 'POST',
 				headers: { 'Content-Type': 'application/json' },
 				body: JSON.stringify({
-					user_id: currentUser.id,
 					photos: uploadedPhotos,
 					comment: comment,
 				}),
@@ -2328,6 +2550,7 @@ async function submitClean() {
 			currentUser.balance = data.new_balance
 			updateProfileUI()
 			closeBottomSheet()
+			reloadPollutionTiles()
 			loadPollutions()
 
 			tg.HapticFeedback.notificationOccurred('success')
@@ -2408,7 +2631,7 @@ window.openPhotoViewer = function (url) {
 	const img = document.getElementById('viewer-img')
 	if (!viewer || !img) return
 
-	img.src = url
+	img.src = largePhotoUrl(url)
 	viewer.classList.add('active')
 	tg.HapticFeedback.impactOccurred('medium')
 }
@@ -107,6 +107,8 @@ const translations = {
 		submit_loading: 'Yuborilmoqda...',
 		submit_success: 'Zararlanish qayd etildi!',
 		submit_error: 'Yuborishda xato yuz berdi',
+		submit_queued: 'Internet yoʻq. Xabar saqlandi va aloqa tiklanganda yuboriladi',
+		submit_synced: 'Saqlangan xabarlar yuborildi: {count}',
 		photo_required: 'Iltimos, kamida bitta rasm yuklang (majburiy)',
 		tag_required: 'Zararlanish turini tanlang yoki tavsif qoʻshing',
 		add_level_label: 'Xavf darajasi',
@@ -173,6 +175,17 @@ const translations = {
 		admin_type_not_specified: 'Tur koʻrsatilmagan',
 		admin_label_author: 'Muallif',
 		admin_label_cleaner: 'Tozaladi',
+		admin_filter_all: 'Hammasi',
+		admin_sort_newest: 'Avval yangilari',
+		admin_sort_reward: 'Mukofot bo‘yicha',
+		admin_load_more: 'Yana yuklash',
+		admin_broadcast_title: 'Ommaviy xabar',
+		admin_broadcast_placeholder: 'Barcha foydalanuvchilar uchun xabar matni',
+		admin_broadcast_all_languages: 'Barcha tillar',
+		admin_broadcast_radius: 'Hudud: kenglik, uzunlik, radius (km)',
+		admin_broadcast_send: 'Yuborish',
+		admin_broadcast_cancel: 'Bekor qilish',
+		admin_broadcast_confirm: 'Xabar tanlangan foydalanuvchilarga yuborilsinmi?',
 		admin_delete_confirm:
 			'Haqiqatan ham "{userName}" foydalanuvchisini oʻchirib tashlamoqchimisiz?\n\nBu quyidagilarni butunlay oʻchirib tashlaydi:\n- Foydalanuvchi hisobi\n- Ularning barcha hisobotlari\n- Barcha tegishli rasmlar\n\nUshbu amalni ortga qaytarib boʻlmaydi.',
 	},
@@ -284,6 +297,8 @@ const translations = {
 		submit_loading: 'Отправка...',
 		submit_success: 'Загрязнение отмечено!',
 		submit_error: 'Ошибка при отправке',
+		submit_queued: 'Нет связи. Отметка сохранена и будет отправлена, когда появится интернет',
+		submit_synced: 'Отправлено сохранённых отметок: {count}',
 		photo_required: 'Пожалуйста, загрузите хотя бы одно фото (обязательно)',
 		tag_required: 'Выберите тип загрязнения или добавьте описание',
 		add_level_label: 'Уровень опасности',
@@ -349,6 +364,17 @@ const translations = {
 		admin_type_not_specified: 'Тип не указан',
 		admin_label_author: 'Автор',
 		admin_label_cleaner: 'Убрал',
+		admin_filter_all: 'Все',
+		admin_sort_newest: 'Сначала новые',
+		admin_sort_reward: 'По награде',
+		admin_load_more: 'Загрузить ещё',
+		admin_broadcast_title: 'Рассылка',
+		admin_broadcast_placeholder: 'Текст сообщения для пользователей',
+		admin_broadcast_all_languages: 'Все языки',
+		admin_broadcast_radius: 'Район: широта, долгота, радиус (км)',
+		admin_broadcast_send: 'Отправить',
+		admin_broadcast_cancel: 'Отменить',
+		admin_broadcast_confirm: 'Отправить сообщение выбранным пользователям?',
 		admin_delete_confirm:
 			'Вы уверены, что хотите удалить пользователя "{userName}"?\n\nЭто навсегда удалит:\n- Аккаунт пользователя\n- Все его отчеты о загрязнениях\n- Все связанные фотографии\n\nЭто действие нельзя отменить.',
 	},
@@ -460,6 +486,8 @@ const translations = {
 		submit_loading: 'Sending...',
 		submit_success: 'Pollution marked!',
 		submit_error: 'Error during sending',
+		submit_queued: 'No connection. The report is saved and will be sent once you are back online',
+		submit_synced: 'Saved reports sent: {count}',
 		photo_required: 'Please upload at least one photo (required)',
 		tag_required: 'Select pollution type or add a description',
 		add_level_label: 'Danger Level',
@@ -525,6 +553,17 @@ const translations = {
 		admin_type_not_specified: 'Type not specified',
 		admin_label_author: 'Author',
 		admin_label_cleaner: 'Cleaner',
+		admin_filter_all: 'All',
+		admin_sort_newest: 'Newest first',
+		admin_sort_reward: 'By reward',
+		admin_load_more: 'Load more',
+		admin_broadcast_title: 'Broadcast',
+		admin_broadcast_placeholder: 'Message text for users',
+		admin_broadcast_all_languages: 'All languages',
+		admin_broadcast_radius: 'Area: latitude, longitude, radius (km)',
+		admin_broadcast_send: 'Send',
+		admin_broadcast_cancel: 'Cancel',
+		admin_broadcast_confirm: 'Send the message to the selected users?',
 		admin_delete_confirm:
 			'Are you sure you want to delete user "{userName}"?\n\nThis will permanently delete:\n- User account\n- All their pollution reports\n- All related photos\n\nThis action cannot be undone.',
 	},
@@ -88,10 +88,13 @@ DATABASE_URL=$DATABASE_URL
 MINI_APP_URL=https://$DOMAIN_NAME
 CLOUDINARY_URL=$CLOUDINARY_URL
 PORT=$API_PORT
+BOT_WEBHOOK_URL=https://$DOMAIN_NAME/bot-webhook
+BOT_WEBHOOK_SECRET=$(openssl rand -hex 24)
+BOT_WEBHOOK_PORT=8443
 EOF
 
 echo "🔹 Инициализация таблиц БД..."
-python3 -c "from app import app, db; ctx=app.app_context(); ctx.push(); db.create_all(); ctx.pop()"
+python3 migrate_all.py
 deactivate
 cd ..
 
@@ -99,11 +102,53 @@ cd ..
 echo "🔹 Настройка Nginx для $DOMAIN_NAME..."
 NGINX_CONF="/etc/nginx/sites-available/ecopatrol"
 sudo tee $NGINX_CONF > /dev/null <<EOF
+# Микрокэш для публичных GET: время жизни задаёт бэкенд через X-Accel-Expires,
+# по истечении nginx перепроверяет ответ по ETag (304 без запросов к БД)
+proxy_cache_path /var/cache/nginx/ecopatrol levels=1:2 keys_zone=eco_api:10m max_size=100m inactive=10m;
+
 server {
     listen 80;
     server_name $DOMAIN_NAME;
 
+    location ~ ^/api/(pollutions|leaderboard|stats/public|config)$ {
+        proxy_pass http://127.0.0.1:$API_PORT;
+        proxy_set_header Host \$host;
+        proxy_set_header X-Real-IP \$remote_addr;
+        proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto \$scheme;
+        proxy_cache eco_api;
+        proxy_cache_revalidate on;
+        proxy_cache_lock on;
+        proxy_cache_use_stale updating;
+        add_header X-Cache-Status \$upstream_cache_status;
+    }
+
+    # Метрики Prometheus только для локального сборщика
+    location = /api/metrics {
+        allow 127.0.0.1;
+        deny all;
+        proxy_pass http://127.0.0.1:$API_PORT;
+    }
+
+    # Фото лежат под именем = SHA-256 содержимого и никогда не меняются,
+    # поэтому кэшируются навсегда; ещё не готовые превью делает бэкенд
+    location /media/photos/ {
+        root $PROJECT_ROOT/backend/instance;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+        try_files \$uri @media_backend;
+    }
+
+    location @media_backend {
+        proxy_pass http://127.0.0.1:$API_PORT;
+    }
+
+    # Обновления Telegram для бота (webhook-режим bot.py, см. webhook.py)
+    location = /bot-webhook {
+        proxy_pass http://127.0.0.1:8443;
+    }
+
     location /api {
+        client_max_body_size 12m;
         proxy_pass http://127.0.0.1:$API_PORT;
         proxy_set_header Host \$host;
         proxy_set_header X-Real-IP \$remote_addr;
@@ -138,7 +183,7 @@ After=network.target
 [Service]
 User=$USER
 WorkingDirectory=$PROJECT_ROOT/backend
-ExecStart=$PROJECT_ROOT/backend/venv/bin/gunicorn -w 4 -b 127.0.0.1:$API_PORT app:app
+ExecStart=$PROJECT_ROOT/backend/venv/bin/gunicorn -b 127.0.0.1:$API_PORT app:app
 Restart=always
 
 [Install]
@@ -160,9 +205,73 @@ Restart=always
 WantedBy=multi-user.target
 EOF
 
+# Ежечасная сверка счётчиков статистики с реальными агрегатами
+sudo tee /etc/systemd/system/eco-reconcile.service > /dev/null <<EOF
+[Unit]
+Description=Ecopatrol stats reconciliation
+
+[Service]
+Type=oneshot
+User=$USER
+WorkingDirectory=$PROJECT_ROOT/backend
+ExecStart=$PROJECT_ROOT/backend/venv/bin/flask --app app reconcile-stats
+EOF
+
+sudo tee /etc/systemd/system/eco-reconcile.timer > /dev/null <<EOF
+[Unit]
+Description=Hourly Ecopatrol stats reconciliation
+
+[Timer]
+OnCalendar=hourly
+Persistent=true
+
+[Install]
+WantedBy=timers.target
+EOF
+
+# Ежедневная очистка старых tombstone-записей дельта-синхронизации карты
+sudo tee /etc/systemd/system/eco-compact.service > /dev/null <<EOF
+[Unit]
+Description=Ecopatrol delta sync tombstone compaction
+
+[Service]
+Type=oneshot
+User=$USER
+WorkingDirectory=$PROJECT_ROOT/backend
+ExecStart=$PROJECT_ROOT/backend/venv/bin/flask --app app compact-tombstones
+EOF
+
+sudo tee /etc/systemd/system/eco-compact.timer > /dev/null <<EOF
+[Unit]
+Description=Daily Ecopatrol tombstone compaction
+
+[Timer]
+OnCalendar=daily
+Persistent=true
+
+[Install]
+WantedBy=timers.target
+EOF
+
+sudo tee /etc/systemd/system/eco-notifier.service > /dev/null <<EOF
+[Unit]
+Description=Ecopatrol Telegram Outbox Worker
+After=network.target
+
+[Service]
+User=$USER
+WorkingDirectory=$PROJECT_ROOT/backend
+ExecStart=$PROJECT_ROOT/backend/venv/bin/python notifier.py
+Restart=always
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
 sudo systemctl daemon-reload
-sudo systemctl enable eco-api eco-bot
-sudo systemctl restart eco-api eco-bot
+sudo systemctl enable eco-api eco-bot eco-notifier
+sudo systemctl restart eco-api eco-bot eco-notifier
+sudo systemctl enable --now eco-reconcile.timer eco-compact.timer
 
 echo "🎉 ========================================"
 echo "🎉   УСТАНОВКА ЗАВЕРШЕНА!               "
@@ -37,10 +37,124 @@ echo "🔹 Обновление таблиц в базе данных..."
 python3 migrate_all.py
 deactivate
 
+# Location-блоки nginx, которых нет в конфиге серверов, поставленных старым setup_vps.sh.
+# Сам конфиг не перезаписывается (в нём правки certbot для HTTPS): блок кладётся
+# в /etc/nginx/snippets и подключается include'ом в каждый server { }
+NGINX_CONF="/etc/nginx/sites-available/ecopatrol"
+API_PORT=$(grep -E '^PORT=' $PROJECT_ROOT/backend/.env 2>/dev/null | cut -d= -f2)
+API_PORT=${API_PORT:-5000}
+
+# nginx_snippet <имя> <location, которое уже есть в конфиге свежей установки>; блок — на stdin
+nginx_snippet() {
+    local snippet="/etc/nginx/snippets/ecopatrol-$1.conf"
+    if [ ! -f "$NGINX_CONF" ] || grep -qF "$2" "$NGINX_CONF"; then
+        cat > /dev/null
+        return
+    fi
+    sudo mkdir -p /etc/nginx/snippets
+    sudo tee "$snippet" > /dev/null
+    if ! grep -qF "include $snippet;" "$NGINX_CONF"; then
+        sudo sed -i "/^\s*server_name /a\    include $snippet;" "$NGINX_CONF"
+    fi
+}
+
+echo "🔹 Проверка конфигурации Nginx..."
+# Метрики Prometheus только для локального сборщика
+nginx_snippet metrics "location = /api/metrics" <<EOF
+location = /api/metrics {
+    allow 127.0.0.1;
+    deny all;
+    proxy_pass http://127.0.0.1:$API_PORT;
+}
+EOF
+# Фото отдаются из instance/media/photos и кэшируются навсегда; иначе запрос
+# попадает в location / и вместо картинки приходит index.html
+nginx_snippet media "location /media/photos/" <<EOF
+location /media/photos/ {
+    root $PROJECT_ROOT/backend/instance;
+    add_header Cache-Control "public, max-age=31536000, immutable";
+    try_files \$uri @media_backend;
+}
+
+location @media_backend {
+    proxy_pass http://127.0.0.1:$API_PORT;
+}
+EOF
+sudo nginx -t
+
 # 4. Перезапуск служб
 echo "🔹 Перезапуск фоновых сервисов..."
+# Воркер очереди Telegram-сообщений появился позже setup_vps.sh на старых серверах
+if [ ! -f /etc/systemd/system/eco-notifier.service ]; then
+    sudo tee /etc/systemd/system/eco-notifier.service > /dev/null <<EOF
+[Unit]
+Description=Ecopatrol Telegram Outbox Worker
+After=network.target
+
+[Service]
+User=$USER
+WorkingDirectory=$PROJECT_ROOT/backend
+ExecStart=$PROJECT_ROOT/backend/venv/bin/python notifier.py
+Restart=always
+
+[Install]
+WantedBy=multi-user.target
+EOF
+    sudo systemctl enable eco-notifier
+fi
+# Ежечасная сверка счётчиков статистики с реальными агрегатами
+if [ ! -f /etc/systemd/system/eco-reconcile.timer ]; then
+    sudo tee /etc/systemd/system/eco-reconcile.service > /dev/null <<EOF
+[Unit]
+Description=Ecopatrol stats reconciliation
+
+[Service]
+Type=oneshot
+User=$USER
+WorkingDirectory=$PROJECT_ROOT/backend
+ExecStart=$PROJECT_ROOT/backend/venv/bin/flask --app app reconcile-stats
+EOF
+    sudo tee /etc/systemd/system/eco-reconcile.timer > /dev/null <<EOF
+[Unit]
+Description=Hourly Ecopatrol stats reconciliation
+
+[Timer]
+OnCalendar=hourly
+Persistent=true
+
+[Install]
+WantedBy=timers.target
+EOF
+    sudo systemctl enable eco-reconcile.timer
+fi
+# Таймер очистки tombstone-записей дельта-синхронизации
+if [ ! -f /etc/systemd/system/eco-compact.timer ]; then
+    sudo tee /etc/systemd/system/eco-compact.service > /dev/null <<EOF
+[Unit]
+Description=Ecopatrol delta sync tombstone compaction
+
+[Service]
+Type=oneshot
+User=$USER
+WorkingDirectory=$PROJECT_ROOT/backend
+ExecStart=$PROJECT_ROOT/backend/venv/bin/flask --app app compact-tombstones
+EOF
+    sudo tee /etc/systemd/system/eco-compact.timer > /dev/null <<EOF
+[Unit]
+Description=Daily Ecopatrol tombstone compaction
+
+[Timer]
+OnCalendar=daily
+Persistent=true
+
+[Install]
+WantedBy=timers.target
+EOF
+    sudo systemctl enable eco-compact.timer
+fi
 sudo systemctl daemon-reload
-sudo systemctl restart eco-api eco-bot
+sudo systemctl restart eco-api eco-bot eco-notifier
+sudo systemctl start eco-reconcile.timer eco-compact.timer
 sudo systemctl restart nginx
 
 echo "✅ ========================================"